@@ -0,0 +1,4 @@
+"""
+The app's pages, one module each with a render(seed) function. app.py imports only the page being shown, so the
+plotting and table libraries a page needs are loaded the first time it is opened rather than at start-up.
+"""
@@ -0,0 +1,128 @@
+"""
+The Fund Lump-Sum Analysis page.
+"""
+import pandas as pd
+import streamlit as st
+
+from loan_utils import expected_index_fund_gain
+from perf_utils import span
+from stage_utils import StageGraph
+from app_pages.simulations import (simulate_index_fund_distribution, simulate_invest_vs_repay, student_loan_interest,
+                                   STUDENT_LOAN_PARAMETERS)
+
+# An index fund input only reruns the fund stages and the comparison, not the student loan Monte Carlo
+graph = StageGraph()
+graph.stage('student_loan', reads=STUDENT_LOAN_PARAMETERS)(student_loan_interest)
+
+
+@graph.stage(reads=('lump_sum', 'annual_return_mean', 'investment_horizon'))
+def fund_gain(lump_sum, annual_return_mean, investment_horizon):
+    # The expected gain is exact; the simulated distribution is only needed for the risk figures
+    return expected_index_fund_gain(lump_sum, annual_return_mean, investment_horizon)
+
+
+@graph.stage(reads=('lump_sum', 'annual_return_mean', 'annual_return_std', 'investment_horizon', 'iterations', 'seed'))
+def fund_distribution(lump_sum, annual_return_mean, annual_return_std, investment_horizon, iterations, seed):
+    return simulate_index_fund_distribution(lump_sum, annual_return_mean, annual_return_std, investment_horizon,
+                                            iterations, rng=seed)
+
+
+@graph.stage(reads=('lump_sum', 'initial_loan_balance', 'loan_interest_rate', 'repayment_threshold', 'repayment_rate',
+                    'loan_term_years', 'starting_salary', 'annual_growth_mean', 'annual_growth_std',
+                    'annual_return_mean', 'annual_return_std', 'investment_horizon', 'correlation', 'iterations',
+                    'seed'))
+def invest_vs_repay(lump_sum, initial_loan_balance, loan_interest_rate, repayment_threshold, repayment_rate,
+                    loan_term_years, starting_salary, annual_growth_mean, annual_growth_std, annual_return_mean,
+                    annual_return_std, investment_horizon, correlation, iterations, seed):
+    # Both strategies on the same correlated salary and market paths
+    return simulate_invest_vs_repay(lump_sum, initial_loan_balance, loan_interest_rate, repayment_threshold,
+                                    repayment_rate, loan_term_years, starting_salary, annual_growth_mean,
+                                    annual_growth_std, annual_return_mean, annual_return_std, investment_horizon,
+                                    correlation, iterations, rng=seed)
+
+
+@graph.stage(after=('invest_vs_repay',))
+def fund_is_better(invest_vs_repay):
+    return invest_vs_repay['mean_advantage'] > 0
+
+
+def render(seed):
+    # Streamlit page for Index Fund Analysis
+    st.title("Index Fund Lump-Sum Investment Analysis")
+    st.write("Determine whether a lump sum is best used to invest in an index fund or pay off a student loan.")
+
+    # User Inputs
+    lump_sum = st.number_input("Lump Sum Available (£):", min_value=0, value=50000)
+
+    # Student loan parameters
+    st.subheader("Student Loan Parameters")
+    initial_loan_balance = st.number_input("Student Loan Balance (£):", min_value=0, value=60000)
+    starting_salary = st.number_input("Starting Salary (£):", min_value=0, value=30000)
+    repayment_threshold = st.number_input("Repayment Threshold (£):", min_value=0, value=24990)
+    repayment_rate = st.slider("Repayment Rate (%):", min_value=0.0, max_value=20.0, value=9.0) / 100
+    loan_interest_rate = st.slider("Student Loan Interest Rate (%):", min_value=0.0, max_value=10.0, value=4.3) / 100
+    loan_term_years = st.number_input("Loan Term (Years):", min_value=1, value=25)
+    annual_growth_mean = st.slider("Annual Salary Growth Mean (%):", min_value=-10.0, max_value=10.0, value=3.0) / 100
+    annual_growth_std = st.slider("Annual Growth Std Dev (%):", min_value=0.0, max_value=20.0, value=5.0) / 100
+    iterations = st.number_input("Number of Simulations:", min_value=10, max_value=100000, value=100)
+    target_precision = st.checkbox("Run the student loan until a target precision is reached", value=False)
+    tolerance = None
+    if target_precision:
+        tolerance = st.number_input("Target Standard Error (£):", min_value=1.0, value=50.0)
+
+    # Index fund parameters
+    st.subheader("Index Fund Parameters")
+    annual_return_mean = st.slider("Expected Annual Return (%):", min_value=-10.0, max_value=20.0, value=7.0) / 100
+    annual_return_std = st.slider("Return Volatility (Std Dev, %):", min_value=0.0, max_value=20.0, value=15.0) / 100
+    investment_horizon = st.number_input("Investment Horizon (Years):", min_value=1, value=25)
+    correlation = st.slider("Correlation of Salary Growth with Returns:", min_value=-1.0, max_value=1.0, value=0.3,
+                            help="How closely a year's salary growth follows the market's return, e.g. both falling "
+                                 "in a recession")
+
+    # Simulate results, rerunning only the stages whose inputs changed since the last run
+    parameters = dict(locals())  # Every input above, by name
+    stages = graph.evaluate(['student_loan', 'fund_gain', 'fund_distribution', 'invest_vs_repay', 'fund_is_better'],
+                            parameters, st.session_state.setdefault(__name__, {}))
+    avg_student_loan_interest, student_loan_estimate = stages['student_loan']
+    avg_index_fund_value = stages['fund_gain']
+    index_fund_distribution = stages['fund_distribution']
+    paired = stages['invest_vs_repay']
+
+    # Display Results
+    with span("results"):
+        st.subheader("Results")
+        st.write(f"**Average Interest Paid on Student Loan:** £{avg_student_loan_interest:,.2f}")
+        if target_precision:
+            st.caption(f"95% confidence interval £{student_loan_estimate['ci_low']:,.2f} to "
+                       f"£{student_loan_estimate['ci_high']:,.2f}, from {student_loan_estimate['iterations']:,} "
+                       f"simulations")
+        st.write(f"**Average Future Value of Index Fund Investment:** £{avg_index_fund_value:,.2f}")
+
+        # Spread of the index fund outcome
+        st.subheader("Index Fund Risk")
+        fund_percentiles = index_fund_distribution['percentiles']
+        st.write(f"**Probability of Losing Money:** {index_fund_distribution['probability_of_loss']:.1%}")
+        st.table(pd.DataFrame({
+            'Percentile': [f"{p}th" for p in fund_percentiles],
+            'Gain (£)': [f"£{gain:,.2f}" for gain in fund_percentiles.values()]
+        }).set_index('Percentile'))
+
+        # Both strategies on the same paths
+        st.subheader("Invest or Repay, Path by Path")
+        st.write(f"**Expected Advantage of Investing:** £{paired['mean_advantage']:,.2f} "
+                 f"± £{1.96 * paired['std_error']:,.2f}")
+        st.write(f"**Probability Investing Comes Out Ahead:** {paired['probability_invest_better']:.1%}")
+        st.caption(f"What the amount that would repay the loan grows to in the fund, "
+                   f"£{paired['mean_fund_value']:,.2f} on average, less the repayments repaying it saves on the same "
+                   f"salary path, £{paired['mean_repayments_saved']:,.2f} on average. A loan that would be written "
+                   f"off anyway saves less than the amount put into it.")
+        st.table(pd.DataFrame({
+            'Percentile': [f"{p}th" for p in paired['percentiles']],
+            'Advantage of Investing (£)': [f"£{advantage:,.2f}" for advantage in paired['percentiles'].values()]
+        }).set_index('Percentile'))
+
+        # Comparison
+        if stages['fund_is_better']:
+            st.success("Investing in the index fund provides the best returns.")
+        else:
+            st.success("Using the lump sum to pay off the student loan is more beneficial.")
@@ -0,0 +1,71 @@
+"""
+The Mortgage Lump-Sum Analysis page.
+"""
+import streamlit as st
+
+from perf_utils import span
+from stage_utils import StageGraph
+from app_pages.simulations import simulate_mortgage, student_loan_interest, STUDENT_LOAN_PARAMETERS
+
+# A mortgage input only reruns the mortgage schedule and the comparison, not the student loan Monte Carlo
+graph = StageGraph()
+graph.stage('student_loan', reads=STUDENT_LOAN_PARAMETERS)(student_loan_interest)
+
+
+@graph.stage(reads=('lump_sum', 'mortgage_balance', 'mortgage_interest_rate', 'mortgage_term_years'))
+def mortgage_interest_savings(lump_sum, mortgage_balance, mortgage_interest_rate, mortgage_term_years):
+    return simulate_mortgage(lump_sum, mortgage_balance, mortgage_interest_rate, mortgage_term_years)
+
+
+@graph.stage(after=('student_loan', 'mortgage_interest_savings'))
+def mortgage_is_better(student_loan, mortgage_interest_savings):
+    return mortgage_interest_savings > student_loan[0]
+
+
+def render(seed):
+    st.title("Mortgage Lump-Sum Analysis")
+    st.write("Determine whether a lump sum is best used to pay off a mortgage or a student loan.")
+
+    # User inputs
+    lump_sum = st.number_input("Lump Sum Available (£):", min_value=0, value=50000)
+    mortgage_balance = st.number_input("Mortgage Balance (£):", min_value=0, value=200000)
+    mortgage_interest_rate = st.slider("Mortgage Interest Rate (%):", min_value=1.0, max_value=10.0, value=3.0) / 100
+    mortgage_term_years = st.number_input("Mortgage Term (Years):", min_value=1, value=25)
+
+    # Student loan parameters (user can reuse the settings from the simulation)
+    st.subheader("Student Loan Parameters")
+    initial_loan_balance = st.number_input("Student Loan Balance (£):", min_value=0, value=60000)
+    starting_salary = st.number_input("Starting Salary (£):", min_value=0, value=30000)
+    repayment_threshold = st.number_input("Repayment Threshold (£):", min_value=0, value=24990)
+    repayment_rate = st.slider("Repayment Rate (%):", min_value=0.0, max_value=20.0, value=9.0) / 100
+    loan_interest_rate = st.slider("Student Loan Interest Rate (%):", min_value=0.0, max_value=10.0, value=4.3) / 100
+    loan_term_years = st.number_input("Loan Term (Years):", min_value=1, value=25)
+    annual_growth_mean = st.slider("Annual Salary Growth Mean (%):", min_value=-10.0, max_value=10.0, value=3.0) / 100
+    annual_growth_std = st.slider("Annual Growth Std Dev (%):", min_value=0.0, max_value=20.0, value=5.0) / 100
+    iterations = st.number_input("Number of Simulations:", min_value=10, max_value=100000, value=100)
+    target_precision = st.checkbox("Run the student loan until a target precision is reached", value=False)
+    tolerance = None
+    if target_precision:
+        tolerance = st.number_input("Target Standard Error (£):", min_value=1.0, value=50.0)
+
+    # Simulate interest paid on the student loan and the interest saved on the mortgage, rerunning only the stages
+    # whose inputs changed since the last run
+    parameters = dict(locals())  # Every input above, by name
+    stages = graph.evaluate(['mortgage_is_better'], parameters, st.session_state.setdefault(__name__, {}))
+    avg_student_loan_interest, student_loan_estimate = stages['student_loan']
+    mortgage_interest_savings = stages['mortgage_interest_savings']
+
+    # Display results
+    with span("results"):
+        st.subheader("Results")
+        st.write(f"**Average Interest Paid on Student Loan:** £{avg_student_loan_interest:,.2f}")
+        if target_precision:
+            st.caption(f"95% confidence interval £{student_loan_estimate['ci_low']:,.2f} to "
+                       f"£{student_loan_estimate['ci_high']:,.2f}, from {student_loan_estimate['iterations']:,} "
+                       f"simulations")
+        st.write(f"**Interest Saved on Mortgage with Lump Sum:** £{mortgage_interest_savings:,.2f}")
+
+        if stages['mortgage_is_better']:
+            st.success("Using the lump sum to pay off the mortgage is more beneficial.")
+        else:
+            st.success("Using the lump sum to pay off the student loan is more beneficial.")
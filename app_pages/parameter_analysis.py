@@ -0,0 +1,203 @@
+"""
+The Parameter Analysis page.
+"""
+import numpy as np
+import streamlit as st
+from matplotlib import pyplot as plt
+
+from perf_utils import span
+from plot_utils import figure_png
+from stage_utils import StageGraph
+from app_pages.simulations import simulate_parameter_grid, break_even_mortgage_rates
+
+# Parameter ranges
+PARAM_RANGES = {
+    'starting_salary': np.linspace(30000, 120000, 10),
+    'student_loan_rate': np.linspace(0.02, 0.08, 10),
+    'mortgage_rate': np.linspace(0.02, 0.08, 10),
+}
+
+# Salaries drawn as heatmaps, and the grid salary each one shows
+SALARY_SAMPLES = np.quantile(PARAM_RANGES['starting_salary'], [0.2, 0.4, 0.6, 0.8])
+HEATMAP_SALARIES = [PARAM_RANGES['starting_salary'][np.abs(PARAM_RANGES['starting_salary'] - salary).argmin()]
+                    for salary in SALARY_SAMPLES]
+
+# Every input feeds the grid, so the graph saves redrawing the heatmaps on reruns that change nothing on this page
+graph = StageGraph()
+
+
+@graph.stage(reads=('lump_sum_input', 'mortgage_loan_term', 'sl_loan_term', 'sl_loan_rate', 'initial_sl_balance',
+                    'repayment_threshold', 'annual_growth_mean', 'annual_growth_std', 'iterations',
+                    'mortgage_balance', 'common_random_numbers', 'seed'))
+def grid(lump_sum_input, mortgage_loan_term, sl_loan_term, sl_loan_rate, initial_sl_balance, repayment_threshold,
+         annual_growth_mean, annual_growth_std, iterations, mortgage_balance, common_random_numbers, seed):
+    return simulate_parameter_grid(
+        salaries=PARAM_RANGES['starting_salary'],
+        student_loan_rates=PARAM_RANGES['student_loan_rate'],
+        mortgage_rates=PARAM_RANGES['mortgage_rate'],
+        initial_balance=initial_sl_balance,
+        repayment_threshold=repayment_threshold,
+        repayment_rate=sl_loan_rate / 100,
+        loan_term_years=sl_loan_term,
+        annual_growth_mean=annual_growth_mean,
+        annual_growth_std=annual_growth_std,
+        iterations=iterations,
+        lump_sum=lump_sum_input,
+        mortgage_balance=mortgage_balance,
+        mortgage_years=mortgage_loan_term,
+        seed=seed,
+        common_random_numbers=common_random_numbers
+    )
+
+
+@graph.stage(reads=('lump_sum_input', 'mortgage_loan_term', 'sl_loan_term', 'sl_loan_rate', 'initial_sl_balance',
+                    'repayment_threshold', 'annual_growth_mean', 'annual_growth_std', 'iterations',
+                    'mortgage_balance', 'seed'))
+def break_even(lump_sum_input, mortgage_loan_term, sl_loan_term, sl_loan_rate, initial_sl_balance,
+               repayment_threshold, annual_growth_mean, annual_growth_std, iterations, mortgage_balance, seed):
+    # Solve each heatmap's decision boundary directly, refining the student loan rates where it bends
+    step = PARAM_RANGES['student_loan_rate'][1] - PARAM_RANGES['student_loan_rate'][0]
+    return [break_even_mortgage_rates(
+        salary=salary,
+        student_loan_rates=PARAM_RANGES['student_loan_rate'],
+        initial_balance=initial_sl_balance,
+        repayment_threshold=repayment_threshold,
+        repayment_rate=sl_loan_rate / 100,
+        loan_term_years=sl_loan_term,
+        annual_growth_mean=annual_growth_mean,
+        annual_growth_std=annual_growth_std,
+        iterations=iterations,
+        lump_sum=lump_sum_input,
+        mortgage_balance=mortgage_balance,
+        mortgage_years=mortgage_loan_term,
+        mortgage_rate_bounds=(PARAM_RANGES['mortgage_rate'][0], PARAM_RANGES['mortgage_rate'][-1]),
+        refine_resolution=step / 4,
+        rng=seed
+    ) for salary in HEATMAP_SALARIES]
+
+
+@graph.stage(reads=('annual_growth_mean', 'iterations'), after=('grid', 'break_even'))
+def heatmaps(annual_growth_mean, iterations, grid, break_even):
+    df = grid
+
+    # Create heatmap for each salary level
+    fig, axes = plt.subplots(2, 2, figsize=(15, 15))
+    axes = axes.flatten()
+
+    # Find global min and max for consistent color scaling
+    vmin = df['difference'].min()
+    vmax = df['difference'].max()
+
+    for idx, salary in enumerate(SALARY_SAMPLES):
+        salary_data = df[np.isclose(df['salary'], salary, atol=5000)]
+
+        # Use pivot_table with aggregation to handle duplicates
+        with span("heatmaps: pivot_table"):
+            pivot = salary_data.pivot_table(
+                index='student_loan_rate',
+                columns='mortgage_rate',
+                values='difference',
+                aggfunc='mean'  # Aggregating by mean to handle duplicates
+            )
+
+        with span("heatmaps: imshow"):
+            axes[idx].imshow(pivot, cmap='RdYlBu', aspect='auto', vmin=vmin, vmax=vmax)
+        axes[idx].set_title(f'Salary: £{salary:,.0f}, Lump Sum: £{salary_data["lump_sum"].iloc[0]:,.0f}')
+        axes[idx].set_xlabel('Mortgage Rate (%)')
+        axes[idx].set_ylabel('Student Loan Rate (%)')
+
+        # Add decision boundary line, from the solver rather than contoured between cells, in the heatmap's cell
+        # index coordinates
+        with span("heatmaps: decision boundary"):
+            boundary = break_even[idx]
+            crosses = np.isfinite(boundary['break_even_rate'])
+            axes[idx].plot(_cell_index(boundary['break_even_rate'][crosses], PARAM_RANGES['mortgage_rate']),
+                           _cell_index(boundary['student_loan_rate'][crosses], PARAM_RANGES['student_loan_rate']),
+                           color='black', linestyle='dashed')
+
+        # Adjust annotation positions
+        ax = axes[idx]
+        ax.annotate(f"Salary Growth Avg: {annual_growth_mean * 100:,.1f}%", xy=(0.02, 0.95), xycoords='axes fraction',
+                    ha='left', va='top',
+                    fontsize=10, color='black')
+        ax.annotate(f"Iterations: {iterations}", xy=(0.02, 0.85), xycoords='axes fraction', ha='left',
+                    va='top', fontsize=10, color='black')
+
+    with span("heatmaps: tight_layout"):
+        plt.tight_layout()
+    with span("heatmaps: savefig"):
+        return figure_png(fig)
+
+
+def _cell_index(values, cells):
+    # Position of values along evenly spaced cells, in the units imshow places cell centres at
+    return (values - cells[0]) / (cells[1] - cells[0])
+
+
+@graph.stage(after=('break_even',))
+def break_even_table(break_even):
+    import pandas as pd
+
+    def label(rate):
+        if rate == -np.inf:
+            return f"< {PARAM_RANGES['mortgage_rate'][0] * 100:.1f}%"
+        if rate == np.inf:
+            return f"> {PARAM_RANGES['mortgage_rate'][-1] * 100:.1f}%"
+        return f"{rate * 100:.2f}%"
+
+    # The solved boundary at the heatmap rows, leaving out the rates added to refine it
+    columns = {}
+    for salary, boundary in zip(HEATMAP_SALARIES, break_even):
+        rows = np.isin(boundary['student_loan_rate'], PARAM_RANGES['student_loan_rate'])
+        columns[f"£{salary:,.0f}"] = [label(rate) for rate in boundary['break_even_rate'][rows]]
+    return pd.DataFrame(columns, index=pd.Index([f"{rate * 100:.1f}%" for rate in PARAM_RANGES['student_loan_rate']],
+                                                name='Student Loan Rate'))
+
+
+@graph.stage(after=('grid',))
+def key_findings(grid):
+    findings = []
+    for label, row in (("student loan", grid.nlargest(1, 'difference')), ("mortgage", grid.nsmallest(1, 'difference'))):
+        findings.append(f"Most favorable for {label}: Salary £{row['salary'].iloc[0]:,.0f}, "
+                        f"SL Rate {row['student_loan_rate'].iloc[0]:.1f}%, "
+                        f"Mortgage Rate {row['mortgage_rate'].iloc[0]:.1f}%, "
+                        f"Lump Sum £{row['lump_sum'].iloc[0]:,.0f}")
+    return findings
+
+
+def render(seed):
+    st.title("Monte Carlo Parameter Analysis")
+
+    # Allow the user to input the lump sum value
+    lump_sum_input = st.number_input("Enter the lump sum amount for mortgage", min_value=0, max_value=100000, step=5000,
+                                     value=50000)
+    mortgage_loan_term = st.slider("Enter the mortgage loan term", min_value=0, max_value=40, value=25)
+    sl_loan_term = st.slider("Enter the student loan term", min_value=0, max_value=40, value=25)
+    sl_loan_rate = st.slider("Enter the student loan repayment rate %", min_value=0, max_value=20, value=9)
+    initial_sl_balance = st.slider("Initial student loan balance", min_value=0, max_value=100000, value=60000)
+    repayment_threshold = st.slider("Student loan repayment_threshold", min_value=0, max_value=100000, value=24990)
+    annual_growth_mean = 0.03
+    annual_growth_std = 0.05
+    iterations = 100
+    mortgage_balance = st.slider("Initial Mortgage Balance", min_value=0, max_value=2000000, value=450000)
+    common_random_numbers = st.checkbox("Use the same salary paths for every cell (common random numbers)", value=True)
+
+    # Run simulations and draw the heatmaps, rerunning only the stages whose inputs changed since the last run
+    parameters = dict(locals())  # Every input above, by name
+    stages = graph.evaluate(['heatmaps', 'break_even_table', 'key_findings'], parameters,
+                            st.session_state.setdefault(__name__, {}))
+
+    with span("heatmaps: st.image"):
+        st.image(stages['heatmaps'])
+
+    st.write("Blue regions indicate paying off student loan is better")
+    st.write("Red regions indicate paying off mortgage is better")
+    st.write("Dotted line indicates decision boundary line")
+
+    st.subheader("Break-even Mortgage Rates")
+    st.write("The mortgage rate above which paying off the mortgage is better, solved for each student loan rate")
+    st.dataframe(stages['break_even_table'])
+    # Show key patterns
+    st.subheader("Key Findings")
+    for finding in stages['key_findings']:
+        st.write(finding)
@@ -0,0 +1,100 @@
+"""
+The simulations behind the app's pages, shared so that every page's calls go through the same memo cache.
+"""
+import functools
+import os
+
+import numpy as np
+
+from loan_utils import (simulate_mortgage, simulate_index_fund_distribution, estimate_student_loan_interest,
+                        break_even_mortgage_rates, student_loan_sensitivities, simulate_invest_vs_repay)
+from parallel_utils import parallel_simulate_student_loan, parallel_life_event_stats, parallel_parameter_grid
+from cache_utils import simulation_cache
+from perf_utils import instrument, span
+from surrogate import SurrogateTable
+
+# Memoise the simulations so reruns with unchanged parameters reuse earlier results, and count the paths and random
+# draws each call simulates for the Performance panel
+simulate_student_loan = instrument(
+    simulation_cache.memoize(parallel_simulate_student_loan), "student loan",
+    lambda args, result: (args['iterations'], args['iterations'] * args['loan_term_years']), simulation_cache)
+simulate_mortgage = instrument(simulation_cache.memoize(simulate_mortgage), "mortgage",
+                               lambda args, result: (np.size(result), 0), simulation_cache)
+simulate_life_event_stats = instrument(
+    simulation_cache.memoize(parallel_life_event_stats), "life events",
+    # Growth rate per path, then event occurrence and type per path-year
+    lambda args, result: (len(args['salaries']) * args['iterations'],
+                          len(args['salaries']) * args['iterations'] * (1 + 2 * args['loan_term_years'])),
+    simulation_cache)
+simulate_parameter_grid = instrument(
+    simulation_cache.memoize(parallel_parameter_grid), "parameter grid",
+    # Each salary draws one shock matrix, or one per student loan rate without common random numbers
+    lambda args, result: (len(args['salaries']) * len(args['student_loan_rates']) * args['iterations'],
+                          len(args['salaries']) * args['iterations'] * args['loan_term_years']
+                          * (1 if args['common_random_numbers'] else len(args['student_loan_rates']))),
+    simulation_cache)
+simulate_index_fund_distribution = instrument(
+    simulation_cache.memoize(simulate_index_fund_distribution), "index fund",
+    lambda args, result: (args['iterations'], args['iterations'] * args['years']), simulation_cache)
+estimate_student_loan_interest = instrument(
+    simulation_cache.memoize(estimate_student_loan_interest), "student loan (target precision)",
+    lambda args, result: (result['iterations'], result['iterations'] * args['loan_term_years']), simulation_cache)
+break_even_mortgage_rates = instrument(
+    simulation_cache.memoize(break_even_mortgage_rates), "break-even solver",
+    # Every student loan rate shares one shock matrix
+    lambda args, result: (result['paths'], args['iterations'] * args['loan_term_years']), simulation_cache)
+simulate_invest_vs_repay = instrument(
+    simulation_cache.memoize(simulate_invest_vs_repay), "invest vs repay",
+    # A correlated salary growth and market return per path-year
+    lambda args, result: (args['iterations'], 2 * args['iterations'] * max(args['loan_term_years'],
+                                                                           args['investment_horizon'])),
+    simulation_cache)
+student_loan_sensitivities = instrument(
+    simulation_cache.memoize(student_loan_sensitivities), "sensitivity",
+    # Every scenario shares one shock matrix
+    lambda args, result: (result['paths'], args['iterations'] * args['loan_term_years']), simulation_cache)
+
+# Parameters read by student_loan_interest, which the lump-sum pages share as a stage
+STUDENT_LOAN_PARAMETERS = ('initial_loan_balance', 'loan_interest_rate', 'repayment_threshold', 'repayment_rate',
+                           'loan_term_years', 'starting_salary', 'annual_growth_mean', 'annual_growth_std',
+                           'iterations', 'tolerance', 'seed')
+
+
+@functools.lru_cache(maxsize=None)
+def surrogate_table():
+    """
+    The precomputed table named by LOANCARLO_SURROGATE, loaded once per process, or None if it is not set.
+    """
+    directory = os.environ.get('LOANCARLO_SURROGATE')
+    return SurrogateTable(directory) if directory else None
+
+
+def student_loan_interest(initial_loan_balance, loan_interest_rate, repayment_threshold, repayment_rate,
+                          loan_term_years, starting_salary, annual_growth_mean, annual_growth_std, iterations,
+                          tolerance, seed):
+    """
+    Average interest paid on the student loan, simulated until the target standard error if tolerance is given and
+    otherwise over a fixed number of iterations. Without a tolerance, a point covered by the surrogate table is looked
+    up there instead, with the table's own iterations and seed.
+
+    Returns:
+        average (float): The average interest paid.
+        estimate (dict): The estimate_student_loan_interest result, or None without a tolerance.
+    """
+    if tolerance is not None:
+        estimate = estimate_student_loan_interest(initial_loan_balance, loan_interest_rate, repayment_threshold,
+                                                  repayment_rate, loan_term_years, starting_salary,
+                                                  annual_growth_mean, annual_growth_std, tolerance, rng=seed)
+        return estimate['estimate'], estimate
+    table = surrogate_table()
+    if table is not None:
+        with span("surrogate lookup"):
+            outcomes = table.interpolate(initial_balance=initial_loan_balance, interest_rate=loan_interest_rate,
+                                         repayment_threshold=repayment_threshold, repayment_rate=repayment_rate,
+                                         loan_term_years=loan_term_years, salary=starting_salary,
+                                         annual_growth_mean=annual_growth_mean, annual_growth_std=annual_growth_std)
+        if outcomes is not None:
+            return outcomes['interest_paid'], None
+    return simulate_student_loan(initial_loan_balance, loan_interest_rate, repayment_threshold, repayment_rate,
+                                 loan_term_years, starting_salary, annual_growth_mean, annual_growth_std, iterations,
+                                 seed=seed), None
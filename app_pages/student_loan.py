@@ -0,0 +1,384 @@
+"""
+The Student Loan Simulation page.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from matplotlib import pyplot as plt
+
+from job_utils import BackgroundJob
+from loan_utils import format_life_event, LIFE_EVENT_NAMES
+from parallel_utils import iter_life_event_stats, DEFAULT_CHUNK_SIZE
+from plot_utils import plot_fan_chart, figure_png, FAN_PERCENTILES
+from perf_utils import span
+from stage_utils import StageGraph
+from app_pages.simulations import simulate_life_event_stats, student_loan_sensitivities
+
+# Runs with more than one chunk per salary go to a background job, which shows partial results after every chunk
+BACKGROUND_ITERATIONS = DEFAULT_CHUNK_SIZE
+PROGRESS_INTERVAL = 0.25  # Seconds between progress updates
+
+# How each input of the sensitivity analysis is described, with the step loan_utils.SENSITIVITY_STEPS moves it by
+SENSITIVITY_LABELS = {
+    'initial_balance': ("Initial loan balance", "+£1,000"),
+    'interest_rate': ("Interest rate", "+1 point"),
+    'repayment_threshold': ("Repayment threshold", "+£1,000"),
+    'repayment_rate': ("Repayment rate", "+1 point"),
+    'salary': ("Starting salary", "+£1,000"),
+    'annual_growth_mean': ("Average salary growth", "+1 point"),
+    'annual_growth_std': ("Salary growth std dev", "+1 point"),
+}
+
+# The deterministic trajectory and the Monte Carlo stages read different inputs, so, for example, toggling a life
+# event does not recompute the trajectory and changing your own salary does not redraw the fan charts
+graph = StageGraph()
+
+
+# Deterministic repayment calculation
+@graph.stage(name='trajectory', reads=('initial_loan_balance', 'starting_salary', 'repayment_threshold',
+                                       'repayment_rate', 'interest_rate', 'annual_growth_mean', 'loan_term_years'))
+def calculate_repayment_trajectory(initial_loan_balance, starting_salary, repayment_threshold, repayment_rate,
+                                   interest_rate, annual_growth_mean, loan_term_years):
+    balance = initial_loan_balance
+    salary = starting_salary
+    loan_trajectory = []
+    salary_trajectory = []
+    for year in range(1, loan_term_years + 1):
+        if balance <= 0:
+            break
+
+        # Apply interest and calculate repayment
+        if salary > repayment_threshold:
+            annual_interest = balance * interest_rate
+            repayment = (salary - repayment_threshold) * repayment_rate
+
+            # Deduct repayment from balance
+            if repayment > annual_interest:
+                balance -= (repayment - annual_interest)
+            else:
+                balance += (annual_interest - repayment)
+        else:
+            balance += balance * interest_rate
+
+        loan_trajectory.append(balance if balance > 0 else 0)
+        salary_trajectory.append(salary)
+
+        # Update salary for the next year
+        salary *= (1 + annual_growth_mean)
+
+    return loan_trajectory, salary_trajectory
+
+
+LIFE_EVENT_PARAMETERS = ('starting_salaries', 'initial_loan_balance', 'interest_rate', 'repayment_threshold',
+                         'repayment_rate', 'loan_term_years', 'annual_growth_mean', 'annual_growth_std', 'iterations',
+                         'simulate_pregnancy', 'simulate_layoff', 'simulate_sick_leave', 'simulate_job_change',
+                         'paycut_percentage', 'payrise_percentage', 'seed')
+
+
+def _life_event_arguments(parameters):
+    """
+    Positional and keyword arguments of the life event simulation for the page's parameters.
+    """
+    args = [parameters[name] for name in LIFE_EVENT_PARAMETERS[:9]]
+    return args, {name: parameters[name] for name in LIFE_EVENT_PARAMETERS[9:]}
+
+
+@graph.stage(reads=LIFE_EVENT_PARAMETERS)
+def life_event_stats(**parameters):
+    # Simulate every starting salary, spread across worker processes and summarised as the paths are generated
+    args, kwargs = _life_event_arguments(parameters)
+    return simulate_life_event_stats(*args, **kwargs)
+
+
+def _progress(value):
+    """
+    Snapshot of a running iter_life_event_stats job, copied out on the job's thread: paths simulated per salary, and
+    each salary's running mean interest, its standard error and the current balance percentiles.
+    """
+    paths_done, results = value
+    return {'paths': paths_done,
+            'mean_interest': [stats.mean_interest for stats in results],
+            'std_error': [stats.interest_std_error for stats in results],
+            'fans': [stats.balance_quantiles(np.array(FAN_PERCENTILES) / 100) for stats in results]}
+
+
+def _show_progress(placeholder, progress, starting_salaries, iterations):
+    with placeholder.container():
+        if progress is None or not progress['paths']:
+            st.progress(0.0, text="Starting the simulation...")
+            return
+        st.progress(progress['paths'] / iterations,
+                    text=f"Simulated {progress['paths']:,} of {iterations:,} paths per salary")
+        st.table(pd.DataFrame({
+            'Starting Salary': [f"£{initial_salary:,}" for initial_salary in starting_salaries],
+            'Avg Interest Paid So Far': [f"£{mean:,.2f} ± £{1.96 * std_error:,.2f}"
+                                         for mean, std_error in zip(progress['mean_interest'], progress['std_error'])],
+        }).set_index('Starting Salary'))
+        columns = st.columns(2)
+        for idx, (initial_salary, fan) in enumerate(zip(starting_salaries, progress['fans'])):
+            with columns[idx % 2]:
+                st.caption(f"Starting Salary: £{initial_salary:,}")
+                st.line_chart(pd.DataFrame({f"{percentile}th percentile": balances
+                                            for percentile, balances in zip(FAN_PERCENTILES, fan)}),
+                              x_label="Years", y_label="Loan Balance (£)", height=220)
+
+
+def _life_event_stats_in_background(parameters, stage_results):
+    """
+    Bring the life_event_stats stage up to date with a background job, showing partial results until it finishes.
+
+    The job is kept in the session under the stage's fingerprint. A rerun with the same inputs, e.g. after changing
+    only your own salary, carries on waiting for it; one with different inputs cancels it and starts another. A widget
+    change while waiting stops this script run at its next progress update, and the next run takes over.
+    """
+    fingerprint = graph.fingerprint('life_event_stats', parameters)
+    kept = stage_results.get('life_event_stats')
+    if kept is not None and kept[0] == fingerprint:
+        return
+
+    job_fingerprint, job = st.session_state.get('life_event_job', (None, None))
+    if job_fingerprint != fingerprint:
+        if job is not None:
+            job.cancel()
+        args, kwargs = _life_event_arguments(parameters)
+        job = BackgroundJob(iter_life_event_stats(*args, **kwargs), summarise=_progress)
+        st.session_state['life_event_job'] = (fingerprint, job)
+
+    placeholder = st.empty()
+    with span("life events: background"):
+        while not job.wait(PROGRESS_INTERVAL):
+            _show_progress(placeholder, job.progress, parameters['starting_salaries'], parameters['iterations'])
+    placeholder.empty()
+    del st.session_state['life_event_job']
+    if job.error is not None:
+        raise job.error
+    stage_results['life_event_stats'] = (fingerprint, job.result[1])
+
+
+@graph.stage(reads=('starting_salaries', 'seed'), after=('life_event_stats',))
+def fan_charts(starting_salaries, seed, life_event_stats):
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10), sharex=True, sharey=True)
+    axes = axes.flatten()
+
+    # Loop over each starting salary
+    with span("fan charts: plot"):
+        for idx, initial_salary in enumerate(starting_salaries):
+            stats = life_event_stats[idx]
+
+            # Calculate average interest for this salary
+            avg_interest = stats.mean_interest
+
+            # Top, middle and bottom trajectories by final balance; paths repaid early count as zero
+            annotated = stats.annotated_paths()
+
+            # Percentile fan with a downsampled set of representative paths and the annotated paths on top
+            ax = axes[idx]
+            background = ~np.isin(stats.reservoir['sim'], annotated['sim'])
+            order = np.argsort(annotated['sim'])
+            plot_fan_chart(
+                ax, stats.balance_quantiles(np.array(FAN_PERCENTILES) / 100),
+                sample_paths=stats.reservoir['trajectory'][background],
+                highlighted_paths=annotated['trajectory'][order],
+                highlighted_labels=[f"Sim {sim_num + 1}: Growth Rate {growth_rate:.2%}"
+                                    for sim_num, growth_rate in zip(annotated['sim'][order],
+                                                                    annotated['growth_rate'][order])],
+                rng=seed
+            )
+
+            # Add the average interest paid to the subplot title
+            ax.set_title(f"Starting Salary: £{initial_salary}\nAvg Interest Paid: £{avg_interest:,.2f}")
+            ax.set_xlabel("Years")
+            ax.set_ylabel("Loan Balance (£)")
+            ax.grid(True)
+            ax.axhline(0, color='black', linestyle='--', linewidth=1)
+
+    with span("fan charts: tight_layout"):
+        plt.tight_layout()
+    with span("fan charts: savefig"):
+        return figure_png(fig)
+
+
+@graph.stage(reads=('starting_salaries',), after=('life_event_stats',))
+def summary_table(starting_salaries, life_event_stats):
+    return pd.DataFrame({
+        'Starting Salary': [f"£{initial_salary:,}" for initial_salary in starting_salaries],
+        'Avg Interest Paid': [f"£{stats.mean_interest:,.2f} ± £{1.96 * stats.interest_std_error:,.2f}"
+                              for stats in life_event_stats],
+        'Proportion Repaid': [f"{stats.proportion_repaid:.1%}" for stats in life_event_stats],
+        'Avg Years to Repay': [f"{stats.average_years_to_repay:.1f}" for stats in life_event_stats],
+    }).set_index('Starting Salary')
+
+
+@graph.stage(reads=('initial_loan_balance', 'interest_rate', 'repayment_threshold', 'repayment_rate',
+                    'loan_term_years', 'starting_salary', 'annual_growth_mean', 'annual_growth_std', 'iterations',
+                    'seed'))
+def sensitivities(initial_loan_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years,
+                  starting_salary, annual_growth_mean, annual_growth_std, iterations, seed):
+    # Every input nudged in one batch on shared salary paths, capped at one chunk's worth of paths per scenario
+    return student_loan_sensitivities(initial_loan_balance, interest_rate, repayment_threshold, repayment_rate,
+                                      loan_term_years, starting_salary, annual_growth_mean, annual_growth_std,
+                                      min(iterations, DEFAULT_CHUNK_SIZE), rng=seed)
+
+
+@graph.stage(after=('sensitivities',))
+def tornado(sensitivities):
+    # Largest effects first, as a table and a tornado chart of the effects with their 95% confidence intervals
+    order = np.argsort(-np.abs(sensitivities['effect']))
+    labels = [SENSITIVITY_LABELS[sensitivities['parameters'][i]] for i in order]
+    effect, half_width = sensitivities['effect'][order], 1.96 * sensitivities['std_error'][order]
+    table = pd.DataFrame({
+        'Input': [f"{name} ({change})" for name, change in labels],
+        'Change in Avg Interest Paid': [f"£{value:+,.2f}" for value in effect],
+        '95% Confidence Interval': [f"£{value - width:+,.2f} to £{value + width:+,.2f}"
+                                    for value, width in zip(effect, half_width)],
+    }).set_index('Input')
+
+    fig, ax = plt.subplots(figsize=(10, 0.5 * len(order) + 1))
+    ax.barh(table.index[::-1], effect[::-1], xerr=half_width[::-1], capsize=3,
+            color=np.where(effect[::-1] > 0, '#d62728', '#1f77b4'))
+    ax.axvline(0, color='black', linewidth=1)
+    ax.set_xlabel("Change in average interest paid (£)")
+    plt.tight_layout()
+    return table, figure_png(fig)
+
+
+@graph.stage(reads=('iterations',), after=('life_event_stats',))
+def life_event_table(iterations, life_event_stats):
+    # Life event frequency and cost, from the per-type counters kept across every path
+    # Summed from zeros, so no salaries selected gives an empty table
+    event_counts = sum((stats.event_counts for stats in life_event_stats), np.zeros(len(LIFE_EVENT_NAMES), dtype=int))
+    event_impact = sum((stats.event_impact_sums for stats in life_event_stats), np.zeros(len(LIFE_EVENT_NAMES)))
+    event_types = np.flatnonzero(event_counts)
+    return pd.DataFrame({
+        'Event': [LIFE_EVENT_NAMES[code] for code in event_types],
+        'Events per Simulation': event_counts[event_types] / (len(life_event_stats) * iterations),
+        'Avg Interest Added': [f"£{impact:,.2f}" for impact in event_impact[event_types] / event_counts[event_types]],
+    }).set_index('Event')
+
+
+@graph.stage(reads=('starting_salaries', 'seed'), after=('life_event_stats',))
+def life_event_sample(starting_salaries, seed, life_event_stats):
+    # Each salary keeps a uniform sample of its event log; draw from them in proportion to each salary's event count,
+    # then only format the rows that are shown
+    sample_rng = np.random.default_rng(seed)
+    salary_events = np.array([stats.event_counts.sum() for stats in life_event_stats], dtype=float)
+    remaining = [sample_rng.permutation(stats.event_sample) for stats in life_event_stats]
+    sample = []
+    for _ in range(min(5, sum(len(events) for events in remaining))):  # Show up to 5 random events
+        weights = np.where([len(events) > 0 for events in remaining], salary_events, 0)
+        salary_index = sample_rng.choice(len(remaining), p=weights / weights.sum())
+        event, remaining[salary_index] = remaining[salary_index][0], remaining[salary_index][1:]
+        sample.append(f"- £{starting_salaries[salary_index]:,} salary, simulation {event['sim'] + 1}, "
+                      f"year {event['year']}: {format_life_event(event)}")
+    return sample
+
+
+def render(seed):
+    # Existing student loan simulation code
+    st.title("Student Loan Repayment Simulator")
+    # Sidebar controls
+    st.sidebar.header("Simulation Parameters")
+    initial_loan_balance = st.sidebar.number_input("Initial Loan Balance (£):", min_value=0, value=60000)
+    repayment_threshold = st.sidebar.number_input("Repayment Threshold (£):", min_value=0, value=24990)
+    repayment_rate = st.sidebar.slider("Repayment Rate (%):", min_value=0.0, max_value=20.0, value=9.0) / 100
+    interest_rate = st.sidebar.slider("Interest Rate (%):", min_value=0.0, max_value=10.0, value=4.3) / 100
+    loan_term_years = st.sidebar.number_input("Loan Term (Years):", min_value=1, value=25)
+    iterations = st.sidebar.number_input("Number of Simulations:", min_value=10, max_value=1000000, value=100)
+    starting_salary = st.sidebar.number_input("Your Starting Salary:", min_value=10000, max_value=400000, value=30000)
+    starting_salaries = st.sidebar.multiselect(
+        "Starting Salaries for Simulations (£):",
+        options=[20000, 30000, 40000, 50000, 60000, 70000, 80000, 90000, 100000, 110000, 120000],
+        default=[30000, 60000, 90000, 120000]
+    )
+    annual_growth_mean = st.sidebar.slider("Average Annual Salary Growth (%):", min_value=-10.0, max_value=40.0,
+                                           value=3.0) / 100
+    annual_growth_std = st.sidebar.slider("Annual Growth Std Dev (%):", min_value=0.0, max_value=20.0, value=5.0) / 100
+
+    # Sidebar controls for life events
+    st.sidebar.header("Life Events")
+    simulate_pregnancy = st.sidebar.checkbox("Simulate Pregnancy (9 months no income)", value=True)
+    simulate_layoff = st.sidebar.checkbox("Simulate Layoff (6 months reduced income)", value=True)
+    simulate_sick_leave = st.sidebar.checkbox("Simulate Sick Leave (3 months reduced income)", value=True)
+    simulate_job_change = st.sidebar.checkbox("Simulate Job Change (X%)", value=True)
+    paycut_percentage = st.sidebar.slider("Paycut Percentage (%)", min_value=0, max_value=50, value=20)
+    payrise_percentage = st.sidebar.slider("Payrise Percentage (%)", min_value=0, max_value=50, value=20)
+
+    # Bring each stage up to date as it is needed, rerunning only those whose inputs changed since the last run
+    parameters = dict(locals())  # Every input above, by name
+    stage_results = st.session_state.setdefault(__name__, {})
+
+    # Plot repayment trajectory and salary as a native chart, which renders in the browser rather than as a
+    # matplotlib image
+    st.subheader("Your Loan Repayment and Salary Trajectory")
+    loan_trajectory, salary_trajectory = graph.evaluate(['trajectory'], parameters, stage_results)['trajectory']
+    with span("trajectory: st.line_chart"):
+        st.line_chart(pd.DataFrame({'Loan Balance (£)': loan_trajectory, 'Salary (£)': salary_trajectory}),
+                      x_label="Years", y_label="£", color=['#1f77b4', '#2ca02c'])
+
+    st.subheader("Monte Carlo Simulation")
+    # Large runs are simulated in the background first, with partial results shown as they arrive
+    if iterations > BACKGROUND_ITERATIONS:
+        _life_event_stats_in_background(parameters, stage_results)
+    stages = graph.evaluate(['fan_charts', 'summary_table', 'life_event_table', 'life_event_sample'], parameters,
+                            stage_results)
+    with span("fan charts: st.image"):
+        st.image(stages['fan_charts'])
+
+    # Summary Statistics
+    st.subheader("Summary Statistics")
+    st.table(stages['summary_table'])
+
+    # Sensitivity of your own loan to each input, without life events
+    st.subheader("What Matters Most for You?")
+    sensitivity_table, tornado_chart = graph.evaluate(['tornado'], parameters, stage_results)['tornado']
+    st.write(f"Change in the average interest you pay, starting on £{starting_salary:,}, when each input goes up. "
+             f"Red inputs cost you more, blue ones less.")
+    with span("tornado: st.image"):
+        st.image(tornado_chart)
+    st.table(sensitivity_table)
+
+    # Assumptions Summary
+    st.subheader("Monte Carlo Assumptions Summary")
+    st.markdown("""
+    ### Loan and Repayment Assumptions
+    - Initial loan balance, repayment threshold, repayment rate, interest rate, and loan term are user-defined inputs.
+    - Interest is compounded annually on the remaining balance.
+
+    ### Salary Growth
+    - Starting salaries are selected from user inputs, and annual salary growth is modeled using a normal distribution with user-defined mean and standard deviation.
+    - The annual growth standard deviation refers to the variability or dispersion of the annual salary growth rate. It is a measure of how much the salary growth rate can fluctuate from year to year. In other words, it indicates how much the actual growth rate can differ from the expected average growth rate.
+
+    Here’s a breakdown of how it works:
+    
+    Annual Growth Mean: This is the average (or expected) percentage by which your salary grows each year. For example, if the annual growth mean is 0.03, it means the average annual growth rate of the salary is 3%.
+    
+    Annual Growth Standard Deviation: This measures the degree of variation or uncertainty around the annual growth mean. For example, if the standard deviation is 0.02 (or 2%), it means that in most cases, the actual salary growth rate for a given year will fall within 2% of the mean (either above or below the mean), but in some cases, it could be higher or lower than that.
+    
+    For example:
+    
+    Mean = 3% and Standard Deviation = 2% means that each year, the salary growth could vary between -1% (3% - 2%) and 5% (3% + 2%) in most cases, based on a normal distribution
+
+    ### Life Events
+    - Life events are randomly simulated with a 10% chance per year:
+        - **Pregnancy**: 9 months of no income, during which interest accrues on the loan balance.
+        - **Layoff**: 6 months with 50% reduced income and accrued interest.
+        - **Sick Leave**: 3 months with 20% reduced income and accrued interest.
+        - **Job Change**: Either a user-defined pay cut or pay rise, occurring with equal probability.
+    - The occurrence of life events is governed by user preferences for each event type.
+
+    ### Repayment Calculations
+    - Repayments are calculated annually if the salary exceeds the repayment threshold.
+    - Repayment equals the amount over the threshold multiplied by the repayment rate.
+
+    ### Monte Carlo Simulation
+    - Each simulation runs for up to the specified loan term or until the loan is paid off.
+    - Results include trajectories for loan repayment across multiple simulations for selected starting salaries.
+    """)
+
+    st.subheader("Life Event Summary")
+    st.table(stages['life_event_table'])
+
+    # Display random sampled life events with simulation number
+    st.subheader("Random Sample of Life Events")
+    for line in stages['life_event_sample']:
+        st.write(line)
@@ -0,0 +1,249 @@
+"""
+Score a file of borrower scenarios from the command line, without the Streamlit app.
+
+    python batch.py scenarios.csv results.csv --iterations 1000 --seed 42
+
+Each input row is one scenario. Results are computed for every model whose columns are all present:
+
+    student loan: initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years, salary,
+                  annual_growth_mean, annual_growth_std
+    mortgage:     lump_sum, mortgage_balance, mortgage_interest_rate, mortgage_years
+    index fund:   lump_sum, annual_return_mean, annual_return_std, fund_years
+
+Rows are read and scored a chunk at a time across the process pool, and each chunk is appended to the output as soon
+as it is done, so memory does not grow with the file. A checkpoint next to the output records progress; rerunning the
+same command after an interruption carries on from the last completed chunk. Every scenario is seeded from the job
+seed and its row number, so results do not depend on chunking, worker count or restarts.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from loan_utils import simulate_student_loan, simulate_mortgage, simulate_index_fund
+from parallel_utils import default_workers, imap_chunks
+
+STUDENT_LOAN_COLUMNS = ('initial_balance', 'interest_rate', 'repayment_threshold', 'repayment_rate',
+                        'loan_term_years', 'salary', 'annual_growth_mean', 'annual_growth_std')
+MORTGAGE_COLUMNS = ('lump_sum', 'mortgage_balance', 'mortgage_interest_rate', 'mortgage_years')
+INDEX_FUND_COLUMNS = ('lump_sum', 'annual_return_mean', 'annual_return_std', 'fund_years')
+
+DEFAULT_BATCH_CHUNK_SIZE = 1000
+
+
+def _is_parquet(path):
+    return path.lower().endswith(('.parquet', '.pq'))
+
+
+def read_scenarios(path, chunk_size, skip_rows=0):
+    """
+    Read a CSV or Parquet scenario file a chunk at a time.
+
+    Parameters:
+        path (str): Scenario file; Parquet if it ends in .parquet or .pq, otherwise CSV.
+        chunk_size (int): Rows per chunk.
+        skip_rows (int): Data rows to skip at the start, for resuming.
+
+    Yields:
+        chunk (pd.DataFrame): Up to chunk_size scenarios.
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq  # Only needed for Parquet files
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            yield batch.slice(skip_rows).to_pandas()
+            skip_rows = 0
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, skiprows=range(1, skip_rows + 1))
+
+
+class ResultWriter:
+    """
+    Appends scored chunks to a CSV file, or for Parquet output to numbered part files in a directory, since Parquet
+    files cannot be appended to.
+
+    Parameters:
+        path (str): Output file, or directory for Parquet output.
+        offset (int): Bytes of CSV output, or Parquet parts, already covered by the checkpoint. Anything written
+            after it by an interrupted run is discarded.
+    """
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        if _is_parquet(path):
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                if name.startswith('part-') and int(name[5:10]) >= offset:
+                    os.remove(os.path.join(path, name))
+        elif os.path.exists(path) or offset:
+            with open(path, 'ab') as file:
+                file.truncate(offset)
+
+    def write(self, results):
+        if _is_parquet(self.path):
+            results.to_parquet(os.path.join(self.path, f"part-{self.offset:05d}.parquet"), index=False)
+            self.offset += 1
+        else:
+            results.to_csv(self.path, mode='a', header=self.offset == 0, index=False)
+            self.offset = os.path.getsize(self.path)
+
+
+def _checkpoint_path(output):
+    return f"{output.rstrip(os.sep)}.checkpoint.json"
+
+
+def load_checkpoint(output, settings):
+    """
+    Progress saved by an earlier run writing to output, or None to start afresh.
+
+    Raises:
+        ValueError: If the checkpoint was written with different settings, whose results could not be mixed.
+    """
+    try:
+        with open(_checkpoint_path(output)) as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return None
+    if checkpoint['settings'] != settings:
+        raise ValueError(f"{_checkpoint_path(output)} was written with settings {checkpoint['settings']}; delete it "
+                         f"or the output to start again")
+    return checkpoint
+
+
+def save_checkpoint(output, settings, rows_done, offset, complete=False):
+    """
+    Record progress atomically, so a crash leaves either the previous checkpoint or this one.
+    """
+    temporary_path = f"{_checkpoint_path(output)}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump({'settings': settings, 'rows_done': rows_done, 'offset': offset, 'complete': complete}, file)
+    os.replace(temporary_path, _checkpoint_path(output))
+
+
+def _models(columns):
+    """
+    Models with every input column present.
+    """
+    return [name for name, required in (('student_loan', STUDENT_LOAN_COLUMNS), ('mortgage', MORTGAGE_COLUMNS),
+                                        ('index_fund', INDEX_FUND_COLUMNS))
+            if set(required) <= set(columns)]
+
+
+def _scenario_rng(seed, scenario, model):
+    """
+    Generator for one model of one scenario, the same however the rows are chunked.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(scenario), model)))
+
+
+def _score_chunk(task):
+    """
+    Score one block of scenarios; runs on the worker processes.
+    """
+    scenarios, models, iterations, seed = task
+    rows = range(len(scenarios['scenario']))
+    results = {'scenario': scenarios['scenario']}
+
+    if 'student_loan' in models:
+        loans = [{column: scenarios[column][i] for column in STUDENT_LOAN_COLUMNS} for i in rows]
+        results['student_loan_interest'] = np.array([
+            simulate_student_loan(**dict(loan, loan_term_years=int(loan['loan_term_years'])), iterations=iterations,
+                                  rng=_scenario_rng(seed, scenario, 0))
+            for loan, scenario in zip(loans, scenarios['scenario'])])
+
+    if 'mortgage' in models:
+        # Closed form, so the whole block is one broadcast call
+        arguments = (scenarios['mortgage_balance'], scenarios['mortgage_interest_rate'], scenarios['mortgage_years'])
+        results['mortgage_interest'] = np.atleast_1d(simulate_mortgage(scenarios['lump_sum'], *arguments))
+        results['mortgage_interest_saved'] = np.atleast_1d(simulate_mortgage(0, *arguments)) - \
+            results['mortgage_interest']
+
+    if 'index_fund' in models:
+        results['index_fund_gain'] = np.array([
+            simulate_index_fund(scenarios['lump_sum'][i], scenarios['annual_return_mean'][i],
+                                scenarios['annual_return_std'][i], int(scenarios['fund_years'][i]), iterations,
+                                rng=_scenario_rng(seed, scenarios['scenario'][i], 1))
+            for i in rows])
+    return results
+
+
+def score_scenarios(input_path, output_path, iterations=1000, seed=0, chunk_size=DEFAULT_BATCH_CHUNK_SIZE,
+                    max_workers=None, log=sys.stderr):
+    """
+    Score every scenario in input_path and stream the results to output_path, resuming from a checkpoint if an
+    earlier run was interrupted.
+
+    Parameters:
+        input_path (str): CSV or Parquet scenario file.
+        output_path (str): CSV file, or directory of Parquet parts if it ends in .parquet or .pq.
+        iterations (int): Monte Carlo paths per scenario.
+        seed (int): Seed for the job.
+        chunk_size (int): Scenarios read, scored and written at a time.
+        max_workers (int): Number of worker processes, default_workers() if None.
+        log (file): Where progress and throughput are reported, or None for silence.
+
+    Returns:
+        rows_done (int): Number of scenarios in the output.
+    """
+    settings = {'input': os.path.abspath(input_path), 'iterations': iterations, 'seed': seed}
+    checkpoint = load_checkpoint(output_path, settings) or {'rows_done': 0, 'offset': 0, 'complete': False}
+    rows_done = checkpoint['rows_done']
+    if checkpoint['complete']:
+        if log:
+            print(f"{output_path} is already complete ({rows_done:,} scenarios)", file=log)
+        return rows_done
+
+    max_workers = default_workers() if max_workers is None else max_workers
+    writer = ResultWriter(output_path, checkpoint['offset'])
+    started, rows_this_run = time.perf_counter(), 0
+    for chunk in read_scenarios(input_path, chunk_size, skip_rows=rows_done):
+        models = _models(chunk.columns)
+        if not models:
+            raise ValueError(f"{input_path} has none of the column sets {STUDENT_LOAN_COLUMNS}, {MORTGAGE_COLUMNS} "
+                             f"or {INDEX_FUND_COLUMNS}")
+        chunk = chunk.assign(scenario=np.arange(rows_done, rows_done + len(chunk)))
+
+        # Split the chunk into one block per worker; each block is a dict of plain arrays to keep pickling cheap
+        tasks = [({column: values.to_numpy() for column, values in chunk.iloc[block].items()}, models, iterations, seed)
+                 for block in np.array_split(np.arange(len(chunk)), min(max_workers, len(chunk)))]
+        results = pd.concat([pd.DataFrame(block) for block in imap_chunks(_score_chunk, tasks, max_workers)])
+
+        writer.write(results)
+        rows_done += len(chunk)
+        rows_this_run += len(chunk)
+        save_checkpoint(output_path, settings, rows_done, writer.offset)
+        if log:
+            rate = rows_this_run / (time.perf_counter() - started)
+            print(f"{rows_done:,} scenarios scored, {rate:,.1f} scenarios/s", file=log, flush=True)
+
+    save_checkpoint(output_path, settings, rows_done, writer.offset, complete=True)
+    return rows_done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of loan scenarios.")
+    parser.add_argument('input', help="scenario file (.csv, or .parquet/.pq)")
+    parser.add_argument('output', help="results file (.csv), or directory of parts (.parquet/.pq)")
+    parser.add_argument('--iterations', type=int, default=1000, help="Monte Carlo paths per scenario")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the whole job")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_BATCH_CHUNK_SIZE,
+                        help="scenarios held in memory at a time")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: LOANCARLO_WORKERS or "
+                                                                  "every core)")
+    args = parser.parse_args(argv)
+    try:
+        score_scenarios(args.input, args.output, args.iterations, args.seed, args.chunk_size, args.workers)
+    except ValueError as error:
+        parser.error(str(error))
+
+
+if __name__ == '__main__':
+    main()
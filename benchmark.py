@@ -0,0 +1,238 @@
+"""
+Benchmark every simulation entry point with fixed-seed workloads, and check the fast engines against the reference
+loops in loan_utils.
+
+    python benchmark.py --output benchmark.json              # run and save
+    python benchmark.py --compare benchmark.json             # run and flag regressions against a saved run
+
+Each workload reports its wall time (best of --repeat runs), paths per second and the peak memory allocated while it
+runs, measured with tracemalloc in a separate run. The app's cold-start import time, for the shell and for each page,
+is measured in fresh interpreters. The exit status is 1 if an agreement check fails or, in compare mode, a workload's
+throughput has dropped by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import loan_utils
+from parallel_utils import parallel_life_event_paths, parallel_life_event_stats, parallel_parameter_grid
+from sampling_utils import normal_shocks
+
+SCALES = (100, 10000, 1000000)
+
+# The Student Loan Simulation page's defaults
+STUDENT_LOAN = dict(initial_balance=60000, interest_rate=0.043, repayment_threshold=24990, repayment_rate=0.09,
+                    loan_term_years=25, salary=30000, annual_growth_mean=0.03, annual_growth_std=0.05)
+LOAN = {name: value for name, value in STUDENT_LOAN.items() if name != 'salary'}
+INDEX_FUND = dict(lump_sum=10000, annual_return_mean=0.07, annual_return_std=0.15, years=30)
+SEED = 42
+
+# What app.py imports before any page, and the page modules it imports the first time each page is shown
+APP_IMPORTS = ('streamlit', 'cache_utils', 'perf_utils')
+PAGE_MODULES = ('app_pages.student_loan', 'app_pages.mortgage', 'app_pages.index_fund', 'app_pages.parameter_analysis')
+
+
+def _parameter_grid(paths):
+    # The Parameter Analysis page as it runs by default: 10 salaries x 10 student loan rates x 10 mortgage rates, with
+    # the iterations scaled so the grid covers the requested number of student loan paths
+    return parallel_parameter_grid(np.linspace(30000, 120000, 10), np.linspace(0.02, 0.08, 10),
+                                   np.linspace(0.02, 0.08, 10), 60000, 24990, 0.09, 25, 0.03, 0.05,
+                                   max(paths // 100, 1), 50000, 450000, 25, seed=SEED, common_random_numbers=True)
+
+
+def workloads(scales=SCALES):
+    """
+    Benchmark workloads as (name, paths, function) tuples, where function runs the workload once.
+    """
+    mortgage_rates = np.random.default_rng(SEED).uniform(0.01, 0.08, max(scales))
+    for paths in scales:
+        yield (f"student_loan/{paths}", paths,
+               lambda paths=paths: loan_utils.simulate_student_loan(**STUDENT_LOAN, iterations=paths, rng=SEED))
+        yield (f"mortgage/{paths}", paths,
+               lambda paths=paths: loan_utils.simulate_mortgage(50000, 450000, mortgage_rates[:paths], 25))
+        yield (f"index_fund/{paths}", paths,
+               lambda paths=paths: loan_utils.simulate_index_fund(**INDEX_FUND, iterations=paths, rng=SEED))
+        yield (f"life_events/{paths}", paths,
+               lambda paths=paths: parallel_life_event_stats([STUDENT_LOAN['salary']], **LOAN, iterations=paths,
+                                                             seed=SEED))
+    yield "parameter_grid/app", 10000, lambda: _parameter_grid(10000)
+
+
+def run_workload(name, paths, function, repeat=3):
+    """
+    Time a workload and measure its peak traced memory.
+
+    Returns:
+        result (dict): 'name', 'paths', 'wall_time' in seconds, 'paths_per_sec' and 'peak_memory_mb'.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    wall_time = min(times)
+    return {'name': name, 'paths': paths, 'wall_time': wall_time, 'paths_per_sec': paths / wall_time,
+            'peak_memory_mb': peak / 1024 ** 2}
+
+
+def import_times(repeat=3):
+    """
+    Cold-start import time of the app shell alone and with each page, each timed in a fresh interpreter.
+
+    Returns:
+        times (list): One dict per page with 'name', 'seconds' (the best of repeat runs) and 'modules', the number of
+            modules loaded.
+    """
+    times = []
+    for page in (None,) + PAGE_MODULES:
+        code = (f"import sys, time\nstarted = time.perf_counter()\nimport {', '.join(APP_IMPORTS)}\n"
+                + (f"import {page}\n" if page else "")
+                + "print(time.perf_counter() - started, len(sys.modules))")
+        runs = [subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+                for _ in range(repeat)]
+        times.append({'name': page or 'app shell', 'seconds': min(float(seconds) for seconds, _ in runs),
+                      'modules': int(runs[0][1])})
+    return times
+
+
+def _agreement(name, fast, reference, tolerance):
+    return {'name': name, 'fast': float(fast), 'reference': float(reference), 'tolerance': float(tolerance),
+            'passed': bool(abs(fast - reference) <= tolerance)}
+
+
+def agreement_checks(reference_paths=2000, fast_paths=200000):
+    """
+    Compare the fast engines with the reference loops. Monte Carlo results must agree within four combined standard
+    errors; the closed-form mortgage must match the month-by-month loop to rounding.
+
+    Returns:
+        checks (list): One dict per check with 'name', 'fast', 'reference', 'tolerance' and 'passed'.
+    """
+    checks = []
+
+    # Student loan, with the spread of interest paid taken from the fast engine's paths
+    np.random.seed(SEED)
+    reference = loan_utils.simulate_student_loan_reference(**STUDENT_LOAN, iterations=reference_paths)
+    shocks = normal_shocks(STUDENT_LOAN['annual_growth_mean'], STUDENT_LOAN['annual_growth_std'],
+                           (fast_paths, STUDENT_LOAN['loan_term_years']), SEED)
+    interest_paid = loan_utils._student_loan_paths(
+        **{name: value for name, value in LOAN.items() if name not in ('loan_term_years', 'annual_growth_mean',
+                                                                       'annual_growth_std')},
+        salary=STUDENT_LOAN['salary'], growth_shocks=shocks)
+    std = interest_paid.std(ddof=1)
+    checks.append(_agreement("student_loan", interest_paid.mean(), reference,
+                             4 * std * np.sqrt(1 / reference_paths + 1 / fast_paths)))
+
+    # Index fund
+    np.random.seed(SEED)
+    reference = loan_utils.simulate_index_fund_reference(**INDEX_FUND, iterations=reference_paths)
+    terminal_values = loan_utils._index_fund_terminal_values(**INDEX_FUND, iterations=fast_paths, rng=SEED)
+    std = terminal_values.std(ddof=1)
+    checks.append(_agreement("index_fund", terminal_values.mean() - INDEX_FUND['lump_sum'], reference,
+                             4 * std * np.sqrt(1 / reference_paths + 1 / fast_paths)))
+
+    # Mortgage, over a spread of rates and terms
+    for rate, years in ((0.05, 25), (0.02, 35), (0.08, 10)):
+        fast = loan_utils.simulate_mortgage(50000, 450000, rate, years)
+        reference = loan_utils.simulate_mortgage_reference(50000, 450000, rate, years)
+        checks.append(_agreement(f"mortgage/{rate:.0%}/{years}y", fast, reference, 1e-6 * max(abs(reference), 1)))
+
+    # Life events, against the page's original per-path loop
+    np.random.seed(SEED)
+    _, reference_interest, _ = loan_utils.simulate_life_event_paths_reference(**STUDENT_LOAN,
+                                                                                iterations=reference_paths)
+    _, interest_paid, *_ = parallel_life_event_paths([STUDENT_LOAN['salary']], **LOAN, iterations=fast_paths // 10,
+                                                     seed=SEED)[0]
+    checks.append(_agreement("life_events", interest_paid.mean(), reference_interest.mean(),
+                             4 * np.sqrt(reference_interest.var(ddof=1) / reference_paths
+                                         + interest_paid.var(ddof=1) / len(interest_paid))))
+
+    # The streaming life event summary against the full paths it summarises
+    stats = parallel_life_event_stats([STUDENT_LOAN['salary']], **LOAN, iterations=fast_paths // 10, seed=SEED)[0]
+    checks.append(_agreement("life_events/streaming", stats.mean_interest, interest_paid.mean(),
+                             1e-9 * abs(interest_paid.mean())))
+    return checks
+
+
+def compare(results, baseline, threshold):
+    """
+    Workloads whose throughput fell by more than threshold (a fraction) against the baseline run.
+
+    Returns:
+        rows (list): (name, baseline paths/sec, current paths/sec, ratio, regressed) for every workload in both runs.
+    """
+    baseline_rates = {result['name']: result['paths_per_sec'] for result in baseline['results']}
+    return [(result['name'], baseline_rates[result['name']], result['paths_per_sec'],
+             result['paths_per_sec'] / baseline_rates[result['name']],
+             result['paths_per_sec'] < (1 - threshold) * baseline_rates[result['name']])
+            for result in results if result['name'] in baseline_rates]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the LoanCarlo simulations.")
+    parser.add_argument('--output', help="save results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file to flag regressions against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="fractional drop in paths/sec counted as a regression (default 0.25)")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(SCALES), help="path counts to run")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per workload; the best is reported")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for the parallel entry points (default 1, so runs are comparable)")
+    args = parser.parse_args(argv)
+    os.environ['LOANCARLO_WORKERS'] = str(args.workers)
+
+    results = []
+    print(f"{'workload':<28}{'paths':>10}{'wall time (s)':>15}{'paths/sec':>15}{'peak MB':>10}")
+    for name, paths, function in workloads(args.scales):
+        result = run_workload(name, paths, function, args.repeat)
+        results.append(result)
+        print(f"{name:<28}{paths:>10,}{result['wall_time']:>15.4f}{result['paths_per_sec']:>15,.0f}"
+              f"{result['peak_memory_mb']:>10.1f}", flush=True)
+
+    print(f"\n{'cold start':<38}{'import time (s)':>15}{'modules':>10}")
+    imports = import_times(args.repeat)
+    for page in imports:
+        print(f"{page['name']:<38}{page['seconds']:>15.3f}{page['modules']:>10,}")
+
+    print()
+    checks = agreement_checks()
+    for check in checks:
+        print(f"{'ok  ' if check['passed'] else 'FAIL'} {check['name']:<24} fast {check['fast']:,.4f}  "
+              f"reference {check['reference']:,.4f}  tolerance {check['tolerance']:,.4f}")
+    failed = not all(check['passed'] for check in checks)
+
+    if args.output:
+        metadata = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                    'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                    'workers': args.workers}
+        with open(args.output, 'w') as file:
+            json.dump({'metadata': metadata, 'results': results, 'imports': imports, 'agreement': checks}, file,
+                      indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print(f"\nAgainst {args.compare} ({baseline['metadata']['timestamp']}):")
+        for name, baseline_rate, rate, ratio, regressed in compare(results, baseline, args.threshold):
+            print(f"{'REGRESSION' if regressed else 'ok':<11}{name:<28}{baseline_rate:>15,.0f}{rate:>15,.0f}"
+                  f"{ratio:>8.2f}x")
+            failed = failed or regressed
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+import copy
+import functools
+import hashlib
+import importlib
+import inspect
+import io
+import json
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger('loancarlo.cache')
+
+# Summary classes the disk tier stores attribute by attribute, by the name written to the file
+_DISK_OBJECTS = {'LoanPathStats': 'streaming_utils'}
+
+
+def _canonical(value):
+    """
+    Convert a parameter into a JSON-serialisable form that is equal for equal inputs, whether they arrive as Python
+    or NumPy types and as ints or floats.
+    """
+    if isinstance(value, (bool, np.bool_)) or value is None or isinstance(value, str):
+        return value if not isinstance(value, np.bool_) else bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return ['ndarray', str(array.dtype), list(array.shape), hashlib.sha256(array.tobytes()).hexdigest()]
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    raise TypeError(f"Cannot build a cache key from a {type(value).__name__}")
+
+
+def canonical_key(func, args, kwargs):
+    """
+    Hash a call to func so that calls with the same parameters map to the same key, however they are passed.
+
+    Parameters:
+        func (callable): The function being called.
+        args (tuple): Positional arguments.
+        kwargs (dict): Keyword arguments.
+
+    Returns:
+        key (str): Hex digest identifying the call.
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    payload = {'function': f"{func.__module__}.{func.__qualname__}", 'arguments': _canonical(dict(bound.arguments))}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+# Parameters that seed a simulation. A call that leaves them None draws fresh entropy, so it is never cached: every
+# such call must give a new random result
+SEED_PARAMETERS = ('seed', 'rng')
+
+
+def is_unseeded(func, args, kwargs):
+    """
+    Whether a call to func leaves one of its SEED_PARAMETERS as None.
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return any(bound.arguments.get(name, False) is None for name in SEED_PARAMETERS)
+
+
+def _is_dataframe(value):
+    # pandas is only imported by the pages and tools that build frames, so if it has not been imported the value
+    # cannot be one
+    pandas = sys.modules.get('pandas')
+    return pandas is not None and isinstance(value, pandas.DataFrame)
+
+
+def _result_nbytes(result):
+    """
+    Approximate memory held by a cached result.
+    """
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if _is_dataframe(result):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, (list, tuple)):
+        return sum(_result_nbytes(item) for item in result)
+    if isinstance(result, dict):
+        return sum(_result_nbytes(item) for item in result.values())
+    if hasattr(result, '__dict__'):  # Summary objects such as LoanPathStats
+        return _result_nbytes(vars(result))
+    return 64
+
+
+def _freeze(result):
+    """
+    Mark cached arrays read-only so a caller cannot modify the copy shared with later hits.
+    """
+    if isinstance(result, np.ndarray):
+        result.flags.writeable = False
+    elif isinstance(result, (list, tuple)):
+        for item in result:
+            _freeze(item)
+    elif isinstance(result, dict):
+        for item in result.values():
+            _freeze(item)
+    return result
+
+
+def _for_caller(result):
+    """
+    The form of a cached result handed to a caller. Frozen arrays are shared, but containers are rebuilt and
+    DataFrames and summary objects such as LoanPathStats copied, since those cannot be made read-only and are updated
+    in place (LoanPathStats.merge), so nothing a caller does reaches later hits.
+    """
+    if isinstance(result, np.ndarray):
+        return result
+    if _is_dataframe(result):
+        return result.copy()
+    if isinstance(result, list):
+        return [_for_caller(item) for item in result]
+    if isinstance(result, tuple):
+        return tuple(_for_caller(item) for item in result)
+    if isinstance(result, dict):
+        return {key: _for_caller(item) for key, item in result.items()}
+    if hasattr(result, '__dict__'):
+        return copy.deepcopy(result)  # Deep, so the copy's arrays are writeable again
+    return result
+
+
+def _pack(result, arrays):
+    """
+    Split a result into named arrays for an .npz file, returning a JSON description of how to rebuild it.
+    """
+    if isinstance(result, np.ndarray):
+        name = f"a{len(arrays)}"
+        arrays[name] = result
+        return {'type': 'ndarray', 'name': name}
+    if _is_dataframe(result):
+        # Text columns are stored as fixed-width unicode so the file loads without pickle
+        return {'type': 'dataframe', 'columns': [
+            [str(column), _pack(np.asarray(result[column].to_numpy(), dtype=str)
+                                if result[column].dtype.kind not in 'biufcmM' else result[column].to_numpy(), arrays)]
+            for column in result.columns]}
+    if isinstance(result, (list, tuple)):
+        return {'type': type(result).__name__, 'items': [_pack(item, arrays) for item in result]}
+    if isinstance(result, dict):
+        return {'type': 'dict', 'items': [[_canonical(key), _pack(item, arrays)] for key, item in result.items()]}
+    if isinstance(result, (bool, np.bool_, int, np.integer, float, np.floating)):
+        return {'type': 'scalar', 'value': result.item() if isinstance(result, np.generic) else result}
+    if type(result).__name__ in _DISK_OBJECTS:
+        return {'type': 'object', 'class': type(result).__name__, 'attributes': _pack(vars(result), arrays)}
+    raise TypeError(f"Cannot store a {type(result).__name__} in the disk cache")
+
+
+def _unpack(structure, arrays):
+    """
+    Rebuild a result packed by _pack.
+    """
+    kind = structure['type']
+    if kind == 'ndarray':
+        return arrays[structure['name']]
+    if kind == 'dataframe':
+        import pandas as pd  # Only needed when a cached frame is read back
+
+        return pd.DataFrame({column: _unpack(item, arrays) for column, item in structure['columns']})
+    if kind in ('list', 'tuple'):
+        items = [_unpack(item, arrays) for item in structure['items']]
+        return tuple(items) if kind == 'tuple' else items
+    if kind == 'dict':
+        return {(int(key) if isinstance(key, float) and key.is_integer() else key): _unpack(item, arrays)
+                for key, item in structure['items']}
+    if kind == 'object':
+        # Rebuilt without calling __init__, from the attributes it had when it was stored
+        cls = getattr(importlib.import_module(_DISK_OBJECTS[structure['class']]), structure['class'])
+        result = cls.__new__(cls)
+        result.__dict__.update(_unpack(structure['attributes'], arrays))
+        return result
+    return structure['value']
+
+
+class SimulationCache:
+    """
+    Two-tier memo cache for simulation results.
+
+    Results are kept in an in-process LRU bounded by max_bytes. If disk_dir is given, results are also written there
+    as compressed .npz files which outlive the process, with the oldest files removed beyond max_disk_bytes.
+
+    Parameters:
+        max_bytes (int): Memory budget for the in-process tier.
+        disk_dir (str): Directory for the on-disk tier, or None to keep results in memory only.
+        max_disk_bytes (int): Budget for the on-disk tier.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, disk_dir=None, max_disk_bytes=2 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._calls = threading.local()  # Whether each thread's latest memoised call was a hit
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def last_call_hit(self):
+        """
+        Whether the latest memoised call on this thread was answered from the cache.
+        """
+        return getattr(self._calls, 'hit', False)
+
+    def stats(self):
+        """
+        Hit and miss counters along with the current size of the in-process tier.
+        """
+        with self._lock:
+            return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'memory_bytes': self._nbytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def get(self, key):
+        """
+        Look a key up in memory, then on disk.
+
+        Returns:
+            found (bool): Whether the key was cached.
+            result: The cached result as a caller may keep it (see _for_caller), or None.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return True, _for_caller(self._entries[key][0])
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return False, None
+            self.disk_hits += 1
+        self._store_memory(key, _freeze(result))
+        return True, _for_caller(result)
+
+    def put(self, key, result):
+        _freeze(result)
+        self._store_memory(key, result)
+        self._write_disk(key, result)
+
+    def memoize(self, func):
+        """
+        Wrap func so that repeated calls with the same parameters, including the seed, return the cached result.
+        Unseeded calls (see SEED_PARAMETERS) are always run.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self._calls.hit = False
+            if is_unseeded(func, args, kwargs):
+                return func(*args, **kwargs)
+            try:
+                key = canonical_key(func, args, kwargs)
+            except TypeError:  # Arguments such as a live Generator cannot be keyed, so the call is not cached
+                return func(*args, **kwargs)
+            found, result = self.get(key)
+            self._calls.hit = found
+            if not found:
+                result = func(*args, **kwargs)
+                self.put(key, result)
+                result = _for_caller(result)
+            return result
+
+        return wrapper
+
+    def _store_memory(self, key, result):
+        nbytes = _result_nbytes(result)
+        if nbytes > self.max_bytes:  # Never worth evicting everything for one oversized result
+            return
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _read_disk(self, key):
+        if self.disk_dir is None or not os.path.exists(self._disk_path(key)):
+            return None
+        try:
+            with np.load(self._disk_path(key), allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(self._disk_path(key))  # Recently read files are evicted last
+        except (OSError, ValueError):  # Removed, or a corrupt file
+            return None
+        structure = json.loads(str(arrays.pop('__structure__')))
+        return _unpack(structure, arrays)
+
+    def _write_disk(self, key, result):
+        if self.disk_dir is None:
+            return
+        arrays = {}
+        try:
+            structure = _pack(result, arrays)
+        except TypeError as error:
+            logger.warning("Not caching on disk: %s", error)  # The result is still cached in memory
+            return
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, __structure__=np.array(json.dumps(structure)), **arrays)
+
+        # Write to a temporary file first so readers never see a partial result
+        temporary_path = f"{self._disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(buffer.getvalue())
+        os.replace(temporary_path, self._disk_path(key))
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            try:
+                if entry.name.endswith('.npz'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:  # Evicted by another process
+                continue
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# Shared cache for the app. Set LOANCARLO_CACHE_DIR to keep results on disk across restarts.
+simulation_cache = SimulationCache(disk_dir=os.environ.get('LOANCARLO_CACHE_DIR'))
@@ -0,0 +1,61 @@
+import threading
+
+
+class BackgroundJob:
+    """
+    Runs a generator on a daemon thread, so a long simulation does not hold up the Streamlit script, and keeps a
+    summary of the latest value it yielded for the page to show while it runs. The last value yielded is the result.
+
+    Parameters:
+        generator (generator): Yields progressively better results, e.g. parallel_utils.iter_life_event_stats.
+        summarise (callable): Turns each yielded value into the progress snapshot the page reads. It runs on the job's
+            thread, so it must copy out anything the generator goes on to modify.
+    """
+
+    def __init__(self, generator, summarise=lambda value: value):
+        self.progress = None
+        self.result = None
+        self.error = None
+        self._generator = generator
+        self._summarise = summarise
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            value = None
+            for value in self._generator:
+                if self._cancelled.is_set():
+                    return
+                self.progress = self._summarise(value)
+            self.result = value
+        except Exception as error:
+            self.error = error
+        finally:
+            # Closing the generator stops work that has not started, such as chunks queued on the process pool
+            self._generator.close()
+            self._finished.set()
+
+    def cancel(self):
+        """
+        Stop the job at its next yield; its result is discarded.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def done(self):
+        """
+        Whether the job has finished, been cancelled or failed.
+        """
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the job is done or timeout seconds have passed, returning whether it is done.
+        """
+        return self._finished.wait(timeout)
@@ -0,0 +1,115 @@
+"""
+Load test a running scoring service (service.py) with concurrent clients sending near-identical requests.
+
+    python load_test.py --model student_loan --clients 32 --requests 2000 --iterations 1000
+
+Each client keeps one connection open and sends its share of the requests back to back, varying the salary, balance
+and seed a little from request to request as users of the app would. Client-side latency percentiles, throughput and
+status counts are printed, followed by the service's own /metrics for the model.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+import numpy as np
+
+# A base request per model, around the app's defaults
+BASE_REQUESTS = {
+    'student_loan': {'initial_balance': 60000, 'interest_rate': 0.043, 'repayment_threshold': 24990,
+                     'repayment_rate': 0.09, 'loan_term_years': 25, 'salary': 30000, 'annual_growth_mean': 0.03,
+                     'annual_growth_std': 0.05},
+    'mortgage': {'lump_sum': 50000, 'mortgage_balance': 200000, 'interest_rate': 0.03, 'years': 25},
+    'index_fund': {'lump_sum': 50000, 'annual_return_mean': 0.07, 'annual_return_std': 0.15, 'years': 25},
+    'life_events': {'salaries': [30000, 60000], 'initial_balance': 60000, 'interest_rate': 0.043,
+                    'repayment_threshold': 24990, 'repayment_rate': 0.09, 'loan_term_years': 25,
+                    'annual_growth_mean': 0.03, 'annual_growth_std': 0.05},
+}
+
+
+def _request(model, iterations, rng):
+    request = dict(BASE_REQUESTS[model])
+    if model == 'student_loan':
+        request.update(salary=float(rng.choice([25000, 30000, 35000, 40000])),
+                       initial_balance=float(rng.choice([50000, 60000])))
+    elif model == 'mortgage':
+        request.update(interest_rate=float(rng.choice([0.03, 0.035, 0.04])))
+    if model != 'mortgage':
+        request.update(iterations=iterations, seed=int(rng.integers(1000)))
+    return request
+
+
+def _client(url, model, iterations, count, seed, latencies, statuses, lock):
+    rng = np.random.default_rng(seed)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=120)
+    for _ in range(count):
+        body = json.dumps(_request(model, iterations, rng))
+        started = time.perf_counter()
+        connection.request('POST', f"/{model}", body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[response.status] += 1
+            if response.status == 200:
+                latencies.append(elapsed)
+    connection.close()
+
+
+def run(url, model, clients, requests, iterations, seed=0):
+    """
+    Send requests from clients concurrent connections and summarise the responses.
+
+    Returns:
+        summary (dict): 'requests', 'seconds', 'throughput_per_second', 'statuses' counted by HTTP status, client-side
+            'latency_ms' percentiles of the successful requests, and the service's 'metrics' for the model.
+    """
+    url = urlparse(url)
+    latencies, statuses, lock = [], Counter(), threading.Lock()
+    shares = [requests // clients + (client < requests % clients) for client in range(clients)]
+    threads = [threading.Thread(target=_client, args=(url, model, iterations, share, seed + client, latencies,
+                                                      statuses, lock))
+               for client, share in enumerate(shares)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+    connection.request('GET', '/metrics')
+    metrics = json.loads(connection.getresponse().read())['models'].get(model)
+    connection.close()
+    return {'requests': requests, 'seconds': seconds, 'throughput_per_second': requests / seconds,
+            'statuses': dict(statuses),
+            'latency_ms': {f"p{p}": float(np.percentile(latencies, p) * 1000) if latencies else None
+                           for p in (50, 90, 99)},
+            'metrics': metrics}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running LoanCarlo scoring service.")
+    parser.add_argument('--url', default='http://127.0.0.1:8765', help="service address")
+    parser.add_argument('--model', choices=sorted(BASE_REQUESTS), default='student_loan', help="model to request")
+    parser.add_argument('--clients', type=int, default=32, help="concurrent connections")
+    parser.add_argument('--requests', type=int, default=2000, help="requests in total")
+    parser.add_argument('--iterations', type=int, default=1000, help="Monte Carlo paths per request")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the request mix")
+    args = parser.parse_args(argv)
+
+    summary = run(args.url, args.model, args.clients, args.requests, args.iterations, args.seed)
+    latency = summary['latency_ms']
+    print(f"{summary['requests']:,} {args.model} requests from {args.clients} clients in {summary['seconds']:.2f}s: "
+          f"{summary['throughput_per_second']:,.1f} requests/s")
+    print("Statuses: " + ", ".join(f"{status}: {count:,}" for status, count in sorted(summary['statuses'].items())))
+    if latency['p50'] is not None:
+        print(f"Latency: p50 {latency['p50']:.1f}ms, p90 {latency['p90']:.1f}ms, p99 {latency['p99']:.1f}ms")
+    print(f"Service metrics: {json.dumps(summary['metrics'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,492 @@
 # loan_utils.py
 
+import time
+
 import numpy as np
 
+from sampling_utils import norm_ppf, normal_shocks
+
+
+# Batched engines drop paid-off paths from their working arrays once fewer than this fraction of the rows they hold
+# are still live, so later years only cost as much as the paths still being simulated
+COMPACTION_THRESHOLD = 0.75
+
+
+def _gather(values, coords, shape):
+    """
+    Elements of values, broadcast to shape, at the given coordinates into shape (every element, flattened, if coords
+    is None), without materialising the broadcast array. Scalars are returned as they are.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 0:
+        return values
+    if coords is None:
+        return np.broadcast_to(values, shape).reshape(-1)
+    values = values.reshape((1,) * (len(shape) - values.ndim) + values.shape)
+    return values[tuple(coord if size > 1 else 0 for coord, size in zip(coords, values.shape))]
+
+
+def _student_loan_paths(initial_balance, interest_rate, repayment_threshold, repayment_rate, salary, growth_shocks,
+                        return_payoff_years=False, return_repayments=False):
+    """
+    Batched student loan engine. Every live path is moved forward one year at a time, with masks standing in for the
+    "below threshold" branch of the reference loop. Balances are floored at zero once repaid, and paid-off paths are
+    compacted out of the working set (see COMPACTION_THRESHOLD), so the cost follows the path-years simulated.
+
+    Parameters:
+        initial_balance (float or array): Initial student loan balance.
+        interest_rate (float or array): Annual interest rate.
+        repayment_threshold (float or array): Salary threshold for repayments.
+        repayment_rate (float or array): Repayment rate as a decimal.
+        salary (float or array): Starting salary.
+        growth_shocks (np.ndarray): Salary growth draws with shape (..., years). The leading dimensions are the
+            paths; they broadcast against the loan parameters, so one shock matrix can be shared by many scenarios.
+        return_payoff_years (bool): Also return the year each path was repaid in.
+        return_repayments (bool): Also return the total each path repaid.
+
+    Returns:
+        interest_paid (np.ndarray): Interest paid on each path, with the broadcast shape of the parameters and
+            growth_shocks.shape[:-1].
+        payoff_years (np.ndarray): Only if return_payoff_years is set. Same shape; the year each loan was repaid in,
+            0 if there was nothing to repay and inf if it was still owing at the end.
+        repayments (np.ndarray): Only if return_repayments is set, after payoff_years if both are. Same shape; the
+            total repaid on each path, which falls short of the balance and interest when the loan is written off.
+    """
+    path_shape = np.broadcast_shapes(growth_shocks.shape[:-1], np.shape(initial_balance), np.shape(interest_rate),
+                                     np.shape(repayment_threshold), np.shape(repayment_rate), np.shape(salary))
+    interest_paid = np.zeros(path_shape)
+    flat_interest_paid = interest_paid.reshape(-1)
+    payoff_years = np.zeros(path_shape) if return_payoff_years else None
+    repayments = np.zeros(path_shape) if return_repayments else None
+
+    # Working set: flat indices of the live paths and their state, with array parameters gathered to match
+    live = np.flatnonzero(np.broadcast_to(np.asarray(initial_balance, dtype=float), path_shape) > 0)
+    coords = None if len(live) == interest_paid.size else np.unravel_index(live, path_shape)
+    balance = np.broadcast_to(_gather(initial_balance, coords, path_shape), live.shape).copy()
+    current_salary = np.broadcast_to(_gather(salary, coords, path_shape), live.shape).copy()
+    live_interest = np.zeros(len(live))
+    live_payoff_years = np.full(len(live), np.inf)
+    live_repayments = np.zeros(len(live))
+    parameters = (interest_rate, repayment_threshold, repayment_rate)
+    rate, threshold, repayment_share = (_gather(values, coords, path_shape) for values in parameters)
+
+    for year in range(growth_shocks.shape[-1]):
+        still_owing = np.count_nonzero(balance)
+        if not still_owing:  # Every path has paid off
+            break
+        if still_owing < COMPACTION_THRESHOLD * len(live):
+            flat_interest_paid[live] = live_interest
+            if return_payoff_years:
+                payoff_years.reshape(-1)[live] = live_payoff_years
+            if return_repayments:
+                repayments.reshape(-1)[live] = live_repayments
+            keep = np.flatnonzero(balance)
+            live, balance, current_salary, live_interest, live_payoff_years, live_repayments = (
+                live[keep], balance[keep], current_salary[keep], live_interest[keep], live_payoff_years[keep],
+                live_repayments[keep])
+            coords = np.unravel_index(live, path_shape)
+            rate, threshold, repayment_share = (values[keep] if values.ndim else values
+                                                for values in (rate, threshold, repayment_share))
+
+        # Paid-off paths not yet compacted sit at a balance of exactly zero, so they accrue no interest and repay
+        # nothing
+        above_threshold = current_salary > threshold
+        annual_interest = balance * rate
+        live_interest += np.where(above_threshold, annual_interest, 0)
+
+        # Below the threshold no repayment occurs and the interest just accrues on the balance
+        repayment = np.where(above_threshold, (current_salary - threshold) * repayment_share, 0)
+        balance += annual_interest
+        if return_repayments:
+            live_repayments += np.minimum(repayment, balance)  # The final repayment only clears what is owed
+        balance -= repayment
+        np.maximum(balance, 0, out=balance)
+        if return_payoff_years:
+            live_payoff_years[(balance == 0) & np.isinf(live_payoff_years)] = year + 1
+
+        # Update salary for the next year, if there is one
+        if year + 1 < growth_shocks.shape[-1]:
+            current_salary *= 1 + _gather(growth_shocks[..., year], coords, path_shape)
+
+    flat_interest_paid[live] = live_interest
+    results = [interest_paid]
+    if return_payoff_years:
+        payoff_years.reshape(-1)[live] = live_payoff_years
+        results.append(payoff_years)
+    if return_repayments:
+        repayments.reshape(-1)[live] = live_repayments
+        results.append(repayments)
+    return tuple(results) if len(results) > 1 else interest_paid
+
 
 def simulate_student_loan(initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years, salary,
-                          annual_growth_mean, annual_growth_std, iterations):
+                          annual_growth_mean, annual_growth_std, iterations, rng=None, sampler='random'):
     """
     Simulate student loan repayment over multiple iterations, including salary growth variability.
     Interest is only paid if salary exceeds the repayment threshold.
 
+    All salary growth shocks are drawn up front as one (iterations, loan_term_years) array and the paths are
+    simulated together, see _student_loan_paths.
+
+    Parameters:
+        initial_balance (float): Initial student loan balance.
+        interest_rate (float): Annual interest rate (e.g., 0.05 for 5%).
+        repayment_threshold (float): Salary threshold for repayments.
+        repayment_rate (float): Repayment rate as a decimal (e.g., 0.09 for 9%).
+        loan_term_years (int): Loan term in years.
+        salary (float): Salary of the person each year (could vary with growth).
+        annual_growth_mean (float): The average annual salary growth.
+        annual_growth_std (float): The standard deviation of the annual salary growth.
+        iterations (int): The number of Monte Carlo simulations.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+        sampler (str): How salary growth shocks are drawn, 'random', 'antithetic' or 'halton'; see
+            sampling_utils.normal_shocks.
+
+    Returns:
+        avg_interest_paid (float): The average interest paid across all simulations.
+    """
+    growth_shocks = normal_shocks(annual_growth_mean, annual_growth_std, (iterations, loan_term_years), rng, sampler)
+    interest_paid = _student_loan_paths(initial_balance, interest_rate, repayment_threshold, repayment_rate, salary,
+                                        growth_shocks)
+
+    # Calculate the average interest paid
+    avg_interest_paid = float(interest_paid.mean())
+    return avg_interest_paid
+
+
+# Quantiles of the year a loan is cleared reported by simulate_student_loan_outcomes
+PAYOFF_QUANTILES = (0.1, 0.5, 0.9)
+
+
+def _loan_outcomes(interest_paid, payoff_years, loan_term_years):
+    """
+    Summarise student loan paths along their last axis, as returned by simulate_student_loan_outcomes.
+    """
+    return {'interest_paid': interest_paid.mean(axis=-1),
+            # A loan is cleared when it is repaid or, at the end of the term, written off
+            'payoff_year_quantiles': np.moveaxis(np.quantile(np.minimum(payoff_years, loan_term_years),
+                                                             PAYOFF_QUANTILES, axis=-1), 0, -1),
+            'write_off_probability': np.isinf(payoff_years).mean(axis=-1)}
+
+
+def simulate_student_loan_outcomes(initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                                   loan_term_years, salary, annual_growth_mean, annual_growth_std, iterations,
+                                   rng=None):
+    """
+    Simulate student loan repayment as simulate_student_loan does, reporting when loans are cleared as well as the
+    interest paid.
+
+    Parameters:
+        initial_balance ... iterations: As for simulate_student_loan.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+
+    Returns:
+        outcomes (dict): 'interest_paid', the average interest paid; 'payoff_year_quantiles', the PAYOFF_QUANTILES of
+            the year the loan is cleared, counting loans still owing at the end of the term as cleared then; and
+            'write_off_probability', the share of loans still owing at the end of the term.
+    """
+    growth_shocks = np.random.default_rng(rng).normal(annual_growth_mean, annual_growth_std,
+                                                      size=(iterations, loan_term_years))
+    interest_paid, payoff_years = _student_loan_paths(initial_balance, interest_rate, repayment_threshold,
+                                                      repayment_rate, salary, growth_shocks, return_payoff_years=True)
+    outcomes = _loan_outcomes(interest_paid, payoff_years, loan_term_years)
+    return {'interest_paid': float(outcomes['interest_paid']),
+            'payoff_year_quantiles': outcomes['payoff_year_quantiles'],
+            'write_off_probability': float(outcomes['write_off_probability'])}
+
+
+# Step each input of student_loan_sensitivities is moved by, in the input's own units
+SENSITIVITY_STEPS = {'initial_balance': 1000, 'interest_rate': 0.01, 'repayment_threshold': 1000,
+                     'repayment_rate': 0.01, 'salary': 1000, 'annual_growth_mean': 0.01, 'annual_growth_std': 0.01}
+
+
+def student_loan_sensitivities(initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years,
+                               salary, annual_growth_mean, annual_growth_std, iterations, steps=None, rng=None):
+    """
+    How much the expected interest paid changes when each input moves by a step, with a standard error.
+
+    Each effect is a central difference: the input is set half a step below and half a step above its value, or from
+    zero if that would make it negative (only salary growth may be). All of these scenarios and the baseline share
+    one standard normal shock matrix and run through the engine as a single batch. Each path's difference then
+    reflects the input rather than sampling noise. Its spread across paths gives the standard error, which is far
+    smaller than that of separate runs. Differences are used rather than pathwise derivatives because interest
+    paid jumps when a salary crosses the threshold, which a pathwise derivative would miss.
+
+    Parameters:
+        initial_balance ... iterations: As for simulate_student_loan.
+        steps (dict): Step for each input to report, SENSITIVITY_STEPS if None.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+
+    Returns:
+        results (dict): 'interest_paid', the baseline average; 'parameters', the inputs in steps order; and arrays in
+            that order of each 'step', the 'effect' on the average interest paid of moving the input up by its step,
+            the effect's 'std_error' and the 'derivative' per unit of input. Also 'paths', the number simulated.
+    """
+    steps = SENSITIVITY_STEPS if steps is None else steps
+    baseline = {'initial_balance': initial_balance, 'interest_rate': interest_rate,
+                'repayment_threshold': repayment_threshold, 'repayment_rate': repayment_rate, 'salary': salary,
+                'annual_growth_mean': annual_growth_mean, 'annual_growth_std': annual_growth_std}
+    names = list(steps)
+    step = np.array([float(steps[name]) for name in names])
+
+    # Scenario 0 is the baseline; scenarios 2i + 1 and 2i + 2 move input i down and up
+    values = {name: np.full(1 + 2 * len(names), float(value)) for name, value in baseline.items()}
+    for i, name in enumerate(names):
+        low = baseline[name] - step[i] / 2
+        values[name][2 * i + 1] = low if name == 'annual_growth_mean' else max(low, 0)
+        values[name][2 * i + 2] = baseline[name] + step[i] / 2
+    widths = np.array([values[name][2 * i + 2] - values[name][2 * i + 1] for i, name in enumerate(names)])
+
+    standard_normals = np.random.default_rng(rng).standard_normal((iterations, loan_term_years))
+    growth_shocks = values['annual_growth_mean'][:, None, None] + \
+        values['annual_growth_std'][:, None, None] * standard_normals
+    interest_paid = _student_loan_paths(values['initial_balance'][:, None], values['interest_rate'][:, None],
+                                        values['repayment_threshold'][:, None], values['repayment_rate'][:, None],
+                                        values['salary'][:, None], growth_shocks)
+
+    # Per-path change over a full step, scaled up where the lower scenario was cut short at zero
+    differences = (interest_paid[2::2] - interest_paid[1::2]) * (step / widths)[:, None]
+    effect = differences.mean(axis=1)
+    std_error = differences.std(axis=1, ddof=1) / np.sqrt(iterations) if iterations > 1 else np.zeros_like(effect)
+    return {'interest_paid': float(interest_paid[0].mean()), 'parameters': names, 'step': step, 'effect': effect,
+            'std_error': std_error, 'derivative': effect / step, 'paths': interest_paid.size}
+
+
+# Independently shifted Halton blocks per batch in estimate_student_loan_interest, giving enough independent
+# replicates in the first batch for a usable standard error
+HALTON_REPLICATES = 8
+
+
+def estimate_student_loan_interest(initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                                   loan_term_years, salary, annual_growth_mean, annual_growth_std, tolerance,
+                                   time_budget=10.0, batch_size=10000, max_iterations=10000000, confidence=0.95,
+                                   rng=None, sampler='antithetic'):
+    """
+    Estimate the average interest paid to a target precision, running batches of paths until the standard error of
+    the estimate is below tolerance, the time budget runs out or max_iterations paths have been used.
+
+    The standard error is computed from independent units: single paths for the 'random' sampler, mirrored pairs for
+    'antithetic', and for 'halton', whose points are not independent, the means of HALTON_REPLICATES independently
+    shifted blocks per batch.
+
+    Parameters:
+        initial_balance ... annual_growth_std: As for simulate_student_loan.
+        tolerance (float): Target standard error of the average interest paid, in pounds.
+        time_budget (float): Seconds to run for at most.
+        batch_size (int): Paths per batch.
+        max_iterations (int): Paths to run at most.
+        confidence (float): Confidence level of the reported interval.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+        sampler (str): How salary growth shocks are drawn, 'random', 'antithetic' or 'halton'.
+
+    Returns:
+        results (dict): 'estimate', 'std_error', 'ci_low', 'ci_high' and 'iterations', the number of paths used.
+    """
+    rng = np.random.default_rng(rng)
+    batch_size += -batch_size % HALTON_REPLICATES  # Keep antithetic pairs and Halton blocks within a batch
+    started = time.perf_counter()
+    units, mean, m2, iterations = 0, 0.0, 0.0, 0
+
+    while True:
+        if sampler == 'halton':
+            block_size = batch_size // HALTON_REPLICATES
+            growth_shocks = np.concatenate([
+                normal_shocks(annual_growth_mean, annual_growth_std, (block_size, loan_term_years), rng, sampler)
+                for _ in range(HALTON_REPLICATES)])
+        else:
+            growth_shocks = normal_shocks(annual_growth_mean, annual_growth_std, (batch_size, loan_term_years), rng,
+                                          sampler)
+        interest_paid = _student_loan_paths(initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                                            salary, growth_shocks)
+        iterations += batch_size
+
+        if sampler == 'antithetic':
+            batch_units = (interest_paid[:batch_size // 2] + interest_paid[batch_size // 2:]) / 2
+        elif sampler == 'halton':
+            batch_units = interest_paid.reshape(HALTON_REPLICATES, -1).mean(axis=1)
+        else:
+            batch_units = interest_paid
+
+        # Merge the batch into the running mean and sum of squared deviations (Chan et al.)
+        batch_mean = batch_units.mean()
+        delta = batch_mean - mean
+        total = units + len(batch_units)
+        mean += delta * len(batch_units) / total
+        m2 += ((batch_units - batch_mean) ** 2).sum() + delta ** 2 * units * len(batch_units) / total
+        units = total
+
+        std_error = np.sqrt(m2 / (units - 1) / units) if units > 1 else np.inf
+        if (std_error <= tolerance or time.perf_counter() - started >= time_budget
+                or iterations >= max_iterations):
+            break
+
+    half_width = norm_ppf(0.5 + confidence / 2) * std_error
+    return {'estimate': float(mean), 'std_error': float(std_error), 'ci_low': float(mean - half_width),
+            'ci_high': float(mean + half_width), 'iterations': iterations}
+
+
+# Life event codes, as stored in the event log returned by simulate_life_event_paths
+LIFE_EVENT_NONE, LIFE_EVENT_PREGNANCY, LIFE_EVENT_LAYOFF, LIFE_EVENT_SICK_LEAVE, LIFE_EVENT_PAYCUT, \
+    LIFE_EVENT_PAYRISE = range(6)
+
+# Probability of each event code given that a life event occurs: pregnancy 30%, layoff 30%, sick leave 20% and a job
+# change 20%, which is a paycut or a payrise with equal probability
+LIFE_EVENT_PROBABILITIES = np.array([0.0, 0.3, 0.3, 0.2, 0.1, 0.1])
+
+# Fraction of a year of interest that accrues on the balance while the event lasts
+LIFE_EVENT_ACCRUAL = np.array([0.0, 0.75, 0.5, 0.25, 0.0, 0.0])
+
+LIFE_EVENT_NAMES = ("None", "Pregnancy", "Layoff", "Sick leave", "Paycut", "Payrise")
+
+# One row per life event. sim is the path index and year is 1-based; magnitude is the fractional salary change and
+# balance_impact the interest the event added to the balance. salary_index is left for callers combining several
+# starting salaries.
+LIFE_EVENT_LOG_DTYPE = np.dtype([('salary_index', np.int16), ('sim', np.int64), ('year', np.int16),
+                                 ('code', np.int8), ('magnitude', np.float32), ('balance_impact', np.float32)])
+
+
+def simulate_life_event_paths(initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years,
+                              salary, annual_growth_mean, annual_growth_std, iterations, simulate_pregnancy=True,
+                              simulate_layoff=True, simulate_sick_leave=True, simulate_job_change=True,
+                              paycut_percentage=20, payrise_percentage=20, life_event_prob=0.1, rng=None):
+    """
+    Simulate student loan repayment with random life events, for every path at once.
+
+    Each path draws a single salary growth rate. Every year interest and repayments are applied as in
+    simulate_student_loan, then a life event may occur (life_event_prob chance per year) which changes the salary
+    and accrues extra interest on the balance. Event occurrence, type and job change outcome are sampled for the whole
+    path x year matrix up front. Repaid paths are compacted out of the working set as in _student_loan_paths.
+
+    Parameters:
+        initial_balance (float): Initial student loan balance.
+        interest_rate (float): Annual interest rate (e.g., 0.05 for 5%).
+        repayment_threshold (float): Salary threshold for repayments.
+        repayment_rate (float): Repayment rate as a decimal (e.g., 0.09 for 9%).
+        loan_term_years (int): Loan term in years.
+        salary (float): Starting salary.
+        annual_growth_mean (float): The average annual salary growth.
+        annual_growth_std (float): The standard deviation of the annual salary growth.
+        iterations (int): The number of Monte Carlo simulations.
+        simulate_pregnancy (bool): Pregnancy events, 9 months with no salary.
+        simulate_layoff (bool): Layoff events, salary halved for 6 months.
+        simulate_sick_leave (bool): Sick leave events, salary reduced to 80% for 3 months.
+        simulate_job_change (bool): Job changes, a paycut or payrise.
+        paycut_percentage (float): Paycut applied by a job change, in percent.
+        payrise_percentage (float): Payrise applied by a job change, in percent.
+        life_event_prob (float): Chance of a life event each year.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+
+    Returns:
+        trajectories (np.ndarray): Loan balance at the end of each year, shape (iterations, loan_term_years). Balances
+            are floored at zero and years after the loan is repaid are NaN.
+        interest_paid (np.ndarray): Total interest paid on each path.
+        growth_rates (np.ndarray): The annual salary growth rate drawn for each path.
+        event_log (np.ndarray): Every life event that occurred, as a LIFE_EVENT_LOG_DTYPE structured array ordered
+            by year.
+        survival (np.ndarray): Number of paths still owing at the start (index 0) and at the end of each year,
+            length loan_term_years + 1.
+    """
+    rng = np.random.default_rng(rng)
+    growth_rates = rng.normal(annual_growth_mean, annual_growth_std, size=iterations)
+
+    # Sample every life event up front; disabled event types are drawn but have no effect
+    occurs = rng.random((iterations, loan_term_years)) < life_event_prob
+    sampled_codes = np.searchsorted(np.cumsum(LIFE_EVENT_PROBABILITIES)[:-1],
+                                    rng.random((iterations, loan_term_years)), side='right')
+    enabled = np.array([False, simulate_pregnancy, simulate_layoff, simulate_sick_leave, simulate_job_change,
+                        simulate_job_change])
+    sampled_codes = np.where(occurs & enabled[sampled_codes], sampled_codes, LIFE_EVENT_NONE).astype(np.int8)
+
+    salary_multiplier = np.array([1.0, 0.0, 0.5, 0.8, 1 - paycut_percentage / 100, 1 + payrise_percentage / 100])
+    accrual = LIFE_EVENT_ACCRUAL * interest_rate
+
+    interest_paid = np.zeros(iterations)
+    trajectories = np.full((iterations, loan_term_years), np.nan)
+    survival = np.zeros(loan_term_years + 1, dtype=np.int64)
+    event_logs = []
+
+    # Working set: path numbers of the live paths and their state
+    live = np.arange(iterations) if initial_balance > 0 else np.arange(0)
+    balance = np.full(len(live), float(initial_balance))
+    current_salary = np.full(len(live), float(salary))
+    live_growth = growth_rates[live]
+    live_interest = np.zeros(len(live))
+    survival[0] = len(live)
+
+    for year in range(loan_term_years):
+        active = balance > 0  # Paths stop once the loan is paid off
+        still_owing = np.count_nonzero(active)
+        if not still_owing:
+            break
+        if still_owing < COMPACTION_THRESHOLD * len(live):
+            interest_paid[live] = live_interest
+            live, balance, current_salary, live_growth, live_interest = (
+                values[active] for values in (live, balance, current_salary, live_growth, live_interest))
+            active = np.ones(len(live), dtype=bool)
+
+        above_threshold = active & (current_salary > repayment_threshold)
+        annual_interest = balance * interest_rate
+        live_interest += np.where(above_threshold, annual_interest, 0)
+        repayment = (current_salary - repayment_threshold) * repayment_rate
+        balance = np.where(above_threshold, balance + annual_interest - repayment,
+                           np.where(active, balance + annual_interest, balance))
+
+        # Apply life events
+        codes = np.where(active, sampled_codes[live, year], LIFE_EVENT_NONE)
+        event_interest = balance * accrual[codes]
+        balance += event_interest
+        current_salary *= salary_multiplier[codes]
+
+        # Record events
+        rows = np.flatnonzero(codes)
+        year_log = np.zeros(len(rows), dtype=LIFE_EVENT_LOG_DTYPE)
+        year_log['sim'] = live[rows]
+        year_log['year'] = year + 1
+        year_log['code'] = codes[rows]
+        year_log['magnitude'] = salary_multiplier[codes[rows]] - 1
+        year_log['balance_impact'] = event_interest[rows]
+        event_logs.append(year_log)
+
+        # Track trajectory and how many paths are left
+        trajectories[live[active], year] = np.maximum(balance[active], 0)
+        survival[year + 1] = np.count_nonzero(balance > 0)
+
+        # Update salary for the next year
+        current_salary *= 1 + live_growth
+
+    interest_paid[live] = live_interest
+    event_log = np.concatenate(event_logs) if event_logs else np.zeros(0, dtype=LIFE_EVENT_LOG_DTYPE)
+    return trajectories, interest_paid, growth_rates, event_log, survival
+
+
+def format_life_event(event):
+    """
+    Describe one row of a life event log.
+
+    Parameters:
+        event (np.void): A LIFE_EVENT_LOG_DTYPE row.
+
+    Returns:
+        message (str): Description of the event.
+    """
+    code = event['code']
+    if code == LIFE_EVENT_PREGNANCY:
+        return "Pregnancy event - no salary for 9 months."
+    if code == LIFE_EVENT_LAYOFF:
+        return "Layoff event - reduced salary for 6 months."
+    if code == LIFE_EVENT_SICK_LEAVE:
+        return "Sick leave event - reduced salary for 3 months."
+    if code == LIFE_EVENT_PAYCUT:
+        return f"Job change - {abs(event['magnitude']):.0%} paycut."  # abs, so a 0% paycut is not shown as -0%
+    return f"Job change - {event['magnitude']:.0%} payrise."
+
+
+def simulate_student_loan_reference(initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                                    loan_term_years, salary, annual_growth_mean, annual_growth_std, iterations):
+    """
+    Reference pure-Python implementation of simulate_student_loan, stepping one path and one year at a time.
+    Kept to check the vectorised engine against; use simulate_student_loan for real work.
+
     Parameters:
         initial_balance (float): Initial student loan balance.
         interest_rate (float): Annual interest rate (e.g., 0.05 for 5%).
@@ -68,9 +546,185 @@ def simulate_student_loan(initial_balance, interest_rate, repayment_threshold, r
     return avg_interest_paid
 
 
-def simulate_mortgage(lump_sum, mortgage_balance, interest_rate, years):
+def simulate_life_event_paths_reference(initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                                        loan_term_years, salary, annual_growth_mean, annual_growth_std, iterations,
+                                        simulate_pregnancy=True, simulate_layoff=True, simulate_sick_leave=True,
+                                        simulate_job_change=True, paycut_percentage=20, payrise_percentage=20):
     """
-    Simulate the mortgage balance and interest paid over time with a lump sum applied initially.
+    Reference pure-Python implementation of simulate_life_event_paths: the Student Loan Simulation page's original
+    loop, stepping one path and one year at a time and drawing each life event with scalar np.random calls.
+    Kept to check the batched engine against; use simulate_life_event_paths for real work.
+
+    Parameters:
+        initial_balance (float): Initial student loan balance.
+        interest_rate (float): Annual interest rate (e.g., 0.05 for 5%).
+        repayment_threshold (float): Salary threshold for repayments.
+        repayment_rate (float): Repayment rate as a decimal (e.g., 0.09 for 9%).
+        loan_term_years (int): Loan term in years.
+        salary (float): Starting salary.
+        annual_growth_mean (float): The average annual salary growth.
+        annual_growth_std (float): The standard deviation of the annual salary growth.
+        iterations (int): The number of Monte Carlo simulations.
+        simulate_pregnancy (bool): Pregnancy events, 9 months with no salary.
+        simulate_layoff (bool): Layoff events, salary halved for 6 months.
+        simulate_sick_leave (bool): Sick leave events, salary reduced to 80% for 3 months.
+        simulate_job_change (bool): Job changes, a paycut or payrise.
+        paycut_percentage (float): Paycut applied by a job change, in percent.
+        payrise_percentage (float): Payrise applied by a job change, in percent.
+
+    Returns:
+        trajectories (list): Loan balance at the end of each year for each path, until it is repaid.
+        interest_paid (np.ndarray): Total interest paid on each path.
+        growth_rates (np.ndarray): The annual salary growth rate drawn for each path.
+    """
+    def apply_life_events(salary, loan_balance):
+        # Randomly decide if a life event happens this year
+        life_event_prob = 0.1  # 10% chance of a life event per year
+        if np.random.random() < life_event_prob:  # If life event occurs
+            life_event_type = np.random.choice(["pregnancy", "layoff", "sick_leave", "job_change"],
+                                               p=[0.3, 0.3, 0.2, 0.2])
+
+            if life_event_type == "pregnancy" and simulate_pregnancy:
+                # Assume pregnancy lasts for 9 months (about 0.75 years) with no salary
+                salary = 0  # No salary during pregnancy
+                loan_balance += loan_balance * interest_rate * 0.75  # Accrued interest during absence
+            elif life_event_type == "layoff" and simulate_layoff:
+                # Assume being laid off for 6 months
+                salary = salary * 0.5  # Reduced salary (50% of original)
+                loan_balance += loan_balance * interest_rate * 0.5  # Interest accrues during this time
+            elif life_event_type == "sick_leave" and simulate_sick_leave:
+                # Sick leave, no income for 3 months
+                salary = salary * 0.8  # Reduced salary (80% of original)
+                loan_balance += loan_balance * interest_rate * 0.25  # Partial interest accrual during this time
+            elif life_event_type == "job_change" and simulate_job_change:
+                # Apply either a paycut or payrise
+                job_event = np.random.choice(["paycut", "payrise"], p=[0.5, 0.5])  # 50% chance for paycut or payrise
+                if job_event == "paycut":
+                    salary = salary * (1 - paycut_percentage / 100)  # Apply paycut
+                else:
+                    salary = salary * (1 + payrise_percentage / 100)  # Apply payrise
+        return salary, loan_balance
+
+    trajectories = []
+    interest_costs = []
+    growth_rates = []
+
+    for _ in range(iterations):
+        balance = initial_balance
+        current_salary = salary
+        annual_growth_rate = np.random.normal(annual_growth_mean, annual_growth_std)
+        trajectory = []
+        total_interest = 0  # Track total interest for this simulation
+
+        for year in range(1, loan_term_years + 1):
+            if balance <= 0:  # Stop if loan is paid off early
+                break
+
+            # Apply interest for the current year if salary exceeds the repayment threshold
+            if current_salary > repayment_threshold:
+                annual_interest = balance * interest_rate
+                total_interest += annual_interest  # Add the interest to the total interest paid
+
+                # Calculate repayment based on salary
+                repayment = (current_salary - repayment_threshold) * repayment_rate
+
+                # Repayment is first used to pay off interest, then the remaining amount reduces the principal
+                if repayment > annual_interest:
+                    balance -= repayment - annual_interest
+                else:
+                    # If repayment is less than interest, the loan balance just grows
+                    balance += annual_interest - repayment
+            else:
+                # If salary is below the threshold, no repayment occurs, no interest is paid
+                balance += balance * interest_rate
+
+            # Apply life events
+            current_salary, balance = apply_life_events(current_salary, balance)
+
+            # Track trajectory
+            trajectory.append(balance if balance > 0 else 0)
+
+            # Break if loan is fully repaid
+            if balance <= 0:
+                break
+
+            # Update salary for the next year
+            current_salary *= (1 + annual_growth_rate)
+
+        trajectories.append(trajectory)
+        interest_costs.append(total_interest)
+        growth_rates.append(annual_growth_rate)
+
+    return trajectories, np.array(interest_costs), np.array(growth_rates)
+
+
+def simulate_mortgage(lump_sum, mortgage_balance, interest_rate, years, return_schedule=False):
+    """
+    Calculate the interest paid over a repayment mortgage with a lump sum applied initially.
+
+    The monthly payment is fixed, so the total interest is the total paid minus the principal and is computed in
+    closed form rather than month by month. A zero interest rate or a zero-year term pays no interest. Any argument
+    may be an array, in which case they are broadcast together and one total is returned per element.
+
+    Parameters:
+        lump_sum (float or array): Amount applied to reduce the mortgage balance.
+        mortgage_balance (float or array): Initial mortgage balance before applying the lump sum.
+        interest_rate (float or array): Annual interest rate (e.g., 0.05 for 5%).
+        years (int or array): Total mortgage term in years.
+        return_schedule (bool): Also return the month-by-month amortization schedule.
+
+    Returns:
+        total_interest_paid (float or np.ndarray): Total interest paid over the mortgage term.
+        schedule (dict): Only if return_schedule is set. Arrays of 'payment', 'interest', 'principal' and 'balance'
+            for each month, with shape (..., months) for the longest term; months past the end of a term are zero.
+    """
+    # Apply the lump sum to reduce the mortgage balance
+    remaining_balance = np.maximum(np.asarray(mortgage_balance, dtype=float) - lump_sum, 0)
+
+    # Calculate the monthly interest rate and total number of payments
+    monthly_interest_rate = np.asarray(interest_rate, dtype=float) / 12
+    total_months = np.asarray(years) * 12
+    remaining_balance, monthly_interest_rate, total_months = np.broadcast_arrays(remaining_balance,
+                                                                                 monthly_interest_rate, total_months)
+
+    # Calculate monthly repayment using the amortization formula, or an even split of the balance at a zero rate
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + monthly_interest_rate) ** total_months
+        monthly_repayment = np.where(monthly_interest_rate == 0, remaining_balance / total_months,
+                                     remaining_balance * monthly_interest_rate * growth / (growth - 1))
+    monthly_repayment = np.where(total_months > 0, monthly_repayment, 0)
+
+    # Every payment beyond the principal is interest
+    total_interest_paid = np.maximum(total_months * monthly_repayment - remaining_balance, 0)
+    if total_interest_paid.ndim == 0:
+        total_interest_paid = float(total_interest_paid)
+
+    if not return_schedule:
+        return total_interest_paid
+
+    months = np.arange(1, int(total_months.max(initial=0)) + 1)
+    in_term = months <= total_months[..., None]
+    rate = monthly_interest_rate[..., None]
+    repayment = monthly_repayment[..., None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + rate) ** (months - 1)
+        opening_balance = np.where(rate == 0, remaining_balance[..., None] - repayment * (months - 1),
+                                   remaining_balance[..., None] * growth - repayment * (growth - 1) / rate)
+    opening_balance = np.where(in_term, np.maximum(opening_balance, 0), 0)
+    interest = opening_balance * rate
+    principal = np.where(in_term, repayment - interest, 0)
+    schedule = {
+        'payment': np.where(in_term, repayment, 0),
+        'interest': interest,
+        'principal': principal,
+        'balance': np.maximum(opening_balance - principal, 0),
+    }
+    return total_interest_paid, schedule
+
+
+def simulate_mortgage_reference(lump_sum, mortgage_balance, interest_rate, years):
+    """
+    Reference month-by-month implementation of simulate_mortgage, kept to check the closed form against.
 
     Parameters:
         lump_sum (float): Amount applied to reduce the mortgage balance.
@@ -111,7 +765,166 @@ def simulate_mortgage(lump_sum, mortgage_balance, interest_rate, years):
     return total_interest_paid
 
 
-def simulate_index_fund(lump_sum, annual_return_mean, annual_return_std, years, iterations):
+def _index_fund_terminal_values(lump_sum, annual_return_mean, annual_return_std, years, iterations, rng):
+    """
+    Draw the whole (iterations, years) return matrix at once and compound it into the value of each path at the end
+    of the investment horizon.
+    """
+    annual_returns = np.random.default_rng(rng).normal(annual_return_mean, annual_return_std, size=(iterations, years))
+    return lump_sum * np.prod(1 + annual_returns, axis=1)
+
+
+def simulate_index_fund(lump_sum, annual_return_mean, annual_return_std, years, iterations, rng=None):
+    """
+    Simulate a lump sum invested in an index fund with normally distributed annual returns.
+
+    Parameters:
+        lump_sum (float): Amount invested at the start.
+        annual_return_mean (float): The average annual return (e.g., 0.07 for 7%).
+        annual_return_std (float): The standard deviation of the annual return.
+        years (int): Investment horizon in years.
+        iterations (int): The number of Monte Carlo simulations.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+
+    Returns:
+        avg_gains (float): The average gain over the lump sum across all simulations.
+    """
+    avg_future_value = _index_fund_terminal_values(lump_sum, annual_return_mean, annual_return_std, years,
+                                                   iterations, rng).mean()
+    avg_gains = float(avg_future_value - lump_sum)  # Subtract the initial lump sum to calculate gains
+    return avg_gains
+
+
+def simulate_index_fund_distribution(lump_sum, annual_return_mean, annual_return_std, years, iterations,
+                                     percentiles=(5, 25, 50, 75, 95), rng=None):
+    """
+    Simulate the full distribution of an index fund investment rather than just its average.
+
+    Parameters:
+        lump_sum (float): Amount invested at the start.
+        annual_return_mean (float): The average annual return (e.g., 0.07 for 7%).
+        annual_return_std (float): The standard deviation of the annual return.
+        years (int): Investment horizon in years.
+        iterations (int): The number of Monte Carlo simulations.
+        percentiles (tuple): Percentiles of the gain to report.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+
+    Returns:
+        results (dict): 'terminal_values' for every path, 'mean_gain', 'percentiles' mapping each requested
+            percentile to its gain, and 'probability_of_loss', the share of paths ending below the lump sum.
+    """
+    terminal_values = _index_fund_terminal_values(lump_sum, annual_return_mean, annual_return_std, years, iterations,
+                                                  rng)
+    gains = terminal_values - lump_sum
+    return {
+        'terminal_values': terminal_values,
+        'mean_gain': float(gains.mean()),
+        'percentiles': {p: float(v) for p, v in zip(percentiles, np.percentile(gains, percentiles))},
+        'probability_of_loss': float((gains < 0).mean()),
+    }
+
+
+def expected_index_fund_gain(lump_sum, annual_return_mean, years):
+    """
+    Exact expected gain of an index fund investment, without sampling.
+
+    Annual returns are independent, so the expected value of their product is the product of their expectations,
+    lump_sum * (1 + annual_return_mean) ** years. The volatility does not affect the mean.
+
+    Parameters:
+        lump_sum (float or array): Amount invested at the start.
+        annual_return_mean (float or array): The average annual return (e.g., 0.07 for 7%).
+        years (int or array): Investment horizon in years.
+
+    Returns:
+        expected_gains (float or np.ndarray): The expected gain over the lump sum.
+    """
+    expected_gains = lump_sum * ((1 + np.asarray(annual_return_mean, dtype=float)) ** years - 1)
+    return float(expected_gains) if np.ndim(expected_gains) == 0 else expected_gains
+
+
+def simulate_invest_vs_repay(lump_sum, initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                             loan_term_years, salary, annual_growth_mean, annual_growth_std, annual_return_mean,
+                             annual_return_std, investment_horizon, correlation, iterations,
+                             percentiles=(5, 25, 50, 75, 95), rng=None):
+    """
+    Compare investing a lump sum in an index fund with using it to pay down the student loan, path by path.
+
+    Each path draws a year of salary growth and a year of market returns together, as standard normals correlated
+    through the Cholesky factor [[1, 0], [correlation, sqrt(1 - correlation ** 2)]] of [[1, correlation],
+    [correlation, 1]], written out so perfectly correlated inputs work too. Salary growth and equity returns can then
+    fall in the same bad years. Both strategies are simulated on the same paths. Repaying reduces the starting
+    balance by as much of the lump sum as it covers; any remainder is invested under both strategies, so it cancels.
+    Investing keeps that amount in the fund instead. The per-path advantage of investing is what it grows to in the
+    fund less the repayments that repaying it would save on the same salary path. The saving comes from the
+    repayments actually made under each strategy, not the amount repaid plus interest. When the loan would be written
+    off anyway, repaying it early saves less than it costs, and can save nothing at all. Timing and discounting are
+    not counted, as elsewhere in the app.
+
+    Pairing the strategies on shared paths removes the noise the two loan simulations have in common, and the sign of
+    each path's advantage gives the probability that investing comes out ahead. The mean advantage is further
+    corrected with the exact expected fund gain as a control variate, leaving mostly the loan's sampling error.
+
+    Parameters:
+        lump_sum (float): Amount available to invest or repay.
+        initial_balance ... annual_growth_std: As for simulate_student_loan.
+        annual_return_mean (float): The average annual return (e.g., 0.07 for 7%).
+        annual_return_std (float): The standard deviation of the annual return.
+        investment_horizon (int): Investment horizon in years.
+        correlation (float): Correlation between a year's salary growth and market return, between -1 and 1.
+        iterations (int): The number of Monte Carlo paths.
+        percentiles (tuple): Percentiles of the advantage to report.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+
+    Returns:
+        results (dict): 'advantage', the per-path gain from investing rather than repaying, with its 'percentiles',
+            and the control-variate 'mean_advantage' and its 'std_error'; 'probability_invest_better', the share of
+            paths where investing comes out ahead; the averages of its parts, 'mean_fund_value' and
+            'mean_repayments_saved'; and 'mean_fund_gain' and 'mean_interest_saved'.
+    """
+    if not -1 <= correlation <= 1:
+        raise ValueError(f"correlation must be between -1 and 1, got {correlation}")
+    years = max(loan_term_years, investment_horizon)
+    cholesky = np.array([[1.0, 0.0], [correlation, np.sqrt(1 - correlation ** 2)]])
+    shocks = np.random.default_rng(rng).standard_normal((iterations, years, 2)) @ cholesky.T
+    growth_shocks = annual_growth_mean + annual_growth_std * shocks[:, :loan_term_years, 0]
+    annual_returns = annual_return_mean + annual_return_std * shocks[:, :investment_horizon, 1]
+
+    # Both strategies' loans in one pass on the same salary paths: the full balance, and what is left after repaying
+    repaid = min(lump_sum, initial_balance)
+    interest_paid, repayments = _student_loan_paths(np.array([initial_balance, initial_balance - repaid])[:, None],
+                                                    interest_rate, repayment_threshold, repayment_rate, salary,
+                                                    growth_shocks, return_repayments=True)
+    interest_saved = interest_paid[0] - interest_paid[1]
+    repayments_saved = repayments[0] - repayments[1]
+
+    # Only the amount that would have gone to the loan is invested differently between the two strategies
+    fund_gain = repaid * (np.prod(1 + annual_returns, axis=1) - 1)
+    advantage = repaid + fund_gain - repayments_saved
+
+    # The fund's expected gain is known exactly, so use it as a control variate for the mean: the fund's sampling
+    # error, which dominates the spread of the advantage, is subtracted out path by path
+    gain_variance = fund_gain.var()
+    beta = np.cov(advantage, fund_gain, bias=True)[0, 1] / gain_variance if gain_variance > 0 else 0.0
+    controlled = advantage - beta * (fund_gain - expected_index_fund_gain(repaid, annual_return_mean,
+                                                                          investment_horizon))
+    return {
+        'advantage': advantage,
+        'mean_advantage': float(controlled.mean()),
+        'std_error': float(controlled.std(ddof=1) / np.sqrt(iterations)) if iterations > 1 else 0.0,
+        'percentiles': {p: float(v) for p, v in zip(percentiles, np.percentile(advantage, percentiles))},
+        'probability_invest_better': float((advantage > 0).mean()),
+        'mean_fund_value': float(repaid + fund_gain.mean()),
+        'mean_repayments_saved': float(repayments_saved.mean()),
+        'mean_fund_gain': float(fund_gain.mean()),
+        'mean_interest_saved': float(interest_saved.mean()),
+    }
+
+
+def simulate_index_fund_reference(lump_sum, annual_return_mean, annual_return_std, years, iterations):
+    """
+    Reference path-by-path implementation of simulate_index_fund, kept to check the batched engine against.
+    """
     total_future_value = 0
 
     for _ in range(iterations):
@@ -124,4 +937,177 @@ def simulate_index_fund(lump_sum, annual_return_mean, annual_return_std, years,
 
     avg_future_value = total_future_value / iterations
     avg_gains = avg_future_value - lump_sum  # Subtract the initial lump sum to calculate gains
-    return avg_gains
\ No newline at end of file
+    return avg_gains
+
+
+def simulate_parameter_grid(salaries, student_loan_rates, mortgage_rates, initial_balance, repayment_threshold,
+                            repayment_rate, loan_term_years, annual_growth_mean, annual_growth_std, iterations,
+                            lump_sum, mortgage_balance, mortgage_years, rng=None, common_random_numbers=False):
+    """
+    Compare student loan and mortgage interest over every combination of salary, student loan rate and mortgage rate.
+
+    The student loan only depends on salary and student loan rate, so it is simulated once per pair in a single
+    broadcast pass over paths of shape (salary, sl_rate, iteration). The mortgage only depends on the mortgage rate,
+    so it is computed once per rate. The two are then combined for every cell.
+
+    With common_random_numbers set, every (salary, student loan rate) pair reuses the same (iterations, years) shock
+    matrix. Differences between cells then reflect the parameters rather than sampling noise, which gives a much
+    smoother decision boundary for the same number of iterations.
+
+    Parameters:
+        salaries (array-like): Starting salaries.
+        student_loan_rates (array-like): Student loan interest rates as decimals.
+        mortgage_rates (array-like): Mortgage interest rates as decimals.
+        initial_balance (float): Initial student loan balance.
+        repayment_threshold (float): Salary threshold for student loan repayments.
+        repayment_rate (float): Student loan repayment rate as a decimal.
+        loan_term_years (int): Student loan term in years.
+        annual_growth_mean (float): The average annual salary growth.
+        annual_growth_std (float): The standard deviation of the annual salary growth.
+        iterations (int): The number of Monte Carlo simulations per (salary, student loan rate) pair.
+        lump_sum (float): Amount applied to reduce the mortgage balance.
+        mortgage_balance (float): Initial mortgage balance before applying the lump sum.
+        mortgage_years (int): Total mortgage term in years.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+        common_random_numbers (bool): Share one shock matrix across all cells.
+
+    Returns:
+        results (pd.DataFrame): One row per cell, salary-major, with rates given in percent.
+    """
+    salaries = np.asarray(salaries, dtype=float)
+    student_loan_rates = np.asarray(student_loan_rates, dtype=float)
+    mortgage_rates = np.asarray(mortgage_rates, dtype=float)
+
+    # Student loan simulation, averaged over the iteration axis to shape (salary, sl_rate)
+    rng = np.random.default_rng(rng)
+    if common_random_numbers:
+        growth_shocks = rng.normal(annual_growth_mean, annual_growth_std, size=(1, 1, iterations, loan_term_years))
+    else:
+        growth_shocks = rng.normal(annual_growth_mean, annual_growth_std,
+                                   size=(len(salaries), len(student_loan_rates), iterations, loan_term_years))
+    sl_interest = _student_loan_paths(initial_balance, student_loan_rates[None, :, None], repayment_threshold,
+                                      repayment_rate, salaries[:, None, None], growth_shocks).mean(axis=-1)
+
+    # Mortgage interest, once per mortgage rate
+    m_interest = simulate_mortgage(lump_sum, mortgage_balance, mortgage_rates, mortgage_years)
+
+    return _parameter_grid_frame(salaries, student_loan_rates, mortgage_rates, sl_interest, m_interest, lump_sum)
+
+
+def _parameter_grid_frame(salaries, student_loan_rates, mortgage_rates, sl_interest, m_interest, lump_sum):
+    """
+    Combine student loan interest of shape (salary, sl_rate) and mortgage interest of shape (mortgage_rate,) into the
+    tidy results frame returned by simulate_parameter_grid.
+    """
+    salary_grid, sl_rate_grid, m_rate_grid = np.meshgrid(salaries, student_loan_rates, mortgage_rates, indexing='ij')
+    sl_interest = np.broadcast_to(sl_interest[:, :, None], salary_grid.shape).ravel()
+    m_interest = np.broadcast_to(m_interest[None, None, :], salary_grid.shape).ravel()
+
+    import pandas as pd  # Imported here so pages that never build the grid do not pay for loading pandas
+
+    return pd.DataFrame({
+        'salary': salary_grid.ravel(),
+        'student_loan_rate': sl_rate_grid.ravel() * 100,
+        'mortgage_rate': m_rate_grid.ravel() * 100,
+        'lump_sum': lump_sum,
+        'student_loan_interest': sl_interest,
+        'mortgage_interest': m_interest,
+        'difference': sl_interest - m_interest,
+        'better_choice': np.where(sl_interest > m_interest, 'Student Loan', 'Mortgage')
+    })
+
+
+def _break_even_rates(targets, lump_sum, mortgage_balance, mortgage_years, bounds, tolerance):
+    """
+    Mortgage rates at which the mortgage interest equals each target, by bisection. Targets the mortgage cannot reach
+    within the bounds give -inf if even the lowest rate costs more, and inf if even the highest rate costs less.
+
+    Returns:
+        rates (np.ndarray): One rate per target.
+        evaluations (int): Number of mortgage interest evaluations.
+    """
+    low, high = np.full(targets.shape, float(bounds[0])), np.full(targets.shape, float(bounds[1]))
+    below_low = simulate_mortgage(lump_sum, mortgage_balance, low, mortgage_years) > targets
+    above_high = simulate_mortgage(lump_sum, mortgage_balance, high, mortgage_years) < targets
+
+    # Mortgage interest rises with the rate, so each halving keeps the side where it crosses the target
+    steps = max(int(np.ceil(np.log2((bounds[1] - bounds[0]) / tolerance))), 0)
+    for _ in range(steps):
+        middle = (low + high) / 2
+        too_low = simulate_mortgage(lump_sum, mortgage_balance, middle, mortgage_years) < targets
+        low, high = np.where(too_low, middle, low), np.where(too_low, high, middle)
+
+    rates = np.where(below_low, -np.inf, np.where(above_high, np.inf, (low + high) / 2))
+    return rates, (steps + 2) * targets.size
+
+
+def break_even_mortgage_rates(salary, student_loan_rates, initial_balance, repayment_threshold, repayment_rate,
+                              loan_term_years, annual_growth_mean, annual_growth_std, iterations, lump_sum,
+                              mortgage_balance, mortgage_years, mortgage_rate_bounds=(0.0, 0.15), tolerance=1e-5,
+                              refine_resolution=None, max_student_loan_rates=200, rng=None):
+    """
+    The mortgage rate at which the lump sum is equally well spent on either loan, for each student loan rate: where
+    the difference simulate_parameter_grid reports, student loan interest minus mortgage interest, crosses zero.
+
+    Every student loan rate is simulated on the same (iterations, years) salary growth shocks, so differences between
+    rates are free of sampling noise and the curve is smooth. Mortgage interest is closed form and rises with its
+    rate, so each break-even rate is bracketed by mortgage_rate_bounds and bisected to within tolerance, rather than
+    located between the cells of a grid.
+
+    With refine_resolution set, student loan rates are added halfway between neighbours more than refine_resolution
+    apart whose break-even rates also differ by more than it, including where the break-even leaves the bounds,
+    until the curve is resolved or max_student_loan_rates have been simulated. Only those new rates are simulated,
+    on the same shocks.
+
+    Parameters:
+        salary (float): Starting salary.
+        student_loan_rates (array-like): Student loan interest rates as decimals.
+        initial_balance ... annual_growth_std: As for simulate_parameter_grid.
+        iterations (int): The number of Monte Carlo simulations per student loan rate.
+        lump_sum, mortgage_balance, mortgage_years: As for simulate_parameter_grid.
+        mortgage_rate_bounds (tuple): Lowest and highest mortgage rate searched.
+        tolerance (float): Width the bracket around each break-even rate is bisected down to.
+        refine_resolution (float): Largest step in either rate allowed between neighbouring points of the curve, or
+            None to solve only the student loan rates given.
+        max_student_loan_rates (int): Most student loan rates simulated when refining.
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+
+    Returns:
+        results (dict): Arrays sorted by student loan rate: 'student_loan_rate'; 'student_loan_interest' and its
+            'std_error'; 'break_even_rate', -inf where the mortgage costs more even at the lowest rate searched and
+            inf where it costs less even at the highest; and 'break_even_low' and 'break_even_high', the break-even
+            rates for the ends of the 95% confidence interval of the student loan interest. Also 'paths', the number
+            of student loan paths simulated, and 'mortgage_evaluations'.
+    """
+    growth_shocks = np.random.default_rng(rng).normal(annual_growth_mean, annual_growth_std,
+                                                      size=(iterations, loan_term_years))
+    columns = {name: np.empty(0) for name in ('student_loan_rate', 'student_loan_interest', 'std_error',
+                                              'break_even_rate', 'break_even_low', 'break_even_high')}
+    evaluations = 0
+    new_rates = np.unique(np.asarray(student_loan_rates, dtype=float))
+    while len(new_rates):
+        interest_paid = _student_loan_paths(initial_balance, new_rates[:, None], repayment_threshold, repayment_rate,
+                                            salary, growth_shocks)
+        interest = interest_paid.mean(axis=1)
+        std_error = interest_paid.std(axis=1, ddof=1) / np.sqrt(iterations) if iterations > 1 \
+            else np.zeros_like(interest)
+        targets = np.concatenate([interest, interest - 1.96 * std_error, interest + 1.96 * std_error])
+        rates, count = _break_even_rates(targets, lump_sum, mortgage_balance, mortgage_years, mortgage_rate_bounds,
+                                         tolerance)
+        evaluations += count
+        for name, values in zip(columns, (new_rates, interest, std_error, *np.split(rates, 3))):
+            columns[name] = np.concatenate([columns[name], values])
+        order = np.argsort(columns['student_loan_rate'])
+        columns = {name: values[order] for name, values in columns.items()}
+
+        if refine_resolution is None:
+            break
+        # Halve the gaps the break-even rate jumps across, while they are wider than the resolution themselves
+        student_loan_rate, break_even = columns['student_loan_rate'], columns['break_even_rate']
+        with np.errstate(invalid='ignore'):
+            jumps = np.abs(np.diff(break_even)) > refine_resolution
+        gaps = np.flatnonzero(jumps & (np.diff(student_loan_rate) > refine_resolution))
+        gaps = gaps[:max(max_student_loan_rates - len(student_loan_rate), 0)]
+        new_rates = (student_loan_rate[gaps] + student_loan_rate[gaps + 1]) / 2
+
+    return dict(columns, paths=len(columns['student_loan_rate']) * iterations, mortgage_evaluations=evaluations)
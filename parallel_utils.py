@@ -0,0 +1,333 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from loan_utils import _student_loan_paths, _parameter_grid_frame, simulate_life_event_paths, simulate_mortgage
+from sampling_utils import normal_shocks
+from streaming_utils import LoanPathStats
+
+# Paths simulated per task. Jobs are always split the same way, and each chunk gets its own child of the job's
+# SeedSequence, so results for a given seed do not depend on how many workers run the chunks.
+DEFAULT_CHUNK_SIZE = 10000
+
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+
+def default_workers():
+    """
+    Worker count from the LOANCARLO_WORKERS environment variable, defaulting to every core.
+    """
+    return int(os.environ.get('LOANCARLO_WORKERS', os.cpu_count() or 1))
+
+
+def get_executor(max_workers):
+    """
+    Shared process pool, created on first use and kept for later jobs so workers only pay their start-up once.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # Spawned workers only import loan_utils, never the Streamlit script or its threads
+            _executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_workers = max_workers
+        return _executor
+
+
+def _discard_executor(executor):
+    """
+    Forget a broken pool so the next job starts a fresh one instead of failing on it too.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is executor:
+            _executor, _executor_workers = None, None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def imap_chunks(func, tasks, max_workers=None):
+    """
+    Run func over tasks on the process pool, yielding results in task order as they become available.
+
+    Falls back to running in this process when there is only one worker or one task, or if the pool cannot be started
+    or breaks part way, for instance because a worker was killed. Then only the tasks whose results have not been
+    yielded yet are run here; each task carries its own seed, so the results are the same as the pool's.
+
+    Parameters:
+        func (callable): Module-level function taking a single task.
+        tasks (list): Picklable task arguments.
+        max_workers (int): Number of worker processes, default_workers() if None.
+
+    Yields:
+        result: func(task) for each task.
+    """
+    max_workers = default_workers() if max_workers is None else max_workers
+    if max_workers <= 1 or len(tasks) <= 1:
+        yield from (func(task) for task in tasks)
+        return
+    executor = None
+    try:
+        executor = get_executor(max_workers)
+        futures = [executor.submit(func, task) for task in tasks]
+    except (BrokenProcessPool, OSError):
+        if executor is not None:
+            _discard_executor(executor)
+        yield from (func(task) for task in tasks)
+        return
+
+    try:
+        for index, future in enumerate(futures):
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                _discard_executor(executor)
+                yield from (func(task) for task in tasks[index:])
+                return
+            yield result
+    finally:
+        for future in futures:  # Nothing left to wait for if the caller stops early or a task raised
+            future.cancel()
+
+
+def map_chunks(func, tasks, max_workers=None):
+    """
+    imap_chunks collected into a list.
+    """
+    return list(imap_chunks(func, tasks, max_workers))
+
+
+def seed_sequence(seed):
+    """
+    SeedSequence for a job seed, which may be None, an int, a SeedSequence or a Generator to draw the seed from.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(int(seed.integers(2 ** 63)))
+    return np.random.SeedSequence(seed)
+
+
+def _workers_for(total_paths, max_workers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Small jobs finish faster in this process than they take to ship to the pool.
+    """
+    return 1 if total_paths <= chunk_size else max_workers
+
+
+def _chunk_sizes(iterations, chunk_size):
+    return [min(chunk_size, iterations - start) for start in range(0, iterations, chunk_size)]
+
+
+def _student_loan_chunk(task):
+    """
+    Total interest paid over one chunk of student loan paths.
+    """
+    (initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years, salary, annual_growth_mean,
+     annual_growth_std, paths, chunk_seed) = task
+    growth_shocks = normal_shocks(annual_growth_mean, annual_growth_std, (paths, loan_term_years), chunk_seed)
+    return _student_loan_paths(initial_balance, interest_rate, repayment_threshold, repayment_rate, salary,
+                               growth_shocks).sum()
+
+
+def parallel_simulate_student_loan(initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                                   loan_term_years, salary, annual_growth_mean, annual_growth_std, iterations,
+                                   seed=None, max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    simulate_student_loan with the iterations split into chunks across a process pool.
+
+    Parameters:
+        initial_balance ... iterations: As for simulate_student_loan.
+        seed (int, SeedSequence or np.random.Generator): Seed for the job; fresh entropy is used if None.
+        max_workers (int): Number of worker processes, default_workers() if None.
+        chunk_size (int): Paths per task.
+
+    Returns:
+        avg_interest_paid (float): The average interest paid across all simulations.
+    """
+    chunks = _chunk_sizes(iterations, chunk_size)
+    seed_sequences = seed_sequence(seed).spawn(len(chunks))
+    tasks = [(initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years, salary,
+              annual_growth_mean, annual_growth_std, paths, chunk_seed)
+             for paths, chunk_seed in zip(chunks, seed_sequences)]
+    max_workers = _workers_for(iterations, max_workers, chunk_size)
+    return float(sum(map_chunks(_student_loan_chunk, tasks, max_workers)) / iterations)
+
+
+def _life_event_chunk(task):
+    """
+    simulate_life_event_paths over one chunk of paths.
+    """
+    args, kwargs, chunk_seed = task
+    return simulate_life_event_paths(*args, rng=np.random.default_rng(chunk_seed), **kwargs)
+
+
+def parallel_life_event_paths(salaries, initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                              loan_term_years, annual_growth_mean, annual_growth_std, iterations, seed=None,
+                              max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE, **life_events):
+    """
+    simulate_life_event_paths for several starting salaries, with every salary's paths split into chunks across a
+    process pool.
+
+    Parameters:
+        salaries (list): Starting salaries, one panel each.
+        initial_balance ... iterations: As for simulate_life_event_paths.
+        seed (int, SeedSequence or np.random.Generator): Seed for the job; fresh entropy is used if None.
+        max_workers (int): Number of worker processes, default_workers() if None.
+        chunk_size (int): Paths per task.
+        **life_events: Life event options passed on to simulate_life_event_paths.
+
+    Returns:
+        results (list): One (trajectories, interest_paid, growth_rates, event_log, survival) tuple per salary. Event
+            log rows carry the salary's index and path numbers across the whole run.
+    """
+    chunks = _chunk_sizes(iterations, chunk_size)
+    salary_seeds = seed_sequence(seed).spawn(len(salaries))
+    tasks = []
+    for salary, salary_seed in zip(salaries, salary_seeds):
+        for paths, chunk_seed in zip(chunks, salary_seed.spawn(len(chunks))):
+            args = (initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years, salary,
+                    annual_growth_mean, annual_growth_std, paths)
+            tasks.append((args, life_events, chunk_seed))
+
+    max_workers = _workers_for(len(salaries) * iterations, max_workers, chunk_size)
+    chunk_results = map_chunks(_life_event_chunk, tasks, max_workers)
+
+    # Stitch each salary's chunks back together along the path axis
+    results = []
+    for salary_index, start in enumerate(range(0, len(chunk_results), len(chunks))):
+        salary_chunks = chunk_results[start:start + len(chunks)]
+        for first_sim, (_, _, _, event_log, _) in zip(np.cumsum([0] + chunks[:-1]), salary_chunks):
+            event_log['sim'] += first_sim
+            event_log['salary_index'] = salary_index
+        *paths, survival = zip(*salary_chunks)
+        results.append(tuple(np.concatenate(arrays) for arrays in paths) + (np.sum(survival, axis=0),))
+    return results
+
+
+def _life_event_stats_chunk(task):
+    """
+    Streaming summary of one chunk of simulate_life_event_paths.
+    """
+    args, kwargs, chunk_seed, first_sim, salary_index, reservoir_size = task
+    rng = np.random.default_rng(chunk_seed)
+    stats = LoanPathStats(args[4], reservoir_size)
+    stats.update(*simulate_life_event_paths(*args, rng=rng, **kwargs), first_sim=first_sim, rng=rng,
+                 salary_index=salary_index)
+    return stats
+
+
+def iter_life_event_stats(salaries, initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                          loan_term_years, annual_growth_mean, annual_growth_std, iterations, seed=None,
+                          max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE, reservoir_size=1000, **life_events):
+    """
+    parallel_life_event_stats, yielding the summaries so far each time another chunk of every salary has been folded
+    in, so results can be shown while a large run is still going.
+
+    Chunks are seeded as in parallel_life_event_stats and each salary's are folded in the same order, so the last
+    summaries yielded are exactly the ones it returns. Closing the generator cancels the chunks that have not started.
+
+    Parameters:
+        salaries ... **life_events: As for parallel_life_event_stats.
+
+    Yields:
+        paths_done (int): Paths simulated so far for each salary, starting with 0 before any chunk has run.
+        results (list): One LoanPathStats per salary. The same objects are yielded each time, updated in place.
+    """
+    chunks = _chunk_sizes(iterations, chunk_size)
+    salary_seeds = seed_sequence(seed).spawn(len(salaries))
+    chunk_seeds = [salary_seed.spawn(len(chunks)) for salary_seed in salary_seeds]
+
+    # Every salary's first chunk, then every salary's second, and so on, so all the salaries sharpen together
+    tasks = []
+    for chunk_index, (paths, first_sim) in enumerate(zip(chunks, np.cumsum([0] + chunks[:-1]))):
+        for salary_index, salary in enumerate(salaries):
+            args = (initial_balance, interest_rate, repayment_threshold, repayment_rate, loan_term_years, salary,
+                    annual_growth_mean, annual_growth_std, paths)
+            tasks.append((args, life_events, chunk_seeds[salary_index][chunk_index], int(first_sim), salary_index,
+                          reservoir_size))
+
+    max_workers = _workers_for(len(salaries) * iterations, max_workers, chunk_size)
+    results = [LoanPathStats(loan_term_years, reservoir_size) for _ in salaries]
+    yield 0, results
+    for task_index, chunk_stats in enumerate(imap_chunks(_life_event_stats_chunk, tasks, max_workers)):
+        results[task_index % len(salaries)].merge(chunk_stats)
+        if (task_index + 1) % len(salaries) == 0:
+            yield sum(chunks[:(task_index + 1) // len(salaries)]), results
+
+
+def parallel_life_event_stats(salaries, initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                              loan_term_years, annual_growth_mean, annual_growth_std, iterations, seed=None,
+                              max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE, reservoir_size=1000, **life_events):
+    """
+    Like parallel_life_event_paths, but each chunk is reduced to a streaming_utils.LoanPathStats summary as soon as
+    it is simulated, so memory stays constant however many paths are run. Chunks are seeded the same way, so the
+    summary describes exactly the paths parallel_life_event_paths would return.
+
+    Parameters:
+        salaries ... **life_events: As for parallel_life_event_paths.
+        reservoir_size (int): Number of representative paths kept per salary.
+
+    Returns:
+        results (list): One LoanPathStats per salary.
+    """
+    for _, results in iter_life_event_stats(salaries, initial_balance, interest_rate, repayment_threshold,
+                                            repayment_rate, loan_term_years, annual_growth_mean, annual_growth_std,
+                                            iterations, seed, max_workers, chunk_size, reservoir_size, **life_events):
+        pass
+    return results
+
+
+def _grid_row(task):
+    """
+    Average student loan interest for one salary across every student loan rate.
+    """
+    (salary, student_loan_rates, initial_balance, repayment_threshold, repayment_rate, loan_term_years,
+     annual_growth_mean, annual_growth_std, iterations, row_seed, common_random_numbers) = task
+    rng = np.random.default_rng(row_seed)
+    shock_rows = 1 if common_random_numbers else len(student_loan_rates)
+    growth_shocks = np.stack([normal_shocks(annual_growth_mean, annual_growth_std, (iterations, loan_term_years), rng)
+                              for _ in range(shock_rows)])
+    return _student_loan_paths(initial_balance, student_loan_rates[:, None], repayment_threshold, repayment_rate,
+                               salary, growth_shocks).mean(axis=-1)
+
+
+def parallel_parameter_grid(salaries, student_loan_rates, mortgage_rates, initial_balance, repayment_threshold,
+                            repayment_rate, loan_term_years, annual_growth_mean, annual_growth_std, iterations,
+                            lump_sum, mortgage_balance, mortgage_years, seed=None, max_workers=None,
+                            common_random_numbers=False):
+    """
+    simulate_parameter_grid with one task per salary spread across a process pool.
+
+    Parameters:
+        salaries ... mortgage_years: As for simulate_parameter_grid.
+        seed (int, SeedSequence or np.random.Generator): Seed for the job; fresh entropy is used if None.
+        max_workers (int): Number of worker processes, default_workers() if None.
+        common_random_numbers (bool): Share one shock matrix across all cells; every row reuses the same seed.
+
+    Returns:
+        results (pd.DataFrame): One row per cell, salary-major, with rates given in percent.
+    """
+    salaries = np.asarray(salaries, dtype=float)
+    student_loan_rates = np.asarray(student_loan_rates, dtype=float)
+    mortgage_rates = np.asarray(mortgage_rates, dtype=float)
+
+    if common_random_numbers:
+        row_seeds = [seed_sequence(seed)] * len(salaries)
+    else:
+        row_seeds = seed_sequence(seed).spawn(len(salaries))
+    tasks = [(salary, student_loan_rates, initial_balance, repayment_threshold, repayment_rate, loan_term_years,
+              annual_growth_mean, annual_growth_std, iterations, row_seed, common_random_numbers)
+             for salary, row_seed in zip(salaries, row_seeds)]
+    max_workers = _workers_for(len(salaries) * len(student_loan_rates) * iterations, max_workers)
+    sl_interest = np.array(map_chunks(_grid_row, tasks, max_workers)).reshape(len(salaries), len(student_loan_rates))
+
+    m_interest = simulate_mortgage(lump_sum, mortgage_balance, mortgage_rates, mortgage_years)
+    return _parameter_grid_frame(salaries, student_loan_rates, mortgage_rates, sl_interest, m_interest, lump_sum)
@@ -0,0 +1,165 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import pstats
+import tempfile
+import time
+from collections import defaultdict
+
+# Summaries are logged as one JSON object per line, to LOANCARLO_PERF_LOG if set and otherwise to stderr
+logger = logging.getLogger('loancarlo.perf')
+if not logger.handlers:
+    _handler = logging.FileHandler(os.environ['LOANCARLO_PERF_LOG']) if os.environ.get('LOANCARLO_PERF_LOG') \
+        else logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# The recorder for the run in progress. Each Streamlit session runs the script in its own thread, and so its own
+# context, so concurrent sessions do not mix their timings.
+_current_recorder = contextvars.ContextVar('loancarlo_perf_recorder', default=None)
+
+ENGINE_COUNTERS = ('calls', 'cache_hits', 'paths', 'rng_draws')
+
+
+class PerfRecorder:
+    """
+    Named timing spans and per-engine counters for one run of the app.
+
+    Parameters:
+        run (str): Name of the run, e.g. the page being shown.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self.started = time.perf_counter()
+        self.spans = []
+        self.engines = defaultdict(lambda: dict.fromkeys(ENGINE_COUNTERS, 0))
+
+    def activate(self):
+        """
+        Make this the recorder that span and instrumented simulations report to.
+        """
+        _current_recorder.set(self)
+        return self
+
+    @contextlib.contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, time.perf_counter() - started))
+
+    def count(self, engine, **amounts):
+        for counter, amount in amounts.items():
+            self.engines[engine][counter] += amount
+
+    def summary(self):
+        """
+        Spans totalled by name in the order they first ran, and the engine counters.
+
+        Returns:
+            summary (dict): 'run', 'total_seconds', 'spans' as a list of dicts with 'name', 'seconds' and 'count',
+                and 'engines' mapping each engine to its counters.
+        """
+        spans = {}
+        for name, seconds in self.spans:
+            span = spans.setdefault(name, {'name': name, 'seconds': 0.0, 'count': 0})
+            span['seconds'] += seconds
+            span['count'] += 1
+        return {'run': self.run, 'total_seconds': time.perf_counter() - self.started, 'spans': list(spans.values()),
+                'engines': {engine: dict(counters) for engine, counters in self.engines.items()}}
+
+    def log(self):
+        logger.info(json.dumps({'event': 'app_run', **self.summary()}))
+
+
+def span(name):
+    """
+    Time a block as a named span of the active recorder; does nothing if there is none.
+    """
+    recorder = _current_recorder.get()
+    return recorder.span(name) if recorder is not None else contextlib.nullcontext()
+
+
+def instrument(func, engine, counts, cache=None):
+    """
+    Wrap a simulation so every call is timed as a span and counted against engine in the active recorder.
+
+    Parameters:
+        func (callable): The simulation, possibly memoised.
+        engine (str): Name to report the calls under.
+        counts (callable): Called with the bound arguments (a dict, including defaults) and the result, returning the
+            number of paths and of random draws the call simulates.
+        cache (cache_utils.SimulationCache): If func is memoised by this cache, calls it answers count as cache hits
+            that simulate nothing.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(f"simulate: {engine}"):
+            result = func(*args, **kwargs)
+        recorder = _current_recorder.get()
+        if recorder is not None:
+            if cache is not None and cache.last_call_hit:
+                recorder.count(engine, calls=1, cache_hits=1)
+            else:
+                arguments = signature.bind(*args, **kwargs)
+                arguments.apply_defaults()
+                paths, rng_draws = counts(arguments.arguments, result)
+                recorder.count(engine, calls=1, paths=int(paths), rng_draws=int(rng_draws))
+        return result
+
+    return wrapper
+
+
+def _markdown_table(header, rows):
+    return '\n'.join(['| ' + ' | '.join(header) + ' |', '|' + ' --- |' * len(header)] +
+                     ['| ' + ' | '.join(str(cell) for cell in row) + ' |' for row in rows])
+
+
+def summary_markdown(summary):
+    """
+    Markdown tables of a PerfRecorder summary's spans and, if any simulation ran, its engine counters.
+    """
+    tables = [_markdown_table(('Stage', 'Seconds', 'Calls'),
+                              [(span['name'], f"{span['seconds']:.4f}", span['count']) for span in summary['spans']])]
+    if summary['engines']:
+        tables.append(_markdown_table(('Engine', 'Calls', 'Cache Hits', 'Paths Simulated', 'Random Draws'),
+                                      [(engine, *(f"{counters[counter]:,}" for counter in ENGINE_COUNTERS))
+                                       for engine, counters in summary['engines'].items()]))
+    return '\n\n'.join(tables)
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler, top=25):
+    """
+    Stop a profiler from start_profile and save its stats to LOANCARLO_PROFILE_DIR, or the temporary directory.
+
+    Returns:
+        path (str): The .prof file, readable with pstats or snakeviz.
+        report (str): The top functions by cumulative time.
+    """
+    profiler.disable()
+    directory = os.environ.get('LOANCARLO_PROFILE_DIR', tempfile.gettempdir())
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"loancarlo-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(top)
+    logger.info(json.dumps({'event': 'profile', 'path': path}))
+    return path, report.getvalue()
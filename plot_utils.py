@@ -0,0 +1,89 @@
+import io
+
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def percentile_bands(trajectories, percentiles=FAN_PERCENTILES):
+    """
+    Per-year balance percentiles of a (paths, years) trajectory array, counting years after repayment as zero.
+
+    Returns:
+        bands (np.ndarray): Shape (len(percentiles), years).
+    """
+    return np.percentile(np.nan_to_num(trajectories), percentiles, axis=0)
+
+
+def _segments(trajectories):
+    """
+    Turn each trajectory into the (year, balance) points of a polyline, dropping the NaN years after repayment.
+    """
+    return [np.column_stack([np.flatnonzero(~np.isnan(trajectory)), trajectory[~np.isnan(trajectory)]])
+            for trajectory in np.atleast_2d(trajectories)]
+
+
+def plot_fan_chart(ax, bands, sample_paths=None, highlighted_paths=None, highlighted_labels=None,
+                   max_sample_paths=200, rng=None):
+    """
+    Draw a Monte Carlo fan chart: shaded 5-95 and 25-75 percentile bands, the median, and optionally a handful of
+    individual paths.
+
+    However many paths were simulated, this adds a fixed number of artists. Sample paths are downsampled to
+    max_sample_paths and drawn as one LineCollection, and highlighted paths as another.
+
+    Parameters:
+        ax (matplotlib.axes.Axes): Axes to draw on.
+        bands (np.ndarray): Balances for FAN_PERCENTILES, shape (5, years), e.g. from percentile_bands or
+            LoanPathStats.balance_quantiles.
+        sample_paths (np.ndarray): Background paths, shape (paths, years), NaN after repayment.
+        highlighted_paths (np.ndarray): Paths drawn in colour and listed in the legend.
+        highlighted_labels (list): Legend label for each highlighted path.
+        max_sample_paths (int): Most background paths to draw.
+        rng (np.random.Generator or int): Chooses the background paths to keep when downsampling.
+    """
+    years = np.arange(bands.shape[1])
+    ax.fill_between(years, bands[0], bands[4], color='tab:blue', alpha=0.15, linewidth=0, label="5-95th percentile")
+    ax.fill_between(years, bands[1], bands[3], color='tab:blue', alpha=0.3, linewidth=0, label="25-75th percentile")
+    ax.plot(years, bands[2], color='tab:blue', linewidth=2, label="Median")
+
+    if sample_paths is not None and len(sample_paths):
+        if len(sample_paths) > max_sample_paths:
+            keep = np.random.default_rng(rng).choice(len(sample_paths), max_sample_paths, replace=False)
+            sample_paths = sample_paths[np.sort(keep)]
+        ax.add_collection(LineCollection(_segments(sample_paths), colors='gray', alpha=0.3, linewidths=0.8))
+
+    handles, labels = ax.get_legend_handles_labels()
+    if highlighted_paths is not None and len(highlighted_paths):
+        colors = [f"C{(i + 1) % 10}" for i in range(len(highlighted_paths))]  # C0 is the fan itself
+        ax.add_collection(LineCollection(_segments(highlighted_paths), colors=colors, alpha=0.8, linewidths=1.5))
+
+        # Legend entries for the collection's lines, which are not separate artists
+        handles += [Line2D([], [], color=color, linewidth=1.5) for color in colors]
+        labels += list(highlighted_labels)
+
+    ax.legend(handles, labels, bbox_to_anchor=(1.05, 1), loc='upper left', fontsize='small', ncol=1)
+    ax.autoscale_view()
+
+
+def figure_png(fig, dpi=200, max_width=1400):
+    """
+    Render a figure to PNG as st.pyplot would, and close it. The bytes can be kept and shown again with st.image
+    without redrawing the figure.
+
+    Parameters:
+        fig (matplotlib.figure.Figure): The figure.
+        dpi (int): Resolution, lowered if needed so the image is at most max_width pixels wide. Streamlit resizes
+            anything wider than 1460 pixels every time it is shown, so a wider image costs time without adding detail.
+        max_width (int): Widest image in pixels, leaving a margin for the labels bbox_inches='tight' may add.
+
+    Returns:
+        png (bytes): The image.
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', dpi=min(dpi, max_width / fig.get_figwidth()))
+    plt.close(fig)
+    return buffer.getvalue()
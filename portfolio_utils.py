@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+
+from loan_utils import COMPACTION_THRESHOLD
+from parallel_utils import imap_chunks, seed_sequence, _chunk_sizes
+
+# Per-borrower fields of a loan book. loan_term_years is optional and defaults to the term passed to
+# simulate_portfolio; the others are required.
+BORROWER_FIELDS = ('initial_balance', 'salary', 'repayment_threshold', 'repayment_rate', 'interest_rate',
+                   'loan_term_years')
+
+# Borrowers per task. As in parallel_utils, the split is fixed so results for a seed do not depend on worker count.
+PORTFOLIO_CHUNK_SIZE = 1000
+
+
+def load_borrowers(directory, mmap_mode='r'):
+    """
+    Load a loan book saved as one .npy file per field, e.g. salary.npy, memory-mapped so only the borrowers being
+    simulated are read into memory.
+
+    Parameters:
+        directory (str): Directory holding <field>.npy for the fields in BORROWER_FIELDS.
+        mmap_mode (str): Passed to np.load; None reads the arrays into memory.
+
+    Returns:
+        borrowers (dict): One array per field found, all the same length.
+    """
+    borrowers = {field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode=mmap_mode)
+                 for field in BORROWER_FIELDS if os.path.exists(os.path.join(directory, f"{field}.npy"))}
+    if len({len(values) for values in borrowers.values()}) > 1:
+        raise ValueError(f"Borrower fields in {directory} have different lengths")
+    return borrowers
+
+
+def _portfolio_chunk(task):
+    """
+    Simulate every iteration of one chunk of borrowers and total the results per iteration.
+
+    Paths are laid out iteration-major, so path p is borrower p % borrowers in iteration p // borrowers. Salary growth
+    shocks are drawn a year at a time for the live paths only, and repaid or written-off paths are compacted out as
+    in loan_utils._student_loan_paths.
+    """
+    borrowers, years, annual_growth_mean, annual_growth_std, iterations, chunk_seed = task
+    rng = np.random.default_rng(chunk_seed)
+    count = len(borrowers['initial_balance'])
+    cash_flows = np.zeros((iterations, years))
+    balances = np.zeros((iterations, years))
+    write_offs = np.zeros(iterations)
+    interest = np.zeros(iterations)
+
+    live = np.arange(iterations * count)
+    borrower, iteration = live % count, live // count
+    balance, current_salary, threshold, repayment_share, rate, term = (
+        np.asarray(borrowers[field], dtype=float)[borrower] for field in BORROWER_FIELDS)
+
+    for year in range(years):
+        still_owing = np.count_nonzero(balance)
+        if not still_owing:
+            break
+        if still_owing < COMPACTION_THRESHOLD * len(live):
+            keep = np.flatnonzero(balance)
+            live, iteration, balance, current_salary, threshold, repayment_share, rate, term = (
+                values[keep] for values in (live, iteration, balance, current_salary, threshold, repayment_share,
+                                            rate, term))
+
+        # Interest accrues on the whole balance but, as in loan_utils._student_loan_paths, only counts as paid in a
+        # year with a repayment; repayments above the threshold are capped at what is owed
+        above_threshold = current_salary > threshold
+        annual_interest = balance * rate
+        repayment = np.where(above_threshold, (current_salary - threshold) * repayment_share, 0)
+        payment = np.minimum(repayment, balance + annual_interest)
+        balance += annual_interest
+        balance -= payment
+        np.maximum(balance, 0, out=balance)
+
+        # Whatever is left at the end of a borrower's term is written off
+        expired = term == year + 1
+        write_offs += np.bincount(iteration[expired], weights=balance[expired], minlength=iterations)
+        balance[expired] = 0
+
+        interest += np.bincount(iteration, weights=np.where(above_threshold, annual_interest, 0), minlength=iterations)
+        cash_flows[:, year] = np.bincount(iteration, weights=payment, minlength=iterations)
+        balances[:, year] = np.bincount(iteration, weights=balance, minlength=iterations)
+        current_salary *= 1 + rng.normal(annual_growth_mean, annual_growth_std, len(live))
+
+    return cash_flows, balances, write_offs, interest
+
+
+def simulate_portfolio(borrowers, loan_term_years, annual_growth_mean, annual_growth_std, iterations,
+                       percentiles=(5, 25, 50, 75, 95), seed=None, max_workers=None, chunk_size=PORTFOLIO_CHUNK_SIZE):
+    """
+    Simulate a whole loan book of different borrowers, returning only totals across the book for each iteration.
+
+    Every borrower is simulated for every iteration with independent salary growth each year. Borrowers are split
+    into chunks across the process pool and each chunk's totals are added up as they arrive, so memory depends on the
+    chunk size and the number of iterations, never on the number of borrowers; no per-borrower trajectory is kept.
+
+    Parameters:
+        borrowers (dict): Struct of arrays, one entry per field in BORROWER_FIELDS, e.g. from load_borrowers. Arrays
+            may be memory-mapped.
+        loan_term_years (int): Years until the balance is written off, for borrowers without their own
+            loan_term_years.
+        annual_growth_mean (float): The average annual salary growth.
+        annual_growth_std (float): The standard deviation of the annual salary growth.
+        iterations (int): The number of Monte Carlo simulations of the whole book.
+        percentiles (tuple): Percentiles across iterations to report.
+        seed (int, SeedSequence or np.random.Generator): Seed for the job; fresh entropy is used if None.
+        max_workers (int): Number of worker processes, parallel_utils.default_workers() if None.
+        chunk_size (int): Borrowers per task.
+
+    Returns:
+        results (dict): 'cash_flows' and 'balances', the total repaid in and owed at the end of each year, with shape
+            (iterations, years); 'write_offs' and 'interest', the totals written off and of interest paid (counted
+            as in loan_utils.simulate_student_loan) per iteration; and 'cash_flow_percentiles' and
+            'write_off_percentiles', mapping each requested percentile to the yearly cash flows and to the write-off
+            total.
+    """
+    missing = [field for field in BORROWER_FIELDS[:-1] if field not in borrowers]
+    if missing:
+        raise ValueError(f"Borrowers are missing the fields {missing}")
+    total_borrowers = len(borrowers['initial_balance'])
+    terms = borrowers.get('loan_term_years')
+    years = int(max(loan_term_years, np.max(terms))) if terms is not None and total_borrowers else loan_term_years
+
+    chunks = _chunk_sizes(total_borrowers, chunk_size)
+    tasks = []
+    for start, size, chunk_seed in zip(np.cumsum([0] + chunks[:-1]), chunks, seed_sequence(seed).spawn(len(chunks))):
+        chunk = {field: borrowers[field][start:start + size] for field in BORROWER_FIELDS[:-1]}
+        chunk['loan_term_years'] = terms[start:start + size] if terms is not None else np.full(size, loan_term_years)
+        tasks.append((chunk, years, annual_growth_mean, annual_growth_std, iterations, chunk_seed))
+
+    cash_flows, balances = np.zeros((iterations, years)), np.zeros((iterations, years))
+    write_offs, interest = np.zeros(iterations), np.zeros(iterations)
+    for chunk_results in imap_chunks(_portfolio_chunk, tasks, max_workers):
+        for total, chunk_total in zip((cash_flows, balances, write_offs, interest), chunk_results):
+            total += chunk_total
+
+    return {'cash_flows': cash_flows, 'balances': balances, 'write_offs': write_offs, 'interest': interest,
+            'cash_flow_percentiles': dict(zip(percentiles, np.percentile(cash_flows, percentiles, axis=0))),
+            'write_off_percentiles': {p: float(value)
+                                      for p, value in zip(percentiles, np.percentile(write_offs, percentiles))}}
@@ -0,0 +1,122 @@
+import numpy as np
+
+SAMPLERS = ('random', 'antithetic', 'halton')
+
+# Coefficients of Acklam's rational approximation to the inverse normal CDF, accurate to about 1e-9
+_PPF_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02,
+          -3.066479806614716e+01, 2.506628277459239e+00)
+_PPF_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01,
+          -1.328068155288572e+01)
+_PPF_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00,
+          4.374664141464968e+00, 2.938163982698783e+00)
+_PPF_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+_PPF_LOW = 0.02425
+
+
+def norm_ppf(u):
+    """
+    Inverse of the standard normal CDF, vectorised.
+
+    Parameters:
+        u (float or array): Probabilities strictly between 0 and 1.
+
+    Returns:
+        z (np.ndarray): Standard normal quantiles.
+    """
+    u = np.asarray(u, dtype=float)
+    z = np.empty_like(u)
+
+    # Central region
+    central = (u >= _PPF_LOW) & (u <= 1 - _PPF_LOW)
+    q = u[central] - 0.5
+    r = q * q
+    a, b = _PPF_A, _PPF_B
+    z[central] = ((((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q /
+                  (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1))
+
+    # Tails, using the symmetry of the normal distribution for the upper one
+    tail = ~central
+    q = np.sqrt(-2 * np.log(np.minimum(u[tail], 1 - u[tail])))
+    c, d = _PPF_C, _PPF_D
+    tail_z = ((((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) /
+              ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1))
+    z[tail] = np.where(u[tail] < 0.5, tail_z, -tail_z)
+    return z
+
+
+def _primes(count):
+    primes = []
+    candidate = 2
+    while len(primes) < count:
+        if all(candidate % prime for prime in primes):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def halton(points, dimensions, rng=None):
+    """
+    Randomly shifted Halton sequence.
+
+    Each dimension is the radical inverse of the point index in its own prime base. A uniform random shift modulo 1
+    (a Cranley-Patterson rotation) is added per dimension, so independent calls give independent, unbiased
+    estimates which can be averaged and used for error bars.
+
+    Parameters:
+        points (int): Number of points.
+        dimensions (int): Dimension of each point.
+        rng (np.random.Generator or int): Generator or seed for the shift; fresh entropy is used if None.
+
+    Returns:
+        u (np.ndarray): Points in (0, 1), shape (points, dimensions).
+    """
+    rng = np.random.default_rng(rng)
+    u = np.zeros((points, dimensions))
+    for dimension, base in enumerate(_primes(dimensions)):
+        index = np.arange(1, points + 1)
+        fraction = 1.0
+        while index.any():
+            fraction /= base
+            u[:, dimension] += fraction * (index % base)
+            index //= base
+    u = (u + rng.random(dimensions)) % 1
+
+    # Keep clear of exactly 0, where the normal quantile is infinite
+    return np.clip(u, 1e-12, 1 - 1e-12)
+
+
+def normal_shocks(mean, std, size, rng=None, sampler='random'):
+    """
+    Draw a (paths, years) matrix of normal shocks with the chosen sampler.
+
+    'random' draws independent normals. 'antithetic' draws half the paths and mirrors them around the mean, so every
+    path i < paths // 2 is paired with path i + (paths + 1) // 2; odd path counts end with one unpaired path.
+    'halton' maps a randomly shifted Halton sequence through the normal quantile function, one dimension per year.
+
+    Shocks are single precision, which is plenty for a growth rate and makes the draw, the largest cost of a batched
+    run, cheaper. Random and antithetic draws are laid out year by year in memory, the order the engines read them in.
+
+    Parameters:
+        mean (float): Mean of the shocks.
+        std (float): Standard deviation of the shocks.
+        size (tuple): (paths, years).
+        rng (np.random.Generator or int): Generator or seed for the random draws; fresh entropy is used if None.
+        sampler (str): One of SAMPLERS.
+
+    Returns:
+        shocks (np.ndarray): float32 shocks of shape size.
+    """
+    rng = np.random.default_rng(rng)
+    paths, years = size
+    if sampler == 'random':
+        z = rng.standard_normal((years, paths), dtype=np.float32).T
+    elif sampler == 'antithetic':
+        half = rng.standard_normal((years, (paths + 1) // 2), dtype=np.float32)
+        z = np.concatenate([half, -half[:, :paths // 2]], axis=1).T
+    elif sampler == 'halton':
+        z = norm_ppf(halton(paths, years, rng)).astype(np.float32)
+    else:
+        raise ValueError(f"Unknown sampler {sampler!r}, expected one of {SAMPLERS}")
+    z *= np.float32(std)
+    z += np.float32(mean)
+    return z
@@ -0,0 +1,535 @@
+"""
+Serve LoanCarlo simulations over HTTP/JSON, for tools that want results without running Streamlit or starting Python
+for every call.
+
+    python service.py --port 8765 --workers 4
+
+POST a JSON object of arguments to /student_loan, /mortgage, /index_fund or /life_events; GET /metrics for request
+counts, latency percentiles, throughput and batch sizes, and /health to check the service is up. For example:
+
+    curl -d '{"initial_balance": 60000, "interest_rate": 0.043, "repayment_threshold": 24990, "repayment_rate": 0.09,
+              "loan_term_years": 25, "salary": 30000, "annual_growth_mean": 0.03, "annual_growth_std": 0.05,
+              "iterations": 1000, "seed": 42}' localhost:8765/student_loan
+
+Requests for the same model that queue up while a batch runs, or arrive within --window-ms of each other, are
+coalesced into one batch and simulated together: student loans and index funds as one broadcast engine call per
+(iterations, years) group, mortgages as one closed-form call. A request with a seed gets exactly the result the library
+function gives for that seed, whatever it is batched with. Batches run on the process pool, with at most two per worker
+in flight; requests wait in a bounded queue per model, and once that is full the service answers 503 with Retry-After
+rather than queueing without limit.
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from loan_utils import _student_loan_paths, simulate_mortgage
+from parallel_utils import _discard_executor, default_workers, get_executor, parallel_life_event_stats
+from sampling_utils import normal_shocks
+
+MAX_ITERATIONS = 100000
+MAX_YEARS = 100
+MAX_SALARIES = 20
+MAX_AMOUNT = 10 ** 9  # Largest balance, salary or lump sum, in pounds
+REQUEST_TIMEOUT = 60  # Seconds a request waits for its batch before the service gives up with 504
+
+# Arguments of each model: required, then optional with their defaults. Integer arguments are checked as such.
+MODELS = {
+    'student_loan': (('initial_balance', 'interest_rate', 'repayment_threshold', 'repayment_rate', 'loan_term_years',
+                      'salary', 'annual_growth_mean', 'annual_growth_std'),
+                     {'iterations': 1000, 'seed': None}),
+    'mortgage': (('lump_sum', 'mortgage_balance', 'interest_rate', 'years'), {}),
+    'index_fund': (('lump_sum', 'annual_return_mean', 'annual_return_std', 'years'),
+                   {'iterations': 1000, 'seed': None}),
+    'life_events': (('salaries', 'initial_balance', 'interest_rate', 'repayment_threshold', 'repayment_rate',
+                     'loan_term_years', 'annual_growth_mean', 'annual_growth_std'),
+                    {'iterations': 1000, 'seed': None, 'simulate_pregnancy': True, 'simulate_layoff': True,
+                     'simulate_sick_leave': True, 'simulate_job_change': True, 'paycut_percentage': 20,
+                     'payrise_percentage': 20}),
+}
+INTEGER_ARGUMENTS = ('loan_term_years', 'years', 'iterations', 'seed')
+BOOLEAN_ARGUMENTS = ('simulate_pregnancy', 'simulate_layoff', 'simulate_sick_leave', 'simulate_job_change')
+# Range of each numeric argument. Within them every model gives a finite result, and a standard deviation is never
+# negative, which NumPy would reject part way through a batch
+BOUNDS = {
+    **dict.fromkeys(('initial_balance', 'repayment_threshold', 'salary', 'salaries', 'lump_sum', 'mortgage_balance'),
+                    (0, MAX_AMOUNT)),
+    **dict.fromkeys(('interest_rate', 'repayment_rate', 'annual_growth_std', 'annual_return_std'), (0, 1)),
+    **dict.fromkeys(('annual_growth_mean', 'annual_return_mean'), (-1, 1)),
+    **dict.fromkeys(('paycut_percentage', 'payrise_percentage'), (0, 100)),
+}
+
+
+def validate(model, payload):
+    """
+    Check a request's arguments and fill in the defaults.
+
+    Raises:
+        ValueError: With a message for the client, if an argument is missing, unknown or out of range.
+    """
+    required, optional = MODELS[model]
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object of arguments")
+    missing = [name for name in required if name not in payload]
+    unknown = sorted(set(payload) - set(required) - set(optional))
+    if missing or unknown:
+        raise ValueError(f"Missing arguments {missing}" if missing else f"Unknown arguments {unknown}")
+    arguments = dict(optional, **payload)
+
+    for name, value in arguments.items():
+        if name == 'salaries':
+            if not isinstance(value, list) or not 0 < len(value) <= MAX_SALARIES or \
+                    not all(isinstance(salary, (int, float)) and not isinstance(salary, bool) for salary in value):
+                raise ValueError(f"salaries must be a list of 1 to {MAX_SALARIES} numbers")
+        elif name in BOOLEAN_ARGUMENTS:
+            if not isinstance(value, bool):
+                raise ValueError(f"{name} must be true or false")
+        elif name == 'seed' and value is None:
+            continue
+        elif name in INTEGER_ARGUMENTS:
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{name} must be a non-negative integer")
+        elif not isinstance(value, (int, float)) or isinstance(value, bool) or not np.isfinite(value):
+            raise ValueError(f"{name} must be a number")
+        low, high = BOUNDS.get(name, (-np.inf, np.inf))
+        if not all(low <= number <= high for number in (value if name == 'salaries' else [value])):
+            raise ValueError(f"{name} must be between {low:,} and {high:,}")
+    if not 1 <= arguments.get('iterations', 1) <= MAX_ITERATIONS:
+        raise ValueError(f"iterations must be between 1 and {MAX_ITERATIONS:,}")
+    if not 1 <= arguments.get('loan_term_years', arguments.get('years', 1)) <= MAX_YEARS:
+        raise ValueError(f"The term must be between 1 and {MAX_YEARS} years")
+    return arguments
+
+
+def request_paths(arguments):
+    """
+    Paths a request simulates, which is what batches are sized by.
+    """
+    return arguments.get('iterations', 1) * len(arguments.get('salaries', [None]))
+
+
+def _groups(requests, key):
+    """
+    Indices of the requests, grouped by key(request).
+    """
+    groups = defaultdict(list)
+    for index, request in enumerate(requests):
+        groups[key(request)].append(index)
+    return groups.items()
+
+
+def _student_loan_batch(requests):
+    # Each request draws its own shocks from its own seed, so its result is the one simulate_student_loan gives
+    results = [None] * len(requests)
+    for (iterations, years), indices in _groups(requests, lambda r: (r['iterations'], r['loan_term_years'])):
+        batch = [requests[index] for index in indices]
+        growth_shocks = np.stack([normal_shocks(r['annual_growth_mean'], r['annual_growth_std'], (iterations, years),
+                                                r['seed']) for r in batch])
+        columns = {name: np.array([r[name] for r in batch], dtype=float)[:, None]
+                   for name in ('initial_balance', 'interest_rate', 'repayment_threshold', 'repayment_rate', 'salary')}
+        interest_paid = _student_loan_paths(columns['initial_balance'], columns['interest_rate'],
+                                            columns['repayment_threshold'], columns['repayment_rate'],
+                                            columns['salary'], growth_shocks).mean(axis=1)
+        for index, average in zip(indices, interest_paid):
+            results[index] = {'average_interest_paid': float(average)}
+    return results
+
+
+def _mortgage_batch(requests):
+    columns = {name: np.array([r[name] for r in requests])
+               for name in ('lump_sum', 'mortgage_balance', 'interest_rate', 'years')}
+    totals = simulate_mortgage(columns['lump_sum'], columns['mortgage_balance'], columns['interest_rate'],
+                               columns['years'])
+    return [{'total_interest_paid': float(total)} for total in np.atleast_1d(totals)]
+
+
+def _index_fund_batch(requests):
+    results = [None] * len(requests)
+    for (iterations, years), indices in _groups(requests, lambda r: (r['iterations'], r['years'])):
+        batch = [requests[index] for index in indices]
+        annual_returns = np.stack([np.random.default_rng(r['seed']).normal(r['annual_return_mean'],
+                                                                           r['annual_return_std'],
+                                                                           size=(iterations, years)) for r in batch])
+        lump_sums = np.array([r['lump_sum'] for r in batch], dtype=float)
+        average_values = (lump_sums[:, None] * np.prod(1 + annual_returns, axis=2)).mean(axis=1)
+        for index, average_value, lump_sum in zip(indices, average_values, lump_sums):
+            results[index] = {'average_gain': float(average_value - lump_sum)}
+    return results
+
+
+def _life_events_batch(requests):
+    # Each request is already a batch of salaries; the worker runs them in this process rather than a nested pool
+    results = []
+    for r in requests:
+        arguments = dict(r)
+        summaries = parallel_life_event_stats(arguments.pop('salaries'), **arguments, max_workers=1)
+        results.append({'salaries': [{'salary': salary, 'average_interest_paid': stats.mean_interest,
+                                      'std_error': stats.interest_std_error,
+                                      'proportion_repaid': stats.proportion_repaid,
+                                      # NaN if no path was repaid, which JSON cannot carry
+                                      'average_years_to_repay': None if np.isnan(stats.average_years_to_repay)
+                                      else stats.average_years_to_repay}
+                                     for salary, stats in zip(r['salaries'], summaries)]})
+    return results
+
+
+BATCH_FUNCTIONS = {'student_loan': _student_loan_batch, 'mortgage': _mortgage_batch,
+                   'index_fund': _index_fund_batch, 'life_events': _life_events_batch}
+
+
+def _score_batch(task):
+    """
+    Results for one batch of validated requests for a model; runs on the worker processes.
+
+    If the batch fails, each request is scored alone, and a request that still fails gets its exception in place of
+    its result, so it does not fail the requests it was batched with.
+    """
+    model, requests = task
+    try:
+        return BATCH_FUNCTIONS[model](requests)
+    except Exception as error:
+        if len(requests) == 1:
+            return [error]
+    results = []
+    for request in requests:
+        try:
+            results.extend(BATCH_FUNCTIONS[model]([request]))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+class Metrics:
+    """
+    Request counts, latencies and batch sizes per model, safe to update from every handler thread.
+
+    Parameters:
+        window (float): Seconds of recent requests that latency percentiles and throughput are computed over.
+    """
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: dict.fromkeys(('requests', 'errors', 'rejected', 'batches',
+                                                          'batched_requests'), 0))
+        self._latencies = defaultdict(lambda: deque(maxlen=100000))  # (finished, seconds) of successful requests
+        self._first_arrivals = {}  # When each model's first request arrived, so idle uptime does not dilute throughput
+
+    def request(self, model, seconds, ok):
+        with self._lock:
+            self._counts[model]['requests'] += 1
+            self._first_arrivals.setdefault(model, time.monotonic() - seconds)
+            if ok:
+                self._latencies[model].append((time.monotonic(), seconds))
+            else:
+                self._counts[model]['errors'] += 1
+
+    def rejected(self, model):
+        with self._lock:
+            self._counts[model]['rejected'] += 1
+
+    def batch(self, model, size):
+        with self._lock:
+            self._counts[model]['batches'] += 1
+            self._counts[model]['batched_requests'] += size
+
+    def summary(self, queue_depths=None):
+        """
+        Returns:
+            summary (dict): 'uptime_seconds', and per model the counts, 'mean_batch_size', 'throughput_per_second'
+                and 'latency_ms' percentiles over the last window seconds, and the current 'queue_depth'.
+        """
+        now = time.monotonic()
+        models = {}
+        with self._lock:
+            for model, counts in self._counts.items():
+                recent = np.array([seconds for finished, seconds in self._latencies[model]
+                                   if finished > now - self.window])
+                span = min(self.window, now - self._first_arrivals.get(model, now))
+                models[model] = dict(
+                    counts,
+                    mean_batch_size=counts['batched_requests'] / counts['batches'] if counts['batches'] else 0.0,
+                    throughput_per_second=len(recent) / span if span > 0 else 0.0,
+                    latency_ms={f"p{p}": float(np.percentile(recent, p) * 1000) if len(recent) else None
+                                for p in (50, 90, 99)},
+                    queue_depth=(queue_depths or {}).get(model, 0))
+        return {'uptime_seconds': now - self.started, 'window_seconds': self.window, 'models': models}
+
+
+class Coalescer:
+    """
+    Collects one model's requests from a bounded queue into batches: a batch is cut window seconds after its first
+    request arrives, or before the request that would take it past max_batch_paths paths, and handed to dispatch.
+
+    Parameters:
+        model (str): Model the requests are for.
+        dispatch (callable): Called with the model and a list of (arguments, future) pairs; may block while the pool
+            is busy, which leaves requests to back up in the queue.
+        window (float): Seconds to wait for more requests after the first.
+        max_batch_paths (int): Paths a batch is kept within; a request with more runs alone.
+        max_pending (int): Requests that may wait in the queue.
+    """
+
+    def __init__(self, model, dispatch, window, max_batch_paths, max_pending):
+        self.model = model
+        self.queue = queue.Queue(max_pending)
+        self._dispatch = dispatch
+        self._window = window
+        self._max_batch_paths = max_batch_paths
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, arguments):
+        """
+        Queue a validated request.
+
+        Returns:
+            future (Future): Resolves to the request's result.
+
+        Raises:
+            queue.Full: If the queue is full.
+        """
+        future = Future()
+        self.queue.put_nowait((arguments, future))
+        return future
+
+    def _run(self):
+        item = None  # A request that would have taken the last batch past max_batch_paths starts the next one
+        while True:
+            batch = [item or self.queue.get()]
+            item = None
+            paths = request_paths(batch[0][0])
+            deadline = time.monotonic() + self._window
+            while paths < self._max_batch_paths:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    item = None
+                    break
+                if paths + request_paths(item[0]) > self._max_batch_paths:
+                    break
+                batch.append(item)
+                paths += request_paths(item[0])
+                item = None
+            self._dispatch(self.model, batch)
+
+
+class ScoringService:
+    """
+    The coalescers for every model and the pool their batches run on.
+
+    Parameters:
+        max_workers (int): Worker processes, default_workers() if None; with one, batches run on the coalescer's
+            thread instead.
+        window (float): Seconds a batch waits for more requests after its first. Under load, requests that queue
+            while earlier batches run are coalesced without one; under light load waiting only adds latency.
+        max_batch_paths (int): Paths a batch is kept within. Batching saves the engine's per-call overhead, which
+            stops mattering after ten thousand or so paths, so the cap only bounds how long one batch holds a worker.
+        max_pending (int): Requests that may wait per model before new ones are turned away.
+    """
+
+    def __init__(self, max_workers=None, window=0.0, max_batch_paths=MAX_ITERATIONS, max_pending=1000):
+        self.max_workers = default_workers() if max_workers is None else max_workers
+        self.metrics = Metrics()
+        self._executor = get_executor(self.max_workers) if self.max_workers > 1 else None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(2 * self.max_workers)  # Batches in flight
+        self.coalescers = {model: Coalescer(model, self._dispatch, window, max_batch_paths, max_pending)
+                           for model in MODELS}
+
+    def warm_up(self):
+        """
+        Start every worker process now, so the first requests do not wait for them to import NumPy.
+        """
+        if self._executor is not None:
+            list(self._executor.map(_score_batch, [('mortgage', [])] * self.max_workers))
+
+    def submit(self, model, arguments):
+        return self.coalescers[model].submit(arguments)
+
+    def _dispatch(self, model, batch):
+        self._slots.acquire()
+        self.metrics.batch(model, len(batch))
+        self._submit(batch, (model, [arguments for arguments, _ in batch]))
+
+    def _submit(self, batch, task, attempts=2):
+        """
+        Run a batch on the pool, or on this thread if there is none; a batch whose pool breaks is run again on a
+        fresh pool, up to attempts times in all.
+        """
+        executor = self._executor
+        if executor is None:
+            future = Future()
+            try:
+                future.set_result(_score_batch(task))
+            except Exception as error:
+                future.set_exception(error)
+            self._complete(batch, future)
+            return
+        try:
+            future = executor.submit(_score_batch, task)
+        except BrokenProcessPool as error:
+            future = Future()
+            future.set_exception(error)
+            self._finish(batch, task, attempts, executor, future)
+        else:
+            future.add_done_callback(lambda future: self._finish(batch, task, attempts, executor, future))
+
+    def _finish(self, batch, task, attempts, executor, future):
+        # A worker that dies, for instance killed for running out of memory, breaks the whole pool: its pending
+        # batches fail, or are cancelled as the pool is discarded. Later batches need a fresh pool, and this one is
+        # run once more on it, since the batch that killed the worker is seldom the one that gets the error
+        broken = future.cancelled() or isinstance(future.exception(), BrokenProcessPool)
+        if broken:
+            self._replace_executor(executor)
+            if attempts > 1:
+                self._submit(batch, task, attempts - 1)
+                return
+            if future.cancelled():
+                future = Future()
+                future.set_exception(BrokenProcessPool("The pool broke while scoring this batch"))
+        self._complete(batch, future)
+
+    def _replace_executor(self, broken):
+        """
+        Swap a broken pool for a fresh one, unless another batch already has; with no pool to be had, batches run on
+        the coalescers' threads.
+        """
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            _discard_executor(broken)
+            try:
+                self._executor = get_executor(self.max_workers)
+            except OSError:
+                self._executor = None
+
+    def _complete(self, batch, future):
+        self._slots.release()
+        error = future.exception()
+        for index, (_, request_future) in enumerate(batch):
+            result = error or future.result()[index]
+            if isinstance(result, Exception):
+                request_future.set_exception(result)
+            else:
+                request_future.set_result(result)
+
+    def metrics_summary(self):
+        return self.metrics.summary({model: coalescer.queue.qsize() for model, coalescer in self.coalescers.items()})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so clients reuse their connection
+    # Headers and body go out in separate writes. With Nagle's algorithm the body would wait for the client's delayed
+    # ACK of the headers, about 40ms per response on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def _send(self, status, body, headers=()):
+        """
+        Raises:
+            ValueError: Before anything is sent, if body holds a NaN or infinity, which is not valid JSON.
+        """
+        data = json.dumps(body, allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send(200, self.server.service.metrics_summary())
+        elif self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        model = self.path.strip('/')
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if model not in MODELS:
+            self._send(404, {'error': f"Unknown model {model!r}; choose from {', '.join(MODELS)}"})
+            return
+        service = self.server.service
+        try:
+            future = service.submit(model, validate(model, json.loads(body or b'null')))
+            result = future.result(timeout=REQUEST_TIMEOUT)
+        except (ValueError, json.JSONDecodeError) as error:
+            service.metrics.request(model, time.perf_counter() - started, ok=False)
+            self._send(400, {'error': str(error)})
+        except queue.Full:
+            service.metrics.rejected(model)
+            self._send(503, {'error': "The service is busy; retry shortly"}, headers=[('Retry-After', '1')])
+        except FutureTimeoutError:  # Only an alias of the built-in TimeoutError from Python 3.11
+            service.metrics.request(model, time.perf_counter() - started, ok=False)
+            self._send(504, {'error': f"No result within {REQUEST_TIMEOUT}s"})
+        except Exception as error:
+            service.metrics.request(model, time.perf_counter() - started, ok=False)
+            self._send(500, {'error': f"{type(error).__name__}: {error}"})
+        else:
+            try:
+                self._send(200, result)
+            except ValueError:
+                service.metrics.request(model, time.perf_counter() - started, ok=False)
+                self._send(422, {'error': "The result is not a finite number for these arguments"})
+            else:
+                service.metrics.request(model, time.perf_counter() - started, ok=True)
+
+    def log_message(self, format, *args):
+        pass  # Per-request logging would cost more than the requests; see /metrics
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Room for many clients connecting at once; the default 5 resets the rest
+
+
+def serve(host='127.0.0.1', port=8765, **service_options):
+    """
+    Run the service until interrupted.
+
+    Parameters:
+        host (str): Interface to listen on; the default only accepts local connections.
+        port (int): Port to listen on.
+        **service_options: Passed to ScoringService.
+    """
+    server = _Server((host, port), _Handler)
+    server.service = ScoringService(**service_options)
+    server.service.warm_up()
+    print(f"Serving on http://{host}:{server.server_address[1]} with {server.service.max_workers} worker(s)",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve LoanCarlo simulations over HTTP/JSON.")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: LOANCARLO_WORKERS or "
+                                                                  "every core)")
+    parser.add_argument('--window-ms', type=float, default=0.0, help="how long to wait to coalesce requests")
+    parser.add_argument('--max-batch-paths', type=int, default=MAX_ITERATIONS, help="paths a batch is kept within")
+    parser.add_argument('--max-pending', type=int, default=1000, help="requests queued per model before new ones "
+                                                                      "get 503")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, max_workers=args.workers, window=args.window_ms / 1000,
+          max_batch_paths=args.max_batch_paths, max_pending=args.max_pending)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+
+from cache_utils import _canonical
+from perf_utils import span
+
+
+class StageGraph:
+    """
+    A page's computation as a small graph of stages. Each stage declares the parameters it reads and the stages whose
+    results it takes, and is only rerun when one of those has changed since its result was kept, so a widget change
+    recomputes just the stages downstream of it.
+
+    Stage functions are called with the parameters and upstream results as keyword arguments, and must not draw
+    anything themselves: a kept result is reused without calling the function at all.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name=None, reads=(), after=()):
+        """
+        Decorator registering a stage.
+
+        Parameters:
+            name (str): Stage name, also the keyword its result is passed to later stages under. Defaults to the
+                function's name.
+            reads (tuple): Names of the parameters the stage reads.
+            after (tuple): Names of the stages whose results it takes.
+        """
+        def register(func):
+            self.stages[name or func.__name__] = (func, tuple(reads), tuple(after))
+            return func
+
+        return register
+
+    def fingerprint(self, name, parameters):
+        """
+        Hash of the parameters a stage reads and of its upstream stages' fingerprints, so it changes exactly when
+        something the stage depends on, directly or not, has changed.
+        """
+        _, reads, after = self.stages[name]
+        return hashlib.sha256(json.dumps([[_canonical(parameters[parameter]) for parameter in reads],
+                                          [self.fingerprint(upstream, parameters) for upstream in after]]).encode()
+                              ).hexdigest()
+
+    def evaluate(self, targets, parameters, results):
+        """
+        Bring the targets and the stages they depend on up to date, rerunning each stage whose fingerprint differs
+        from the one its result was kept under. Stages that run are timed as "stage: <name>" spans; reused stages do
+        not appear in the timings.
+
+        Parameters:
+            targets (iterable): Names of the stages wanted.
+            parameters (dict): Current value of every parameter the stages read.
+            results (dict): (fingerprint, result) kept per stage from earlier runs, updated in place. The app keeps it
+                in st.session_state so it survives reruns.
+
+        Returns:
+            values (dict): Result of every stage evaluated.
+        """
+        values = {}
+
+        def visit(name):
+            if name in values:
+                return
+            func, reads, after = self.stages[name]
+            for upstream in after:
+                visit(upstream)
+            fingerprint = self.fingerprint(name, parameters)
+            kept = results.get(name)
+            if kept is not None and kept[0] == fingerprint:
+                values[name] = kept[1]
+            else:
+                with span(f"stage: {name}"):
+                    values[name] = func(**{parameter: parameters[parameter] for parameter in reads},
+                                        **{upstream: values[upstream] for upstream in after})
+                results[name] = (fingerprint, values[name])
+
+        for target in targets:
+            visit(target)
+        return values
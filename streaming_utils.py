@@ -0,0 +1,215 @@
+import numpy as np
+
+from loan_utils import LIFE_EVENT_LOG_DTYPE, LIFE_EVENT_NAMES
+
+# Balance bins for the per-year quantile sketches: bin 0 holds repaid loans and the rest are log-spaced from £1 to
+# £100m, each about 0.9% wide
+BALANCE_BIN_EDGES = np.geomspace(1, 1e8, 2001)
+
+
+class LoanPathStats:
+    """
+    One-pass summary of simulated loan paths, fed chunk by chunk so memory does not grow with the number of paths.
+
+    Keeps a running mean and variance of interest paid (Welford, merged per chunk with Chan's formula), a histogram
+    sketch of the balance in each year, a histogram of the year each loan was repaid in, the paths with the lowest
+    and highest final balances, and a fixed-size uniform reservoir of paths for plotting. Life events are counted and
+    their balance impact summed per event type, with a uniform sample of the event log kept for display. Two
+    summaries of disjoint paths can be merged, giving the same result whichever order chunks arrive in.
+
+    Parameters:
+        loan_term_years (int): Length of each path.
+        reservoir_size (int): Number of representative paths to keep.
+        extremes (int): Number of lowest and highest final balance paths to keep.
+        event_sample_size (int): Number of life event log rows to keep.
+    """
+
+    def __init__(self, loan_term_years, reservoir_size=1000, extremes=3, event_sample_size=1000):
+        self.loan_term_years = loan_term_years
+        self.reservoir_size = reservoir_size
+        self.extremes = extremes
+        self.event_sample_size = event_sample_size
+        self.count = 0
+        self.mean_interest = 0.0
+        self._interest_m2 = 0.0
+        self.balance_histogram = np.zeros((loan_term_years, len(BALANCE_BIN_EDGES)), dtype=np.int64)
+        self.payoff_histogram = np.zeros(loan_term_years + 1, dtype=np.int64)  # Index 0: no balance to repay
+        self.never_repaid = 0
+        self.survival = np.zeros(loan_term_years + 1, dtype=np.int64)  # Paths owing at the start and each year end
+        self.lowest = self._empty_paths()
+        self.highest = self._empty_paths()
+        self.reservoir = self._empty_paths()
+        self._reservoir_keys = np.empty(0)
+        self.event_counts = np.zeros(len(LIFE_EVENT_NAMES), dtype=np.int64)
+        self.event_impact_sums = np.zeros(len(LIFE_EVENT_NAMES))
+        self.event_sample = np.zeros(0, dtype=LIFE_EVENT_LOG_DTYPE)
+        self._event_keys = np.empty(0)
+
+    def _empty_paths(self):
+        return {'sim': np.empty(0, dtype=np.int64), 'growth_rate': np.empty(0), 'final_balance': np.empty(0),
+                'interest_paid': np.empty(0), 'trajectory': np.empty((0, self.loan_term_years))}
+
+    def update(self, trajectories, interest_paid, growth_rates, event_log, survival, first_sim, rng, salary_index=0):
+        """
+        Add a chunk of paths as returned by loan_utils.simulate_life_event_paths.
+
+        Parameters:
+            trajectories, interest_paid, growth_rates, event_log, survival: Results for the chunk.
+            first_sim (int): Simulation number of the chunk's first path, to label paths across chunks.
+            rng (np.random.Generator): Draws the reservoir sampling keys.
+            salary_index (int): Recorded in the event log, for summaries of several starting salaries.
+        """
+        paths = len(interest_paid)
+        if paths == 0:
+            return
+        final_balances = np.nan_to_num(trajectories[:, -1])
+        chunk = {'sim': first_sim + np.arange(paths), 'growth_rate': np.asarray(growth_rates),
+                 'final_balance': final_balances, 'interest_paid': np.asarray(interest_paid),
+                 'trajectory': np.asarray(trajectories)}
+        chunk_stats = LoanPathStats(self.loan_term_years, self.reservoir_size, self.extremes, self.event_sample_size)
+
+        # Interest paid
+        chunk_stats.count = paths
+        chunk_stats.mean_interest = float(chunk['interest_paid'].mean())
+        chunk_stats._interest_m2 = float(((chunk['interest_paid'] - chunk_stats.mean_interest) ** 2).sum())
+
+        # Balance sketch, counting repaid years as a zero balance
+        balances = np.nan_to_num(chunk['trajectory'])
+        bins = np.where(balances > 0, np.searchsorted(BALANCE_BIN_EDGES, balances).clip(1, len(BALANCE_BIN_EDGES) - 1),
+                        0)
+        flat_bins = bins + np.arange(self.loan_term_years) * len(BALANCE_BIN_EDGES)
+        chunk_stats.balance_histogram = np.bincount(flat_bins.ravel(), minlength=self.balance_histogram.size) \
+            .reshape(self.balance_histogram.shape)
+
+        # Repayment year, from the engine's survival counts: paths repaid in a year are those that stopped owing
+        chunk_stats.survival = np.asarray(survival, dtype=np.int64)
+        chunk_stats.payoff_histogram = np.concatenate([[paths - survival[0]], -np.diff(chunk_stats.survival)])
+        chunk_stats.never_repaid = int(survival[-1])
+
+        # Extreme paths and the reservoir
+        chunk_stats.lowest, chunk_stats.highest = self._extremes(chunk)
+        keys = rng.random(paths)
+        keep = np.argsort(keys)[:self.reservoir_size]
+        chunk_stats.reservoir = {name: values[keep] for name, values in chunk.items()}
+        chunk_stats._reservoir_keys = keys[keep]
+
+        # Life events
+        chunk_stats.event_counts = np.bincount(event_log['code'], minlength=len(LIFE_EVENT_NAMES))
+        chunk_stats.event_impact_sums = np.bincount(event_log['code'], weights=event_log['balance_impact'],
+                                                    minlength=len(LIFE_EVENT_NAMES))
+        event_keys = rng.random(len(event_log))
+        keep = np.argsort(event_keys)[:self.event_sample_size]
+        chunk_stats.event_sample = event_log[keep]
+        chunk_stats.event_sample['sim'] += first_sim
+        chunk_stats.event_sample['salary_index'] = salary_index
+        chunk_stats._event_keys = event_keys[keep]
+
+        self.merge(chunk_stats)
+
+    def _extremes(self, paths):
+        # Order by final balance, then simulation number, matching a stable sort over all paths
+        order = np.lexsort((paths['sim'], paths['final_balance']))
+        lowest = order[:self.extremes]
+        highest = order[max(len(order) - self.extremes, 0):]
+        return ({name: values[lowest] for name, values in paths.items()},
+                {name: values[highest] for name, values in paths.items()})
+
+    def merge(self, other):
+        """
+        Fold another summary of different paths into this one.
+        """
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean_interest - self.mean_interest
+        self.mean_interest += delta * other.count / total
+        self._interest_m2 += other._interest_m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+
+        self.balance_histogram += other.balance_histogram
+        self.payoff_histogram += other.payoff_histogram
+        self.never_repaid += other.never_repaid
+        self.survival += other.survival
+
+        candidates = {name: np.concatenate([self.lowest[name], self.highest[name], other.lowest[name],
+                                            other.highest[name]]) for name in self.lowest}
+        _, unique = np.unique(candidates['sim'], return_index=True)
+        self.lowest, self.highest = self._extremes({name: values[unique] for name, values in candidates.items()})
+
+        # Bottom-k sampling: the paths with the smallest random keys are a uniform sample of everything seen
+        keys = np.concatenate([self._reservoir_keys, other._reservoir_keys])
+        keep = np.argsort(keys)[:self.reservoir_size]
+        self.reservoir = {name: np.concatenate([self.reservoir[name], other.reservoir[name]])[keep]
+                          for name in self.reservoir}
+        self._reservoir_keys = keys[keep]
+
+        self.event_counts += other.event_counts
+        self.event_impact_sums += other.event_impact_sums
+        keys = np.concatenate([self._event_keys, other._event_keys])
+        keep = np.argsort(keys)[:self.event_sample_size]
+        self.event_sample = np.concatenate([self.event_sample, other.event_sample])[keep]
+        self._event_keys = keys[keep]
+        return self
+
+    @property
+    def interest_std(self):
+        return float(np.sqrt(self._interest_m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+    @property
+    def interest_std_error(self):
+        return self.interest_std / np.sqrt(self.count) if self.count else float('nan')
+
+    @property
+    def proportion_repaid(self):
+        return float(self.payoff_histogram.sum() / self.count) if self.count else float('nan')
+
+    @property
+    def average_years_to_repay(self):
+        """
+        Mean repayment year over the paths that were repaid, NaN if none were.
+        """
+        repaid = self.payoff_histogram.sum()
+        years = np.arange(self.loan_term_years + 1)
+        return float((self.payoff_histogram * years).sum() / repaid) if repaid else float('nan')
+
+    @property
+    def average_event_impact(self):
+        """
+        Mean interest added to the balance by each event type, indexed by event code; NaN for types never seen.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.event_impact_sums / self.event_counts
+
+    def balance_quantiles(self, quantiles):
+        """
+        Approximate balance quantiles for every year from the sketch, with repaid loans counted as zero.
+
+        Parameters:
+            quantiles (array-like): Quantiles between 0 and 1.
+
+        Returns:
+            balances (np.ndarray): Shape (len(quantiles), loan_term_years).
+        """
+        cumulative = np.cumsum(self.balance_histogram, axis=1)
+        targets = np.asarray(quantiles)[:, None] * cumulative[:, -1]
+        bins = np.array([np.searchsorted(year_cumulative, year_targets, side='left')
+                         for year_cumulative, year_targets in zip(cumulative, targets.T)]).T
+        bins = bins.clip(0, len(BALANCE_BIN_EDGES) - 1)
+
+        # Report the geometric middle of the log-spaced bin; bin 0 is a zero balance
+        lower = BALANCE_BIN_EDGES[np.maximum(bins - 1, 0)]
+        return np.where(bins == 0, 0.0, np.sqrt(lower * BALANCE_BIN_EDGES[bins]))
+
+    def annotated_paths(self):
+        """
+        The lowest final balance paths (fastest repayment), the median path and the highest final balance paths.
+
+        The median is exact while every path fits in the reservoir, and otherwise the median of the reservoir.
+
+        Returns:
+            paths (dict): Arrays as for the reservoir, lowest first.
+        """
+        order = np.lexsort((self.reservoir['sim'], self.reservoir['final_balance']))
+        median = order[len(order) // 2:len(order) // 2 + 1]
+        return {name: np.concatenate([self.lowest[name], self.reservoir[name][median], self.highest[name]])
+                for name in self.lowest}
@@ -0,0 +1,249 @@
+"""
+Precompute student loan outcomes over a lattice of parameters, so they can be looked up instead of simulated.
+
+    python surrogate.py surrogate_table/ --iterations 1000 --seed 0
+
+The build runs the student loan engine at every point of the lattice and writes the expected interest paid, quantiles
+of the year the loan is cleared and the write-off probability to a directory:
+
+    manifest.json   format version, lattice, outputs, iterations, seed and a build id
+    axes.npz        the lattice values of each parameter
+    values.npy      outcomes with shape (lattice shape..., outputs)
+
+SurrogateTable memory-maps values.npy and interpolates multilinearly between the lattice points around a query, so a
+lookup reads only those few cells from disk. Queries outside the lattice are answered by simulating them live.
+
+Every point is simulated on the same standard normal draws, scaled by its growth mean and standard deviation, so
+neighbouring points differ only through their parameters and the table interpolates smoothly.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from loan_utils import PAYOFF_QUANTILES, _loan_outcomes, _student_loan_paths, simulate_student_loan_outcomes
+from parallel_utils import imap_chunks
+
+SURROGATE_FORMAT_VERSION = 1
+
+# Lattice axes in table order. Each task simulates one (growth mean, growth std, term, balance) block of every
+# salary, threshold, repayment rate and interest rate, so the last four axes are the ones vectorised.
+SURROGATE_AXES = ('annual_growth_mean', 'annual_growth_std', 'loan_term_years', 'initial_balance', 'salary',
+                  'repayment_threshold', 'repayment_rate', 'interest_rate')
+SURROGATE_OUTPUTS = ('interest_paid', *(f"payoff_year_p{quantile * 100:.0f}" for quantile in PAYOFF_QUANTILES),
+                     'write_off_probability')
+
+# Covers the app's defaults, with 1,584,000 points. Salary and interest rate are the cheapest axes to refine, since
+# each block simulates all of them at once.
+DEFAULT_LATTICE = {
+    'annual_growth_mean': np.linspace(-0.02, 0.06, 5),
+    'annual_growth_std': np.linspace(0.0, 0.15, 4),
+    'loan_term_years': np.array([10, 20, 25, 30, 40]),
+    'initial_balance': np.linspace(0, 100000, 6),
+    'salary': np.linspace(10000, 150000, 15),
+    'repayment_threshold': np.linspace(15000, 30000, 4),
+    'repayment_rate': np.linspace(0.03, 0.12, 4),
+    'interest_rate': np.linspace(0.0, 0.1, 11),
+}
+
+
+def _surrogate_block(task):
+    """
+    Outcomes for one block of the lattice, shape (salary, threshold, repayment rate, interest rate, outputs); runs on
+    the worker processes.
+    """
+    growth_mean, growth_std, loan_term_years, initial_balance, axes, iterations, seed = task
+    standard_normals = np.random.default_rng(seed).standard_normal((iterations, loan_term_years))
+    salary, threshold, repayment_rate, interest_rate = np.meshgrid(*axes, indexing='ij', sparse=True)
+    interest_paid, payoff_years = _student_loan_paths(
+        initial_balance, interest_rate[..., None], threshold[..., None], repayment_rate[..., None], salary[..., None],
+        growth_mean + growth_std * standard_normals, return_payoff_years=True)
+    outcomes = _loan_outcomes(interest_paid, payoff_years, loan_term_years)
+    return np.concatenate([outcomes['interest_paid'][..., None], outcomes['payoff_year_quantiles'],
+                           outcomes['write_off_probability'][..., None]], axis=-1)
+
+
+def build_surrogate(directory, lattice=None, iterations=1000, seed=0, max_workers=None, log=sys.stderr):
+    """
+    Simulate every point of the lattice and write the table to directory.
+
+    values.npy is filled through a memory map as blocks finish, so the build never holds the whole table in memory,
+    and the manifest is written last: a directory without one is an unfinished build and is not loaded.
+
+    Parameters:
+        directory (str): Directory to write the table to; created if needed, and any table in it is replaced.
+        lattice (dict): Sorted values of each parameter in SURROGATE_AXES; DEFAULT_LATTICE if None.
+        iterations (int): Monte Carlo paths per lattice point.
+        seed (int): Seed for the shared draws.
+        max_workers (int): Number of worker processes, default_workers() if None.
+        log (file): Where progress is reported, or None for silence.
+
+    Returns:
+        manifest (dict): The manifest written.
+    """
+    lattice = DEFAULT_LATTICE if lattice is None else lattice
+    axes = {name: np.asarray(lattice[name], dtype=float) for name in SURROGATE_AXES}
+    for name, values in axes.items():
+        if values.ndim != 1 or not len(values) or np.any(np.diff(values) <= 0):
+            raise ValueError(f"Lattice values for {name} must be a non-empty increasing sequence")
+    if np.any(axes['loan_term_years'] != np.round(axes['loan_term_years'])):
+        raise ValueError("Lattice values for loan_term_years must be whole years")
+    shape = tuple(len(values) for values in axes.values())
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    np.savez(os.path.join(directory, 'axes.npz'), **axes)
+    table = np.lib.format.open_memmap(os.path.join(directory, 'values.npy'), mode='w+', dtype=np.float64,
+                                      shape=shape + (len(SURROGATE_OUTPUTS),))
+
+    # One task per block of the first four axes; index order matches the table, so blocks are written in turn
+    blocks = list(np.ndindex(shape[:4]))
+    tasks = [(axes['annual_growth_mean'][i], axes['annual_growth_std'][j], int(axes['loan_term_years'][k]),
+              axes['initial_balance'][b], [axes[name] for name in SURROGATE_AXES[4:]], iterations, seed)
+             for i, j, k, b in blocks]
+    started = time.perf_counter()
+    for done, (block, result) in enumerate(zip(blocks, imap_chunks(_surrogate_block, tasks, max_workers)), 1):
+        table[block] = result
+        if log and (done % 50 == 0 or done == len(blocks)):
+            print(f"{done:,}/{len(blocks):,} blocks, {time.perf_counter() - started:,.1f}s", file=log, flush=True)
+    table.flush()
+    del table
+
+    settings = {'axes': {name: values.tolist() for name, values in axes.items()}, 'iterations': iterations,
+                'seed': seed}
+    manifest = {'format_version': SURROGATE_FORMAT_VERSION, 'outputs': list(SURROGATE_OUTPUTS),
+                'payoff_quantiles': list(PAYOFF_QUANTILES), 'shape': list(shape), **settings,
+                'build_id': hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16],
+                'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=1)
+    return manifest
+
+
+class SurrogateTable:
+    """
+    A table written by build_surrogate, memory-mapped read-only.
+
+    Parameters:
+        directory (str): The build directory.
+
+    Raises:
+        ValueError: If the directory holds no finished build, or one in a format this version cannot read.
+    """
+
+    def __init__(self, directory):
+        try:
+            with open(os.path.join(directory, 'manifest.json')) as file:
+                self.manifest = json.load(file)
+        except FileNotFoundError:
+            raise ValueError(f"{directory} holds no finished surrogate table") from None
+        if self.manifest['format_version'] != SURROGATE_FORMAT_VERSION:
+            raise ValueError(f"{directory} holds a version {self.manifest['format_version']} surrogate table; this "
+                             f"version reads version {SURROGATE_FORMAT_VERSION}")
+        with np.load(os.path.join(directory, 'axes.npz')) as axes:
+            self.axes = [axes[name] for name in SURROGATE_AXES]
+        values = np.load(os.path.join(directory, 'values.npy'), mmap_mode='r')
+        self._values = values.reshape(-1, values.shape[-1])
+
+        # Offsets of the 2^d corners of a lattice cell in the flattened table, over the axes with more than one value
+        self._varying = [axis for axis, values in enumerate(self.axes) if len(values) > 1]
+        strides = np.array([int(np.prod(values.shape[axis + 1:-1])) for axis in range(len(self.axes))])
+        corners = np.indices((2,) * len(self._varying)).reshape(len(self._varying), -1).T
+        self._corners = corners.astype(bool)
+        self._corner_offsets = corners @ strides[self._varying]
+        self._strides = strides
+
+    def contains(self, **parameters):
+        return all(values[0] <= parameters[name] <= values[-1] for name, values in zip(SURROGATE_AXES, self.axes))
+
+    def interpolate(self, **parameters):
+        """
+        Outcomes at a point, interpolated multilinearly between the lattice points around it.
+
+        Parameters:
+            **parameters: A value for each name in SURROGATE_AXES.
+
+        Returns:
+            outcomes (dict): Keyed as simulate_student_loan_outcomes, or None if the point is outside the lattice.
+        """
+        if not self.contains(**parameters):
+            return None
+        base, weights = 0, np.ones(len(self._corner_offsets))
+        for axis, (name, values) in enumerate(zip(SURROGATE_AXES, self.axes)):
+            if len(values) == 1:
+                continue
+            lower = min(int(np.searchsorted(values, parameters[name], side='right')) - 1, len(values) - 2)
+            fraction = (parameters[name] - values[lower]) / (values[lower + 1] - values[lower])
+            base += lower * self._strides[axis]
+            weights *= np.where(self._corners[:, self._varying.index(axis)], fraction, 1 - fraction)
+        result = weights @ self._values[base + self._corner_offsets]
+        return {'interest_paid': float(result[0]), 'payoff_year_quantiles': result[1:-1],
+                'write_off_probability': float(result[-1])}
+
+
+def student_loan_outcomes(table, initial_balance, interest_rate, repayment_threshold, repayment_rate,
+                          loan_term_years, salary, annual_growth_mean, annual_growth_std, iterations, rng=None):
+    """
+    Look the outcomes up in the table, simulating them with simulate_student_loan_outcomes if the point is outside
+    it or there is no table.
+
+    Parameters:
+        table (SurrogateTable): Table to answer from, or None to always simulate.
+        initial_balance ... rng: As for simulate_student_loan_outcomes; iterations and rng are only used to simulate.
+
+    Returns:
+        outcomes (dict): As for simulate_student_loan_outcomes.
+        from_table (bool): Whether the table answered.
+    """
+    parameters = dict(initial_balance=initial_balance, interest_rate=interest_rate,
+                      repayment_threshold=repayment_threshold, repayment_rate=repayment_rate,
+                      loan_term_years=loan_term_years, salary=salary, annual_growth_mean=annual_growth_mean,
+                      annual_growth_std=annual_growth_std)
+    outcomes = table.interpolate(**parameters) if table is not None else None
+    if outcomes is not None:
+        return outcomes, True
+    return simulate_student_loan_outcomes(**parameters, iterations=iterations, rng=rng), False
+
+
+def _axis(text):
+    """
+    Parse a lattice axis given on the command line as NAME=START:STOP:COUNT or NAME=V1,V2,...
+    """
+    name, _, values = text.partition('=')
+    if name not in SURROGATE_AXES:
+        raise argparse.ArgumentTypeError(f"unknown axis {name!r}; choose from {', '.join(SURROGATE_AXES)}")
+    try:
+        if ':' in values:
+            start, stop, count = values.split(':')
+            return name, np.linspace(float(start), float(stop), int(count))
+        return name, np.array([float(value) for value in values.split(',')])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"cannot read {values!r} as START:STOP:COUNT or a list of values") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute student loan outcomes over a lattice of parameters.")
+    parser.add_argument('directory', help="directory to write the table to")
+    parser.add_argument('--iterations', type=int, default=1000, help="Monte Carlo paths per lattice point")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the shared draws")
+    parser.add_argument('--axis', type=_axis, action='append', default=[], metavar='NAME=START:STOP:COUNT',
+                        help="replace one axis of the default lattice; may be repeated")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: LOANCARLO_WORKERS or "
+                                                                  "every core)")
+    args = parser.parse_args(argv)
+    try:
+        manifest = build_surrogate(args.directory, dict(DEFAULT_LATTICE, **dict(args.axis)), args.iterations,
+                                   args.seed, args.workers)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"Wrote {int(np.prod(manifest['shape'])):,} points to {args.directory} (build {manifest['build_id']})")
+
+
+if __name__ == '__main__':
+    main()